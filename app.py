@@ -5,17 +5,42 @@ import pwd
 import zipfile
 import json
 import shutil
+import threading
+import time
+import atexit
+from collections import namedtuple
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, send_file, jsonify
+
+import audio_backends
+import audio_engine
+import bell_synth
+import conflicts
+import db as database
+import jobs
+import loudness
+import pcm
+import previews
+import recurrence
+import scheduler
+import sequences
+import snapshots
+import sound_library
+import sync_cron as cron_sync
+import timeline
+import tts
+import volume
 
 APP_DIR = Path(__file__).resolve().parent
-DB_PATH = APP_DIR / "bells.db"
+DB_PATH = database.DB_PATH
 SOUNDS_DIR = APP_DIR / "sounds"
 BACKUP_DIR = APP_DIR / "backups"
 
 DEFAULT_USERNAME = os.getenv("CHURCHBELL_ADMIN_USER", "admin")
 DEFAULT_PASSWORD = os.getenv("CHURCHBELL_ADMIN_PASS", "changeme")  # stored as plain text for now, appliance-style
+SYNC_DEBOUNCE = float(os.getenv("CHURCHBELL_SYNC_DEBOUNCE", "0.5"))  # seconds of quiet before a schedule sync
+SYNC_MAX_DELAY = 5.0  # never hold back a sync longer than this during a steady stream of edits
 
 app = Flask(__name__)
 app.secret_key = "change-this-secret-key"  # replace in production
@@ -34,40 +59,135 @@ def inject_permissions():
 
 # ---------- CRON SYNC HELPER ----------
 
-def sync_cron():
-    """Rebuild system crontab from DB alarms."""
-    try:
-        subprocess.run(
-            [str(APP_DIR / "sync_cron.py")],
-            check=False,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except Exception:
-        pass
+class ScheduleSyncWorker:
+    """Background thread that merges bursts of alarm edits into one schedule sync.
+
+    A sync runs once no new request has arrived for `debounce` seconds, or
+    `max_delay` seconds after the first request of a burst, whichever is first.
+    """
+
+    def __init__(self, debounce=SYNC_DEBOUNCE, max_delay=SYNC_MAX_DELAY):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._thread = None
+        self._dirty = False
+        self._alarm_ids = set()
+        self._reload_all = False
+        self._first_request = 0.0
+        self._last_request = 0.0
+        self._status = {
+            "pending": False,
+            "last_sync": None,
+            "duration_ms": None,
+            "ok": None,
+            "error": None,
+            "requests": 0,
+            "syncs": 0,
+        }
+
+    def request(self, alarm_ids=None):
+        """Schedule a sync; returns immediately."""
+        with self._cond:
+            now = time.monotonic()
+            if not self._dirty:
+                self._first_request = now
+            self._dirty = True
+            self._last_request = now
+            if alarm_ids is None:
+                self._reload_all = True
+            else:
+                self._alarm_ids.update(alarm_ids)
+            self._status["pending"] = True
+            self._status["requests"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="schedule-sync", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take(self):
+        ids = None if self._reload_all else sorted(self._alarm_ids)
+        self._dirty = False
+        self._reload_all = False
+        self._alarm_ids = set()
+        return ids
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                while True:
+                    deadline = min(self._last_request + self.debounce,
+                                   self._first_request + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                ids = self._take()
+            self._sync(ids)
+
+    def _sync(self, alarm_ids):
+        start = time.monotonic()
+        error = None
+        try:
+            scheduler.notify(alarm_ids)
+            cron_sync.sync()
+        except Exception as e:
+            error = str(e)
+            print(f"[ERROR] Schedule sync failed: {error}", flush=True)
+        with self._cond:
+            self._status.update(
+                pending=self._dirty,
+                last_sync=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                duration_ms=round((time.monotonic() - start) * 1000, 1),
+                ok=error is None,
+                error=error,
+                syncs=self._status["syncs"] + 1,
+            )
+
+    def flush(self):
+        """Run any pending sync now (used at shutdown)."""
+        with self._cond:
+            if not self._dirty:
+                return
+            ids = self._take()
+        self._sync(ids)
+
+    def status(self):
+        with self._cond:
+            return dict(self._status)
+
+
+schedule_sync = ScheduleSyncWorker()
+atexit.register(schedule_sync.flush)
+
+# Upcoming bells for the dashboard; every alarm change goes through sync_cron()
+bell_timeline = timeline.Timeline(db_path=DB_PATH)
+
+
+def sync_cron(alarm_ids=None):
+    """Queue a crontab/scheduler sync for the given alarm IDs (None means all)."""
+    bell_timeline.invalidate()
+    schedule_sync.request(alarm_ids)
 
 
 # ---------- DB helpers ----------
 
 def get_db():
+    """Pooled connection for the current request (see db.py)."""
     if "db" not in g:
-        g.db = sqlite3.connect(
-            DB_PATH,
-            timeout=5,
-            check_same_thread=False
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = database.pool(DB_PATH).acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exc):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        database.pool(DB_PATH).release(db)
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH, timeout=5, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    conn = database.connect(DB_PATH)
     cur = conn.cursor()
 
     # users table
@@ -96,7 +216,7 @@ def init_db():
     # 'bells' - access to bell scheduler/alarms
     # 'backup' - access to backup and restore
     # 'users' - access to user management
-    # 'tts' - access to text-to-speech (future)
+    # 'tts' - create text-to-speech messages (tts.py)
     # 'announcements' - access to live announcements (future)
 
     # alarms table
@@ -110,6 +230,75 @@ def init_db():
             last_run_date TEXT
         )
     """)
+    # recurrence rules (see recurrence.py); existing alarms stay weekly
+    database.add_columns(conn, "alarms", {
+        "recurrence": "TEXT NOT NULL DEFAULT 'weekly'",
+        "month_week": "INTEGER",
+        "start_date": "TEXT",
+        "end_date": "TEXT",
+        "exceptions": "TEXT",
+    })
+
+    # sounds table - index of sounds/ kept current by sound_library.Watcher
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sounds (
+            name TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT,
+            rate INTEGER,
+            channels INTEGER,
+            width INTEGER,
+            frames INTEGER,
+            data_offset INTEGER,
+            data_size INTEGER,
+            duration REAL,
+            error TEXT
+        )
+    """)
+    database.add_columns(conn, "sounds", {
+        "source_sha256": "TEXT",
+        "source_format": "TEXT",
+        "normalized": "INTEGER NOT NULL DEFAULT 0",
+        # loudness analysis, valid while analyzed_sha256 = sha256
+        "peak_db": "REAL",
+        "rms_db": "REAL",
+        "gain_db": "REAL",
+        "lead_s": "REAL",
+        "trail_s": "REAL",
+        "analyzed_sha256": "TEXT",
+    })
+
+    # sequences table - tolls and peals pre-rendered to sounds/<output>
+    # steps is a JSON list of {"sound", "repeat", "gap"}
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sequences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            steps TEXT NOT NULL,
+            output TEXT UNIQUE NOT NULL,
+            fingerprint TEXT,
+            duration REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # tts_messages table - spoken messages saved to sounds/<output>
+    # cache_key identifies the render the output was copied from
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tts_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            text TEXT NOT NULL,
+            voice TEXT NOT NULL,
+            rate INTEGER NOT NULL,
+            engine TEXT NOT NULL,
+            output TEXT UNIQUE NOT NULL,
+            cache_key TEXT,
+            duration REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
 
     # settings table
     cur.execute("""
@@ -119,6 +308,8 @@ def init_db():
         )
     """)
 
+    database.ensure_indexes(conn)
+
     # default admin user
     cur.execute("SELECT COUNT(*) AS c FROM users")
     if cur.fetchone()["c"] == 0:
@@ -150,11 +341,96 @@ def login_required(view):
         return view(*args, **kwargs)
     return wrapped
 
+# Available permissions, in display order
+ALL_PERMISSIONS = ["bells", "backup", "users", "tts", "announcements"]
+
+USERS_PER_PAGE = 50
+
+Principal = namedtuple("Principal", "role permissions")
+
+def query_users(search="", user_ids=None, limit=-1, offset=0):
+    """Users with their permissions, fetched with one joined and aggregated query.
+    Filters on a username substring and/or a list of ids. Returns (users, total)
+    where total counts every match, not just the page. Each row also seeds the
+    per-request principal cache."""
+    where, params = [], []
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("u.username LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if user_ids is not None:
+        where.append(f"u.id IN ({','.join('?' * len(user_ids))})")
+        params.extend(user_ids)
+    rows = get_db().execute(
+        f"""
+        SELECT u.id, u.username, u.role,
+               GROUP_CONCAT(p.permission) AS permissions,
+               COUNT(*) OVER () AS total
+        FROM users u
+        LEFT JOIN user_permissions p ON p.user_id = u.id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY u.id
+        ORDER BY u.id
+        LIMIT ? OFFSET ?
+        """,
+        (*params, limit, offset)
+    ).fetchall()
+    if rows:
+        total = rows[0]["total"]
+    elif offset:
+        # Past the last page: the window count has no row to ride on
+        total = get_db().execute(
+            f"SELECT COUNT(*) FROM users u {'WHERE ' + ' AND '.join(where) if where else ''}",
+            params
+        ).fetchone()[0]
+    else:
+        total = 0
+
+    principals = g.setdefault("principals", {})
+    users_list = []
+    for row in rows:
+        if row["role"] == "admin":
+            # Admins have all permissions
+            perms = frozenset(ALL_PERMISSIONS)
+        else:
+            perms = frozenset(row["permissions"].split(",") if row["permissions"] else [])
+        principals[row["id"]] = Principal(row["role"], perms)
+        users_list.append({
+            "id": row["id"],
+            "username": row["username"],
+            "role": row["role"],
+            "permissions": [p for p in ALL_PERMISSIONS if p in perms],
+        })
+    return users_list, total
+
+def load_principal(user_id):
+    """Role and permission set for a user, cached on g for the rest of the request."""
+    principals = g.setdefault("principals", {})
+    if user_id not in principals:
+        users_list, _ = query_users(user_ids=[user_id])
+        if not users_list:
+            principals[user_id] = None
+    return principals[user_id]
+
+def set_user_permissions(db, user_id, permissions):
+    """Replace a user's permissions in one batch. Unknown names are ignored.
+    The caller commits."""
+    wanted = [p for p in ALL_PERMISSIONS if p in permissions]
+    db.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
+    db.executemany(
+        "INSERT INTO user_permissions (user_id, permission) VALUES (?, ?)",
+        [(user_id, perm) for perm in wanted]
+    )
+    invalidate_principal(user_id)
+
+def invalidate_principal(user_id):
+    """Drop a cached principal after its role or permissions change."""
+    g.get("principals", {}).pop(user_id, None)
+
 def get_user_role(user_id):
     """Get the role of a user"""
-    db = get_db()
-    user = db.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
-    return user["role"] if user else None
+    principal = load_principal(user_id)
+    return principal.role if principal else None
 
 def is_admin(user_id):
     """Check if user is an admin"""
@@ -162,38 +438,25 @@ def is_admin(user_id):
 
 def has_permission(user_id, permission):
     """Check if user has a specific permission. Admins have all permissions."""
-    if is_admin(user_id):
-        return True
-    
-    db = get_db()
-    perm = db.execute(
-        "SELECT 1 FROM user_permissions WHERE user_id = ? AND permission = ?",
-        (user_id, permission)
-    ).fetchone()
-    return perm is not None
+    principal = load_principal(user_id)
+    return principal is not None and permission in principal.permissions
 
 def get_user_permissions(user_id):
     """Get all permissions for a user. Returns list of permission strings."""
-    if is_admin(user_id):
-        # Admins have all permissions
-        return ["bells", "backup", "users", "tts", "announcements"]
-    
-    db = get_db()
-    perms = db.execute(
-        "SELECT permission FROM user_permissions WHERE user_id = ?",
-        (user_id,)
-    ).fetchall()
-    return [p["permission"] for p in perms]
+    principal = load_principal(user_id)
+    if principal is None:
+        return []
+    return [p for p in ALL_PERMISSIONS if p in principal.permissions]
 
-def permission_required(permission):
-    """Decorator to require a specific permission"""
+def permission_required(*permissions):
+    """Decorator to require a specific permission (or any one of several)"""
     from functools import wraps
     def decorator(view):
         @wraps(view)
         def wrapped(*args, **kwargs):
             if "user_id" not in session:
                 return redirect(url_for("login"))
-            if not has_permission(session["user_id"], permission):
+            if not any(has_permission(session["user_id"], p) for p in permissions):
                 flash("You do not have permission to access this page.", "error")
                 return redirect(url_for("dashboard"))
             return view(*args, **kwargs)
@@ -317,16 +580,46 @@ def root():
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    db = get_db()
-    alarm_count = db.execute("SELECT COUNT(*) as c FROM alarms").fetchone()["c"]
-    enabled_count = db.execute("SELECT COUNT(*) as c FROM alarms WHERE enabled = 1").fetchone()["c"]
+    now = time.time()
+    snap = bell_timeline.snapshot(now)
     
     return render_template(
         "dashboard.html",
-        alarm_count=alarm_count,
-        enabled_count=enabled_count,
+        alarm_count=snap.alarm_count,
+        enabled_count=snap.enabled_count,
+        next_bell=bell_timeline.next_bell(now),
+        today_bells=bell_timeline.today(now),
     )
 
+def timeline_response(payload):
+    """JSON that phones polling the dashboard can revalidate with If-None-Match"""
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route("/api/next_bell")
+@login_required
+def api_next_bell():
+    """The next bell and the rest of today's, from the cached timeline"""
+    now = time.time()
+    return timeline_response({
+        "next": bell_timeline.next_bell(now),
+        "today": bell_timeline.today(now),
+    })
+
+@app.route("/api/timeline")
+@login_required
+def api_timeline():
+    """Upcoming bells for the next `hours` (up to the cached 7 days)"""
+    now = time.time()
+    hours = max(0.0, min(request.args.get("hours", 24.0, type=float), timeline.HORIZON_DAYS * 24.0))
+    snap = bell_timeline.snapshot(now)
+    return timeline_response({
+        "generated_at": datetime.fromtimestamp(snap.built_at).isoformat(timespec="seconds"),
+        "bells": snap.between(now, now + hours * 3600),
+    })
+
 
 # ---------- user management ----------
 
@@ -334,29 +627,22 @@ def dashboard():
 @login_required
 @permission_required("users")
 def users():
-    db = get_db()
-    users_list = db.execute(
-        "SELECT id, username, role FROM users ORDER BY id"
-    ).fetchall()
-    
-    # Get permissions for each user
-    users_with_perms = []
-    for user in users_list:
-        perms = get_user_permissions(user["id"])
-        users_with_perms.append({
-            "id": user["id"],
-            "username": user["username"],
-            "role": user["role"],
-            "permissions": perms
-        })
-    
-    # Available permissions list
-    available_permissions = ["bells", "backup", "users", "tts", "announcements"]
-    
+    search = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    users_list, total = query_users(search, limit=USERS_PER_PAGE, offset=(page - 1) * USERS_PER_PAGE)
+    pages = max((total + USERS_PER_PAGE - 1) // USERS_PER_PAGE, 1)
+    if page > pages:
+        return redirect(url_for("users", q=search or None, page=pages))
+
     return render_template(
         "users.html",
-        users=users_with_perms,
-        available_permissions=available_permissions
+        users=users_list,
+        available_permissions=ALL_PERMISSIONS,
+        search=search,
+        page=page,
+        pages=pages,
+        total=total
     )
 
 @app.route("/add_user", methods=["POST"])
@@ -387,13 +673,7 @@ def add_user():
         
         # Add permissions if not admin
         if role != "admin":
-            permissions = request.form.getlist("permissions")
-            for perm in permissions:
-                if perm in ["bells", "backup", "users", "tts", "announcements"]:
-                    db.execute(
-                        "INSERT INTO user_permissions (user_id, permission) VALUES (?, ?)",
-                        (user_id, perm)
-                    )
+            set_user_permissions(db, user_id, request.form.getlist("permissions"))
         
         db.commit()
         flash(f"User '{username}' added successfully.", "success")
@@ -421,6 +701,7 @@ def delete_user(user_id):
         
         db.execute("DELETE FROM users WHERE id = ?", (user_id,))
         db.commit()
+        invalidate_principal(user_id)
         flash(f"User '{user['username']}' deleted.", "success")
     
     return redirect(url_for("users"))
@@ -430,32 +711,19 @@ def delete_user(user_id):
 @permission_required("users")
 def update_user_permissions(user_id):
     """Update permissions for a user"""
-    db = get_db()
-    user = db.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
+    principal = load_principal(user_id)
     
-    if not user:
+    if not principal:
         flash("User not found.", "error")
         return redirect(url_for("users"))
     
     # Can't change admin permissions
-    if user["role"] == "admin":
+    if principal.role == "admin":
         flash("Admin users have all permissions and cannot be modified.", "error")
         return redirect(url_for("users"))
     
-    # Get selected permissions
-    permissions = request.form.getlist("permissions")
-    
-    # Remove all existing permissions
-    db.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
-    
-    # Add new permissions
-    for perm in permissions:
-        if perm in ["bells", "backup", "users", "tts", "announcements"]:
-            db.execute(
-                "INSERT INTO user_permissions (user_id, permission) VALUES (?, ?)",
-                (user_id, perm)
-            )
-    
+    db = get_db()
+    set_user_permissions(db, user_id, request.form.getlist("permissions"))
     db.commit()
     flash("User permissions updated successfully.", "success")
     return redirect(url_for("users"))
@@ -479,14 +747,20 @@ def update_user_role(user_id):
         flash("You cannot change your own role.", "error")
         return redirect(url_for("users"))
     
+    principal = load_principal(user_id)
+    if not principal:
+        flash("User not found.", "error")
+        return redirect(url_for("users"))
+    
     db = get_db()
     db.execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
     
     # If changing to admin, remove all permissions (admins don't need them)
     if new_role == "admin":
-        db.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
+        set_user_permissions(db, user_id, [])
     
     db.commit()
+    invalidate_principal(user_id)
     flash("User role updated successfully.", "success")
     return redirect(url_for("users"))
 
@@ -500,7 +774,7 @@ def alarms():
     db = get_db()
     alarms = db.execute(
         """
-        SELECT id, day_of_week, time_str, sound_path, enabled
+        SELECT *
         FROM alarms
         ORDER BY day_of_week ASC, time_str ASC
         """
@@ -509,36 +783,98 @@ def alarms():
     settings = db.execute(
         "SELECT volume FROM settings WHERE id = 1"
     ).fetchone()
-    volume = settings["volume"] if settings else 70
+    volume = volume_control.current(settings["volume"] if settings else 70)
 
-    sound_files = []
-    if SOUNDS_DIR.exists():
-        try:
-            sound_files = sorted([
-                f for f in os.listdir(SOUNDS_DIR)
-                if f.lower().endswith(".wav")
-            ])
-        except Exception:
-            sound_files = []
+    sound_files = sound_library.list_sounds(db)
+
+    sequence_rows = db.execute(
+        "SELECT id, name, steps, output, fingerprint, duration FROM sequences ORDER BY name"
+    ).fetchall()
+    edit_sequence = None
+    if request.args.get("edit_sequence"):
+        edit_sequence = next((s for s in sequence_rows
+                              if str(s["id"]) == request.args["edit_sequence"]), None)
 
     # Get edit parameters from URL (if editing)
     edit_day = request.args.get("edit_day")
     edit_time = request.args.get("edit_time")
     edit_sound = request.args.get("edit_sound")
     edit_enabled = request.args.get("edit_enabled")
+    edit_rule = {k: request.args.get(f"edit_{k}") or None for k in RULE_FORM_FIELDS}
 
     return render_template(
         "alarms.html",
-        alarms=alarms,
+        alarms=[dict(a, schedule=recurrence.describe(a)) for a in alarms],
+        conflicts=[conflicts.describe(pair) for pair in bell_timeline.snapshot().index.overlaps()],
         volume=volume,
         sounds=sound_files,
         edit_day=edit_day if edit_day else None,
         edit_time=edit_time if edit_time else None,
         edit_sound=edit_sound if edit_sound else None,
         edit_enabled=edit_enabled if edit_enabled else None,
+        edit_rule=edit_rule,
+        month_weeks=recurrence.ORDINALS,
+        sync_status=schedule_sync.status(),
+        bell_models=sorted(bell_synth.MODELS),
+        sequences=[dict(s, steps=json.loads(s["steps"])) for s in sequence_rows],
+        edit_sequence=dict(edit_sequence, steps=sequences.format_steps(json.loads(edit_sequence["steps"])))
+                      if edit_sequence else None,
     )
 
 
+@app.route("/api/conflicts")
+@login_required
+@permission_required("bells")
+def conflict_report():
+    """Every pair of overlapping bells in the next 7 days"""
+    snap = bell_timeline.snapshot()
+    return jsonify([
+        {"first": a._asdict(), "second": b._asdict(), "overlap": min(a.end, b.end) - b.start,
+         "text": conflicts.describe((a, b))}
+        for a, b in snap.index.overlaps()
+    ])
+
+
+@app.route("/sync_status")
+@login_required
+@permission_required("bells")
+def sync_status():
+    """Last schedule sync result, polled by the alarms page."""
+    return jsonify(schedule_sync.status())
+
+
+RULE_FORM_FIELDS = ("recurrence", "month_week", "start_date", "end_date", "exceptions")
+
+def warn_conflicts(alarm_id):
+    """Flash a warning if a saved alarm overlaps other bells in the next 7 days
+    (or, for a monthly or one-time alarm further out, at its next bell)"""
+    try:
+        db = get_db()
+        rules = recurrence.load_rules(db, [alarm_id])
+        if not rules:
+            return
+        now = time.time()
+        snap = bell_timeline.snapshot(now)
+        found = conflicts.check_rule(db, rules[0], snap.index, max(now, snap.built_at), snap.until)
+    except Exception as e:
+        print(f"[WARN] Conflict check for alarm {alarm_id} failed: {e}", flush=True)
+        return
+    if not found:
+        return
+    own, hits = found[0]
+    other = hits[-1]
+    pair = (own, other) if own.start <= other.start else (other, own)
+    others = sorted({h.alarm_id for _, hits in found for h in hits})
+    flash(f"Alarm saved, but it overlaps alarm{'s' if len(others) > 1 else ''} "
+          f"{', '.join(map(str, others))} ({len(found)} time{'s' if len(found) > 1 else ''}), "
+          f"e.g. {conflicts.describe(pair)}.", "warning")
+
+def rule_from_form(form, day):
+    """Validated recurrence columns from the alarm form (raises ValueError)"""
+    fields = {k: form.get(k, "").strip() for k in RULE_FORM_FIELDS}
+    fields["day_of_week"] = day
+    return recurrence.normalize(fields)
+
 @app.route("/add_alarm", methods=["POST"])
 @login_required
 @permission_required("bells")
@@ -547,15 +883,25 @@ def add_alarm():
     time_str = request.form.get("time_str", "").strip()
     sound = request.form.get("sound_path", "sounds/chime.wav").strip()
     enabled = 1 if request.form.get("enabled") == "on" else 0
+    try:
+        rule = rule_from_form(request.form, day)
+    except ValueError as e:
+        flash(f"Alarm not saved: {e}", "error")
+        # Keep what was typed in the form (an edited alarm has already been removed)
+        return redirect(url_for("alarms", edit_day=day, edit_time=time_str, edit_sound=sound,
+                                edit_enabled=enabled,
+                                **{f"edit_{k}": request.form.get(k) for k in RULE_FORM_FIELDS}))
 
     db = get_db()
-    db.execute(
-        "INSERT INTO alarms (day_of_week, time_str, sound_path, enabled) VALUES (?, ?, ?, ?)",
-        (day, time_str, sound, enabled),
+    cur = db.execute(
+        f"INSERT INTO alarms (time_str, sound_path, enabled, {', '.join(rule)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' * len(rule))})",
+        (time_str, sound, enabled, *rule.values()),
     )
     db.commit()
 
-    sync_cron()
+    warn_conflicts(cur.lastrowid)
+    sync_cron([cur.lastrowid])
     return redirect(url_for("alarms"))
 
 
@@ -577,7 +923,7 @@ def toggle_alarm(alarm_id):
         )
         db.commit()
 
-    sync_cron()
+    sync_cron([alarm_id])
     return redirect(url_for("alarms"))
 
 
@@ -589,7 +935,7 @@ def delete_alarm(alarm_id):
     db.execute("DELETE FROM alarms WHERE id = ?", (alarm_id,))
     db.commit()
 
-    sync_cron()
+    sync_cron([alarm_id])
     return redirect(url_for("alarms"))
 
 @app.route("/edit_alarm/<int:alarm_id>")
@@ -599,7 +945,7 @@ def edit_alarm(alarm_id):
     """Delete alarm and redirect to form with pre-filled values"""
     db = get_db()
     alarm = db.execute(
-        "SELECT day_of_week, time_str, sound_path, enabled FROM alarms WHERE id = ?",
+        "SELECT * FROM alarms WHERE id = ?",
         (alarm_id,)
     ).fetchone()
     
@@ -607,14 +953,15 @@ def edit_alarm(alarm_id):
         # Delete the alarm
         db.execute("DELETE FROM alarms WHERE id = ?", (alarm_id,))
         db.commit()
-        sync_cron()
+        sync_cron([alarm_id])
         
         # Redirect with form data as URL parameters
         return redirect(url_for("alarms", 
             edit_day=alarm["day_of_week"],
             edit_time=alarm["time_str"],
             edit_sound=alarm["sound_path"],
-            edit_enabled=alarm["enabled"]
+            edit_enabled=alarm["enabled"],
+            **{f"edit_{k}": alarm[k] for k in RULE_FORM_FIELDS if alarm[k] is not None}
         ))
     
     return redirect(url_for("alarms"))
@@ -630,149 +977,645 @@ def update_alarm(alarm_id):
     enabled = 1 if request.form.get("enabled") == "on" else 0
 
     db = get_db()
+    fields = {"day_of_week": day, "time_str": time_str, "sound_path": sound, "enabled": enabled}
+    if "recurrence" in request.form:
+        try:
+            fields.update(rule_from_form(request.form, day))
+        except ValueError as e:
+            flash(f"Alarm not saved: {e}", "error")
+            return redirect(url_for("alarms"))
     db.execute(
-        """
-        UPDATE alarms
-        SET day_of_week=?, time_str=?, sound_path=?, enabled=?
-        WHERE id=?
-        """,
-        (day, time_str, sound, enabled, alarm_id),
+        f"UPDATE alarms SET {', '.join(f'{k}=?' for k in fields)} WHERE id=?",
+        (*fields.values(), alarm_id),
     )
     db.commit()
 
-    sync_cron()
+    warn_conflicts(alarm_id)
+    sync_cron([alarm_id])
     return redirect(url_for("alarms"))
 
 
+# ---------- alarm batch API ----------
+
+ALARM_BATCH_LIMIT = 1000
+ALARM_OPS = ("create", "update", "delete", "toggle")
+ALARM_FIELDS = ("day_of_week", "time_str", "sound_path", "enabled") + RULE_FORM_FIELDS
+
+def parse_alarm_fields(op, required):
+    """Validate and normalize the alarm fields present in a batch operation"""
+    missing = [f for f in required if f not in op]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    fields = {}
+    if "day_of_week" in op:
+        day = op["day_of_week"]
+        if isinstance(day, bool) or not isinstance(day, int) or not 0 <= day <= 6:
+            raise ValueError("day_of_week must be an integer from 0 (Monday) to 6 (Sunday)")
+        fields["day_of_week"] = day
+    if "time_str" in op:
+        try:
+            hour, minute = (int(p) for p in str(op["time_str"]).split(":"))
+        except ValueError:
+            raise ValueError("time_str must be HH:MM")
+        if not (0 <= hour <= 23 and 0 <= minute <= 59):
+            raise ValueError("time_str must be HH:MM")
+        fields["time_str"] = f"{hour:02d}:{minute:02d}"
+    if "sound_path" in op:
+        sound = op["sound_path"]
+        if not isinstance(sound, str) or not sound:
+            raise ValueError("sound_path must be a file name in sounds/")
+        if not os.path.exists(cron_sync.resolve_sound_path(sound)):
+            raise ValueError(f"sound file not found: {sound}")
+        fields["sound_path"] = sound
+    if "enabled" in op:
+        fields["enabled"] = 1 if op["enabled"] else 0
+    # Checked together by recurrence.normalize() once the whole rule is known
+    for key in RULE_FORM_FIELDS:
+        if key in op:
+            fields[key] = op[key]
+    return fields
+
+def parse_alarm_batch(operations):
+    """Validate a whole batch before anything is written. Returns (ops, errors)."""
+    ops, errors = [], []
+    for index, op in enumerate(operations):
+        try:
+            if not isinstance(op, dict) or op.get("op") not in ALARM_OPS:
+                raise ValueError(f"op must be one of {', '.join(ALARM_OPS)}")
+            kind = op["op"]
+            alarm_id = None
+            if kind != "create":
+                alarm_id = op.get("id")
+                if isinstance(alarm_id, bool) or not isinstance(alarm_id, int):
+                    raise ValueError("id must be an integer")
+            if kind == "create":
+                fields = parse_alarm_fields(op, ("time_str", "sound_path"))
+                fields.setdefault("enabled", 1)
+                fields.update(recurrence.normalize(fields))
+            elif kind == "update":
+                fields = parse_alarm_fields(op, ())
+                if not fields:
+                    raise ValueError(f"update needs at least one of {', '.join(ALARM_FIELDS)}")
+            else:
+                fields = {}
+            ops.append((index, kind, alarm_id, fields))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    return ops, errors
+
+@app.route("/api/alarms/batch", methods=["POST"])
+@login_required
+@permission_required("bells")
+def alarms_batch():
+    """Apply a list of create/update/delete/toggle operations in one transaction with one schedule sync"""
+    data = request.get_json(silent=True)
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"ok": False, "error": "Expected a JSON list of operations"}), 400
+    if len(operations) > ALARM_BATCH_LIMIT:
+        return jsonify({"ok": False, "error": f"At most {ALARM_BATCH_LIMIT} operations per batch"}), 400
+    
+    ops, errors = parse_alarm_batch(operations)
+    db = get_db()
+    
+    # Every referenced alarm must exist, and must not be deleted earlier in the batch
+    ids = sorted({alarm_id for _, kind, alarm_id, _ in ops if kind != "create"})
+    existing = {}
+    if ids:
+        existing = {r["id"]: dict(r) for r in db.execute(
+            f"SELECT * FROM alarms WHERE id IN ({','.join('?' * len(ids))})", ids
+        )}
+    deleted = set()
+    for index, kind, alarm_id, fields in ops:
+        if kind == "create":
+            continue
+        if alarm_id not in existing:
+            errors.append({"index": index, "error": f"alarm {alarm_id} not found"})
+        elif alarm_id in deleted:
+            errors.append({"index": index, "error": f"alarm {alarm_id} is deleted earlier in this batch"})
+        elif kind == "update" and fields.keys() & {"day_of_week", *RULE_FORM_FIELDS}:
+            # A partial update must still leave a valid rule
+            merged = dict(existing[alarm_id], **fields)
+            try:
+                fields.update(recurrence.normalize(merged))
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+            existing[alarm_id] = dict(merged, **fields)
+        if kind == "delete":
+            deleted.add(alarm_id)
+    if errors:
+        return jsonify({"ok": False, "errors": sorted(errors, key=lambda e: e["index"])}), 400
+    
+    results = []
+    changed = set()
+    try:
+        for index, kind, alarm_id, fields in ops:
+            if kind == "create":
+                cur = db.execute(
+                    f"INSERT INTO alarms ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                    tuple(fields.values()),
+                )
+                alarm_id = cur.lastrowid
+            elif kind == "update":
+                db.execute(
+                    f"UPDATE alarms SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                    (*fields.values(), alarm_id),
+                )
+            elif kind == "delete":
+                db.execute("DELETE FROM alarms WHERE id = ?", (alarm_id,))
+            else:
+                db.execute("UPDATE alarms SET enabled = 1 - enabled WHERE id = ?", (alarm_id,))
+            changed.add(alarm_id)
+            results.append({"index": index, "op": kind, "id": alarm_id})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Alarm batch failed: {e}", flush=True)
+        return jsonify({"ok": False, "error": f"Batch not applied: {e}"}), 500
+    
+    sync_cron(sorted(changed))
+    return jsonify({"ok": True, "results": results})
+
+
 # ---------- sound management ----------
 
 @app.route("/test_sound/<path:filename>")
 @login_required
 @permission_required("bells")
 def test_sound(filename):
-    sound_path = f"sounds/{filename}"
-    result = play_sound(sound_path)
-    # Return debug info if available
-    if result and isinstance(result, dict) and result.get("error"):
-        return result.get("message", "Error playing sound"), 500
-    return ("", 204)
+    sound = sound_library.get(get_db(), filename)
+    if sound is not None and sound["error"]:
+        return jsonify({"error": f"Not a playable WAV file: {sound['error']}"}), 400
+    # Starts playback and returns at once; the page polls /previews/<id>
+    try:
+        preview = preview_player.start(f"sounds/{filename}", sound["duration"] if sound is not None else None)
+    except previews.Busy as e:
+        return jsonify({"error": f"Not played: {e}", "busy": True}), 409
+    except Exception as e:
+        print(f"[ERROR] Preview of {filename} failed: {e}", flush=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify(preview.to_dict()), 202
 
 @app.route("/upload_sound", methods=["POST"])
 @login_required
 @permission_required("bells")
 def upload_sound():
+    """Stream an uploaded WAV into sounds/, then convert it to the sink format in the background"""
+    # Refuse oversized uploads before the body is read
+    if request.content_length and request.content_length > sound_library.MAX_UPLOAD_BYTES + 64 * 1024:
+        flash(f"File is larger than {sound_library.MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", "error")
+        return redirect(url_for("alarms"))
+    
     file = request.files.get("file")
-    if file and file.filename.lower().endswith(".wav"):
-        if not SOUNDS_DIR.exists():
-            SOUNDS_DIR.mkdir(parents=True, exist_ok=True)
-        dest = SOUNDS_DIR / file.filename
-        file.save(dest)
+    if not file or not file.filename.lower().endswith(".wav"):
+        flash("Please choose a WAV file.", "error")
+        return redirect(url_for("alarms"))
+    name = Path(file.filename).name
+    if name.startswith((".", sequences.OUTPUT_PREFIX, tts.OUTPUT_PREFIX)):
+        flash("Please rename the file before uploading it.", "error")
+        return redirect(url_for("alarms"))
+    
+    try:
+        sha256, _, fmt = sound_library.ingest(file.stream, name, SOUNDS_DIR)
+        index_sounds([name])
+        sound_library.record_source(get_db(), name, sha256, fmt)
+        if fmt != audio_engine.SINK_FORMAT:
+            job_manager.submit("normalize", run_normalize_job, name, sha256, fmt,
+                               description=f"Convert {name}")
+            flash(f"Uploaded {name} ({pcm.describe(fmt)}); converting to "
+                  f"{pcm.describe(audio_engine.SINK_FORMAT)} in the background.", "success")
+        else:
+            flash(f"Uploaded {name}.", "success")
+    except sound_library.UploadError as e:
+        flash(f"Upload rejected: {e}", "error")
+    except Exception as e:
+        flash(f"Error uploading sound: {str(e)}", "error")
+    return redirect(url_for("alarms"))
+
+def run_normalize_job(job, name, sha256, fmt):
+    """Convert an uploaded sound to the sink format once, so playback never resamples it"""
+    job.progress(message=f"Converting {name}")
+    if pcm.normalize_file(SOUNDS_DIR / name, audio_engine.SINK_FORMAT) is None:
+        job.message = f"{name} is already {pcm.describe(audio_engine.SINK_FORMAT)}"
+        return
+    index_sounds([name])
+    with database.connection(DB_PATH) as conn:
+        sound_library.record_source(conn, name, sha256, fmt, normalized=True)
+    job.message = f"Converted {name} to {pcm.describe(audio_engine.SINK_FORMAT)}"
+
+def run_synth_job(job, params, name):
+    """Render a synthesized bell into sounds/ (from the cache when it was rendered before)"""
+    job.progress(message=f"Rendering {name}")
+    bell_synth.save(params, SOUNDS_DIR / name)
+    index_sounds([name])
+    job.message = f"Created {name} ({bell_synth.total_duration(params):.1f}s)"
+
+@app.route("/generate_bell", methods=["POST"])
+@login_required
+@permission_required("bells")
+def generate_bell():
+    """Start rendering a synthesized bell into sounds/ in the background"""
+    name = Path(request.form.get("name", "").strip()).name
+    if not name:
+        flash("Please give the new sound a name.", "error")
+        return redirect(url_for("alarms"))
+    if not name.lower().endswith(".wav"):
+        name += ".wav"
+    
+    try:
+        duration = request.form.get("duration", "").strip()
+        params = bell_synth.BellParams(
+            model=request.form.get("model", "church"),
+            pitch=float(request.form.get("pitch", "440")),
+            decay=float(request.form.get("decay", "1.5")),
+            strikes=int(request.form.get("strikes", "1")),
+            interval=float(request.form.get("interval", "2.0")),
+            duration=float(duration) if duration else None,
+        )
+        bell_synth.validate(params)
+        job_manager.submit("synth", run_synth_job, params, name, description=f"Create {name}")
+        flash(f"Creating {name} ({bell_synth.total_duration(params):.1f}s) in the background; "
+              f"it will appear in the sound list when it is ready.", "success")
+    except ValueError as e:
+        flash(f"Invalid bell settings: {e}", "error")
+    except Exception as e:
+        flash(f"Error creating bell sound: {str(e)}", "error")
     return redirect(url_for("alarms"))
 
 @app.route("/delete_sound/<path:filename>")
 @login_required
 @permission_required("bells")
 def delete_sound(filename):
+    if filename.startswith(sequences.OUTPUT_PREFIX):
+        flash("This sound is rendered from a sequence; delete the sequence instead.", "error")
+        return redirect(url_for("alarms"))
+    if filename.startswith(tts.OUTPUT_PREFIX):
+        flash("This sound is a text-to-speech message; delete the message instead.", "error")
+        return redirect(url_for("alarms"))
     path = SOUNDS_DIR / filename
     if path.exists():
         path.unlink()
+    index_sounds([path.name])
     return redirect(url_for("alarms"))
 
 
-# ---------- volume ----------
+# ---------- sound library ----------
 
-@app.route("/set_volume", methods=["POST"])
+def index_sounds(names=None):
+    """Update the sound index (all of sounds/ when names is None), then re-render affected sequences in the background"""
+    try:
+        with database.connection(DB_PATH) as conn:
+            if names is None:
+                sound_library.sync(conn, SOUNDS_DIR)
+            else:
+                sound_library.update(conn, names, SOUNDS_DIR)
+    except Exception as e:
+        print(f"[ERROR] Sound index update failed: {e}", flush=True)
+    bell_timeline.invalidate()  # clip lengths
+    refresh_sequences()
+    analyze_sounds()
+
+def on_sounds_changed(changed, removed):
+    """Watcher callback for files changed outside the web UI (scp, restores)"""
+    bell_timeline.invalidate()
+    if any(not n.startswith(sequences.OUTPUT_PREFIX) for n in changed + removed):
+        refresh_sequences()
+    if any(n.startswith(tts.OUTPUT_PREFIX) for n in removed):
+        refresh_messages()  # put back from the render cache
+    if changed:
+        analyze_sounds()
+
+analysis_lock = threading.Lock()
+
+def analyze_sounds():
+    """Measure new or changed sounds in the background (see loudness.py)"""
+    # A job that has not started yet will pick up everything pending when it does
+    if any(j.state == jobs.QUEUED for j in job_manager.list(["analyze"], active_only=True)):
+        return
+    job_manager.submit("analyze", run_analyze_job, description="Analyze sound levels")
+
+def run_analyze_job(job):
+    with analysis_lock:
+        with database.connection(DB_PATH) as conn:
+            names = loudness.analyze_pending(conn, SOUNDS_DIR, job=job)
+    if names:
+        # Have the engine decode these again with their new gain and trim
+        audio_engine.request({"cmd": "reload", "paths": [str(SOUNDS_DIR / n) for n in names]})
+    job.message = f"Analyzed {len(names)} sound(s)"
+    return {"analyzed": names}
+
+sound_watcher = sound_library.Watcher(SOUNDS_DIR, DB_PATH, on_change=on_sounds_changed)
+atexit.register(sound_watcher.stop)
+
+
+# ---------- sequences ----------
+
+sequence_lock = threading.Lock()
+
+def refresh_sequences(ids=None, force=False):
+    """Re-render sequences whose steps or source sounds changed, in the background. Returns the job."""
+    # A full refresh that has not started yet will see every change, this one included
+    for job in job_manager.list(["sequence"], active_only=True):
+        if job.state == jobs.QUEUED and job.description == "Render sequences":
+            return job
+    description = "Render sequences" if ids is None and not force else "Render sequence"
+    return job_manager.submit("sequence", run_sequence_job, ids, force, description=description)
+
+def run_sequence_job(job, ids, force):
+    # One render at a time, so two jobs never write the same output
+    with sequence_lock:
+        with database.connection(DB_PATH) as conn:
+            rendered = sequences.refresh(conn, SOUNDS_DIR, ids=ids, force=force, job=job)
+            if rendered:
+                sound_library.sync(conn, SOUNDS_DIR)
+    if rendered:
+        bell_timeline.invalidate()  # clip lengths
+        analyze_sounds()
+    job.message = f"Rendered {len(rendered)} sequence(s)"
+    return {"rendered": rendered}
+
+@app.route("/save_sequence", methods=["POST"])
 @login_required
 @permission_required("bells")
-def set_volume():
+def save_sequence():
+    """Create or replace a sequence and render it to a single sound file"""
+    name = request.form.get("name", "").strip()
+    if not name:
+        flash("Please give the sequence a name.", "error")
+        return redirect(url_for("alarms"))
+    
     try:
-        vol = int(request.form.get("volume", "70"))
-        vol = max(0, min(100, vol))
-    except ValueError:
-        vol = 70
+        steps = sequences.parse_steps(request.form.get("steps", ""))
+        missing = sorted({s["sound"] for s in steps if not (SOUNDS_DIR / s["sound"]).exists()})
+        if missing:
+            flash(f"Sound file(s) not found: {', '.join(missing)}", "error")
+            return redirect(url_for("alarms"))
+        
+        output = sequences.output_name(name)
+        db = get_db()
+        clash = db.execute(
+            "SELECT name FROM sequences WHERE output = ? AND name != ?", (output, name)
+        ).fetchone()
+        if clash:
+            flash(f"Sequence name is too similar to '{clash['name']}'.", "error")
+            return redirect(url_for("alarms"))
+        cur = db.execute(
+            """
+            INSERT INTO sequences (name, steps, output) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET steps = excluded.steps, fingerprint = NULL
+            RETURNING id
+            """,
+            (name, json.dumps(steps), output),
+        )
+        seq_id = cur.fetchone()["id"]
+        db.commit()
+        
+        refresh_sequences([seq_id])
+        flash(f"Sequence '{name}' saved; rendering {output} in the background.", "success")
+    except sequences.SequenceError as e:
+        flash(f"Invalid sequence: {e}", "error")
+    except Exception as e:
+        flash(f"Error saving sequence: {str(e)}", "error")
+    return redirect(url_for("alarms"))
 
+@app.route("/delete_sequence/<int:seq_id>")
+@login_required
+@permission_required("bells")
+def delete_sequence(seq_id):
     db = get_db()
-    db.execute(
-        "UPDATE settings SET volume = ? WHERE id = 1",
-        (vol,),
-    )
+    seq = db.execute("SELECT name, output FROM sequences WHERE id = ?", (seq_id,)).fetchone()
+    if not seq:
+        return redirect(url_for("alarms"))
+    
+    in_use = db.execute(
+        "SELECT COUNT(*) AS c FROM alarms WHERE sound_path = ?", (f"sounds/{seq['output']}",)
+    ).fetchone()["c"]
+    if in_use:
+        flash(f"Sequence '{seq['name']}' is used by {in_use} alarm(s).", "error")
+        return redirect(url_for("alarms"))
+    
+    db.execute("DELETE FROM sequences WHERE id = ?", (seq_id,))
     db.commit()
+    (SOUNDS_DIR / seq["output"]).unlink(missing_ok=True)
+    flash(f"Sequence '{seq['name']}' deleted.", "success")
+    return redirect(url_for("alarms"))
 
-    try:
-        subprocess.run(
-            ["amixer", "sset", "Master", f"{vol}%"],
-            check=False,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except Exception:
-        pass
 
-    return ("", 204)
+# ---------- text-to-speech ----------
 
+def refresh_messages(ids=None):
+    """Save messages whose sound file is missing or out of date (from the render cache when possible)"""
+    try:
+        with database.connection(DB_PATH) as conn:
+            saved = tts.refresh(conn, SOUNDS_DIR, ids=ids)
+        if saved:
+            index_sounds(saved)
+        return saved
+    except Exception as e:
+        print(f"[ERROR] Message refresh failed: {e}", flush=True)
+        return []
 
-# ---------- playback ----------
-# NOTE: Uses pw-play (PipeWire). aplay (ALSA) is NOT supported in future Pi3 builds.
+@app.route("/tts")
+@login_required
+@permission_required("tts")
+def tts_page():
+    db = get_db()
+    messages = db.execute("SELECT * FROM tts_messages ORDER BY name").fetchall()
+    usage = {row["sound_path"]: row["c"] for row in db.execute(
+        "SELECT sound_path, COUNT(*) AS c FROM alarms WHERE sound_path LIKE ? GROUP BY sound_path",
+        (f"sounds/{tts.OUTPUT_PREFIX}%",)
+    )}
+    edit_id = request.args.get("edit", type=int)
+    return render_template(
+        "tts.html",
+        messages=[dict(m, alarms=usage.get(f"sounds/{m['output']}", 0)) for m in messages],
+        edit_message=next((m for m in messages if m["id"] == edit_id), None),
+        engine=tts.DEFAULT_ENGINE,
+        engine_available=tts.available(),
+        engines=sorted(tts.ENGINES),
+        cache=tts.cache_stats(),
+        defaults={"voice": tts.DEFAULT_VOICE, "rate": tts.DEFAULT_RATE},
+        rate_range=(tts.MIN_RATE, tts.MAX_RATE),
+        max_text=tts.MAX_TEXT,
+    )
 
-def play_sound(sound_path):
-    """Play sound file using pw-play. Returns dict with debug info on error."""
-    full_path = str((APP_DIR / sound_path).resolve())
-    
-    # Debug: Log the command
-    cmd = ["pw-play", full_path]
-    print(f"[DEBUG] Executing: {' '.join(cmd)}", flush=True)
-    
-    if not os.path.exists(full_path):
-        error_msg = f"File not found: {full_path}"
-        print(f"[ERROR] {error_msg}", flush=True)
-        return {"error": True, "message": error_msg, "command": " ".join(cmd)}
-    
-    # Get the current user's environment for PipeWire session
-    import pwd
-    current_user = pwd.getpwuid(os.getuid()).pw_name
-    user_home = pwd.getpwuid(os.getuid()).pw_dir
-    
-    # Set up environment for PipeWire user session
-    env = os.environ.copy()
-    env["XDG_RUNTIME_DIR"] = f"/run/user/{os.getuid()}"
-    env["HOME"] = user_home
-    env["USER"] = current_user
+@app.route("/save_message", methods=["POST"])
+@login_required
+@permission_required("tts")
+def save_message():
+    """Create or replace a message and save it as a sound alarms can play"""
+    name = request.form.get("name", "").strip()
+    if not name:
+        flash("Please give the message a name.", "error")
+        return redirect(url_for("tts_page"))
     
     try:
-        # Capture stderr to see any errors
-        result = subprocess.run(
-            cmd,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=10,
-            env=env
+        p = tts.params(request.form.get("text"), request.form.get("voice"),
+                       request.form.get("rate"), request.form.get("engine") or None)
+        output = tts.output_name(name)
+        db = get_db()
+        clash = db.execute(
+            "SELECT name FROM tts_messages WHERE output = ? AND name != ?", (output, name)
+        ).fetchone()
+        if clash:
+            flash(f"Message name is too similar to '{clash['name']}'.", "error")
+            return redirect(url_for("tts_page"))
+        cur = db.execute(
+            """
+            INSERT INTO tts_messages (name, text, voice, rate, engine, output) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET text = excluded.text, voice = excluded.voice,
+                rate = excluded.rate, engine = excluded.engine, cache_key = NULL
+            RETURNING id
+            """,
+            (name, p.text, p.voice, p.rate, p.engine, output),
         )
+        msg_id = cur.fetchone()["id"]
+        db.commit()
         
-        if result.returncode != 0:
-            error_msg = f"pw-play failed (exit code {result.returncode}): {result.stderr}"
-            print(f"[ERROR] {error_msg}", flush=True)
-            print(f"[DEBUG] User: {current_user}, UID: {os.getuid()}, XDG_RUNTIME_DIR: {env.get('XDG_RUNTIME_DIR')}", flush=True)
-            return {
-                "error": True, 
-                "message": error_msg, 
-                "command": " ".join(cmd),
-                "stderr": result.stderr
-            }
-        
-        print(f"[SUCCESS] Sound played: {full_path}", flush=True)
-        return None
-    except subprocess.TimeoutExpired:
-        error_msg = f"pw-play timed out after 10 seconds"
-        print(f"[ERROR] {error_msg}", flush=True)
-        return {"error": True, "message": error_msg, "command": " ".join(cmd)}
+        cached = (tts.CACHE_DIR / f"{tts.cache_key(p)}.wav").exists()
+        if refresh_messages([msg_id]):
+            flash(f"Message '{name}' saved as {output}"
+                  f"{' (from the render cache)' if cached else ''}. Schedule it on the Bell Scheduler.", "success")
+        else:
+            flash(f"Message '{name}' saved but could not be rendered; check the server log.", "error")
+    except tts.TtsError as e:
+        flash(f"Invalid message: {e}", "error")
+    except Exception as e:
+        flash(f"Error saving message: {str(e)}", "error")
+    return redirect(url_for("tts_page"))
+
+@app.route("/test_message/<int:msg_id>")
+@login_required
+@permission_required("tts")
+def test_message(msg_id):
+    """Preview a message (see test_sound)"""
+    msg = get_db().execute("SELECT output, duration FROM tts_messages WHERE id = ?", (msg_id,)).fetchone()
+    if msg is None:
+        return jsonify({"error": "Message not found"}), 404
+    try:
+        preview = preview_player.start(f"sounds/{msg['output']}", msg["duration"])
+    except previews.Busy as e:
+        return jsonify({"error": f"Not played: {e}", "busy": True}), 409
     except Exception as e:
-        error_msg = f"Exception running pw-play: {str(e)}"
-        print(f"[ERROR] {error_msg}", flush=True)
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}", flush=True)
-        return {"error": True, "message": error_msg, "command": " ".join(cmd)}
+        print(f"[ERROR] Preview of {msg['output']} failed: {e}", flush=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify(preview.to_dict()), 202
+
+@app.route("/delete_message/<int:msg_id>")
+@login_required
+@permission_required("tts")
+def delete_message(msg_id):
+    db = get_db()
+    msg = db.execute("SELECT name, output FROM tts_messages WHERE id = ?", (msg_id,)).fetchone()
+    if not msg:
+        return redirect(url_for("tts_page"))
+    
+    in_use = db.execute(
+        "SELECT COUNT(*) AS c FROM alarms WHERE sound_path = ?", (f"sounds/{msg['output']}",)
+    ).fetchone()["c"]
+    if in_use:
+        flash(f"Message '{msg['name']}' is used by {in_use} alarm(s).", "error")
+        return redirect(url_for("tts_page"))
+    
+    db.execute("DELETE FROM tts_messages WHERE id = ?", (msg_id,))
+    db.commit()
+    (SOUNDS_DIR / msg["output"]).unlink(missing_ok=True)
+    index_sounds([msg["output"]])
+    flash(f"Message '{msg['name']}' deleted.", "success")
+    return redirect(url_for("tts_page"))
+
+
+# ---------- volume ----------
+
+volume_control = volume.VolumeController(db_path=DB_PATH)
+atexit.register(volume_control.flush)
+
+@app.route("/set_volume", methods=["POST"])
+@login_required
+@permission_required("bells")
+def set_volume():
+    """Queue a volume change; the controller applies the latest value and saves it once it settles"""
+    try:
+        vol = int(request.form.get("volume", "70"))
+        vol = max(0, min(100, vol))
+    except ValueError:
+        vol = 70
+
+    volume_control.set(vol)
+    return ("", 204)
+
+
+# ---------- playback ----------
+
+preview_player = previews.Previews(APP_DIR)
+
+# Previews are started from the Bell Scheduler (bells) and Text-to-Speech (tts) pages
+@app.route("/previews/<preview_id>")
+@login_required
+@permission_required("bells", "tts")
+def preview_status(preview_id):
+    preview = preview_player.get(preview_id)
+    if preview is None:
+        return jsonify({"error": "Preview not found"}), 404
+    return jsonify(preview.to_dict())
+
+@app.route("/previews/<preview_id>/stop", methods=["POST"])
+@login_required
+@permission_required("bells", "tts")
+def stop_preview(preview_id):
+    preview = preview_player.get(preview_id)
+    if preview is None:
+        return jsonify({"error": "Preview not found"}), 404
+    return jsonify({"ok": preview_player.stop(preview_id), "preview": preview.to_dict()})
+
+@app.route("/playback_status")
+@login_required
+@permission_required("bells")
+def playback_status():
+    """What the audio engine is playing and queueing, with per-priority wait metrics
+    and backend latency (the engine's, and this process's fallback players')"""
+    reply = audio_engine.request({"cmd": "status"})
+    fallback = audio_backends.stats()
+    if reply is None:
+        return jsonify({"ok": False, "error": "Audio engine is not running", "fallback": fallback}), 503
+    return jsonify({**reply, "fallback": fallback})
+
+
+# ---------- background jobs ----------
+
+job_manager = jobs.JobManager()
+atexit.register(job_manager.shutdown)
+
+# Permission needed to see or cancel each kind of job
+JOB_PERMISSIONS = {"backup": "backup", "export": "backup", "restore": "backup",
+                   "normalize": "bells", "analyze": "bells", "sequence": "bells", "synth": "bells"}
+BACKUP_JOB_KINDS = ("backup", "export", "restore")
+
+def visible_jobs(kinds=None):
+    uid = session.get("user_id")
+    return [j for j in job_manager.list(kinds)
+            if has_permission(uid, JOB_PERMISSIONS.get(j.kind, "users"))]
+
+@app.route("/jobs")
+@login_required
+def job_list():
+    return jsonify([j.to_dict() for j in visible_jobs()])
+
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job not in visible_jobs([job.kind]):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job not in visible_jobs([job.kind]):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"ok": job_manager.cancel(job_id), "job": job.to_dict()})
 
 
 # ---------- backup and restore ----------
@@ -799,47 +1642,101 @@ def backup_page():
             except Exception:
                 pass
     
-    return render_template("backup.html", backups=backups)
+    return render_template(
+        "backup.html",
+        backups=backups,
+        snapshots=snapshots.list_snapshots(BACKUP_DIR),
+        jobs=[j.to_dict() for j in visible_jobs(BACKUP_JOB_KINDS)][-5:]
+    )
+
+
+def snapshot_file(filename):
+    """Path of a snapshot manifest in BACKUP_DIR, or None if there is no such snapshot."""
+    path = BACKUP_DIR / filename
+    if (not filename.startswith(snapshots.SNAPSHOT_PREFIX) or not filename.endswith(".json")
+            or path.parent != BACKUP_DIR or not path.exists()):
+        return None
+    return path
+
+
+def run_backup_job(job):
+    try:
+        with database.connection(DB_PATH) as conn:
+            path, stats = snapshots.create_snapshot(conn, SOUNDS_DIR, BACKUP_DIR, job=job)
+    except jobs.JobCancelled:
+        # Remove sound data stored for the snapshot that was never written
+        snapshots.gc(BACKUP_DIR)
+        raise
+    job.message = (f"Created {path.name} ({stats['stored']} new sound file(s), "
+                   f"{stats['reused']} unchanged)")
+    return {"filename": path.name, **stats}
+
+
+def run_export_job(job, snapshot_path, export_file):
+    snapshots.export_zip(snapshots.load_snapshot(snapshot_path), export_file, BACKUP_DIR / "blobs", job=job)
+    job.message = f"Exported {export_file.name}"
+    return {"filename": export_file.name}
+
+
+def run_snapshot_restore_job(job, snapshot_path, include_users):
+    users = snapshots.load_users(snapshot_path) if include_users else None
+    with database.connection(DB_PATH) as conn:
+        created = snapshots.restore_snapshot(
+            snapshots.load_snapshot(snapshot_path), conn, SOUNDS_DIR, BACKUP_DIR / "blobs",
+            users=users, job=job
+        )
+    index_sounds()
+    sync_cron()
+    job.message = f"Restored {snapshot_path.name}"
+    if created:
+        # Passwords are not in backups
+        job.message += f"; set a password on the Users page for: {', '.join(created)}"
 
 
 @app.route("/create_backup", methods=["POST"])
 @login_required
 @permission_required("backup")
 def create_backup():
-    """Create a new backup including database alarms and sound files"""
-    try:
-        # Ensure backup directory exists
-        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-        
-        # Generate timestamp
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        backup_file = BACKUP_DIR / f"churchbells-backup-{timestamp}.zip"
-        
-        # Export alarms from database to JSON
-        db = get_db()
-        alarms = db.execute(
-            "SELECT id, day_of_week, time_str, sound_path, enabled, last_run_date FROM alarms"
-        ).fetchall()
-        
-        alarms_data = [dict(row) for row in alarms]
-        alarms_json = json.dumps(alarms_data, indent=2)
-        
-        # Create ZIP archive
-        with zipfile.ZipFile(backup_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add alarms JSON
-            zipf.writestr("alarms.json", alarms_json)
-            
-            # Add all sound files
-            if SOUNDS_DIR.exists():
-                for sound_file in SOUNDS_DIR.rglob("*"):
-                    if sound_file.is_file():
-                        arcname = sound_file.relative_to(SOUNDS_DIR.parent)
-                        zipf.write(sound_file, arcname)
-        
-        flash(f"Backup created successfully: {backup_file.name}", "success")
-    except Exception as e:
-        flash(f"Error creating backup: {str(e)}", "error")
+    """Start an incremental snapshot (alarms, settings, users without passwords and new sound data) in the background"""
+    job_manager.submit("backup", run_backup_job, description="Create backup")
+    flash("Backup started. Progress is shown below.", "success")
+    return redirect(url_for("backup_page"))
+
+
+@app.route("/export_backup/<filename>", methods=["POST"])
+@login_required
+@permission_required("backup")
+def export_backup(filename):
+    """Build a single-ZIP copy of a snapshot in the classic backup format"""
+    path = snapshot_file(filename)
+    if path is None:
+        flash("Backup file not found", "error")
+        return redirect(url_for("backup_page"))
+    
+    stamp = path.stem[len(snapshots.SNAPSHOT_PREFIX):]
+    export_file = BACKUP_DIR / f"{snapshots.EXPORT_PREFIX}{stamp}.zip"
+    if export_file.exists():
+        return redirect(url_for("download_backup", filename=export_file.name))
     
+    job_manager.submit("export", run_export_job, path, export_file, description=f"Export {filename}")
+    flash("Export started. The ZIP will appear under ZIP Archives when it is ready.", "success")
+    return redirect(url_for("backup_page"))
+
+
+@app.route("/restore_snapshot/<filename>", methods=["POST"])
+@login_required
+@permission_required("backup")
+def restore_snapshot(filename):
+    """Restore alarms, settings and sounds (and optionally users) from a snapshot"""
+    path = snapshot_file(filename)
+    if path is None:
+        flash("Backup file not found", "error")
+        return redirect(url_for("backup_page"))
+    
+    include_users = bool(request.form.get("include_users")) and is_admin(session["user_id"])
+    job_manager.submit("restore", run_snapshot_restore_job, path, include_users,
+                       description=f"Restore {filename}")
+    flash("Restore started. Progress is shown below.", "success")
     return redirect(url_for("backup_page"))
 
 
@@ -855,6 +1752,11 @@ def download_backup(filename):
         flash("Backup file not found", "error")
         return redirect(url_for("backup_page"))
     
+    # User accounts are for administrators only
+    if snapshots.contains_users(backup_file) and not is_admin(session["user_id"]):
+        flash("Only administrators can download backups that contain user accounts.", "error")
+        return redirect(url_for("backup_page"))
+    
     return send_file(
         backup_file,
         as_attachment=True,
@@ -865,6 +1767,7 @@ def download_backup(filename):
 
 @app.route("/delete_backup/<filename>")
 @login_required
+@permission_required("backup")
 def delete_backup(filename):
     """Delete a backup file"""
     backup_file = BACKUP_DIR / filename
@@ -876,6 +1779,10 @@ def delete_backup(filename):
     
     try:
         backup_file.unlink()
+        if filename.startswith(snapshots.SNAPSHOT_PREFIX):
+            snapshots.users_path(backup_file).unlink(missing_ok=True)
+            # Drop sound data no remaining snapshot refers to
+            snapshots.gc(BACKUP_DIR)
         flash(f"Backup '{filename}' deleted", "success")
     except Exception as e:
         flash(f"Error deleting backup: {str(e)}", "error")
@@ -883,11 +1790,26 @@ def delete_backup(filename):
     return redirect(url_for("backup_page"))
 
 
+def run_zip_restore_job(job, temp_backup):
+    """Restore an uploaded ZIP backup (alarms.json + sounds/)."""
+    try:
+        with database.connection(DB_PATH) as conn:
+            snapshots.restore_zip(temp_backup, conn, SOUNDS_DIR, job=job)
+    finally:
+        # Clean up temp backup file
+        temp_backup.unlink(missing_ok=True)
+    
+    # Re-index the restored sounds and re-render sequences, then sync cron with restored alarms
+    index_sounds()
+    sync_cron()
+    job.message = "Backup restored successfully."
+
+
 @app.route("/restore_backup", methods=["POST"])
 @login_required
 @permission_required("backup")
 def restore_backup():
-    """Upload and restore a backup file"""
+    """Upload a backup file and restore it in the background"""
     if "backup_file" not in request.files:
         flash("No backup file provided", "error")
         return redirect(url_for("backup_page"))
@@ -903,91 +1825,18 @@ def restore_backup():
     
     try:
         # Save uploaded file temporarily
+        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
         temp_backup = BACKUP_DIR / f"temp-restore-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
         file.save(temp_backup)
+        if not zipfile.is_zipfile(temp_backup):
+            temp_backup.unlink()
+            flash("Backup file is not a valid ZIP archive", "error")
+            return redirect(url_for("backup_page"))
         
-        # Stop the service before restore
-        try:
-            subprocess.run(
-                ["sudo", "systemctl", "stop", "churchbell.service"],
-                check=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except Exception:
-            pass
-        
-        # Extract backup
-        with zipfile.ZipFile(temp_backup, 'r') as zipf:
-            # Extract alarms.json
-            if "alarms.json" in zipf.namelist():
-                zipf.extract("alarms.json", APP_DIR)
-                
-                # Restore alarms to database
-                alarms_json_path = APP_DIR / "alarms.json"
-                with open(alarms_json_path, 'r') as f:
-                    alarms_data = json.load(f)
-                
-                db = get_db()
-                # Clear existing alarms
-                db.execute("DELETE FROM alarms")
-                db.commit()
-                
-                # Insert restored alarms (without IDs to let SQLite auto-increment)
-                for alarm in alarms_data:
-                    db.execute(
-                        """
-                        INSERT INTO alarms (day_of_week, time_str, sound_path, enabled, last_run_date)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (
-                            alarm.get("day_of_week"),
-                            alarm.get("time_str"),
-                            alarm.get("sound_path"),
-                            alarm.get("enabled", 1),
-                            alarm.get("last_run_date")
-                        )
-                    )
-                db.commit()
-                
-                # Clean up temporary JSON file
-                alarms_json_path.unlink()
-            
-            # Extract sound files
-            for member in zipf.namelist():
-                if member.startswith("sounds/"):
-                    zipf.extract(member, APP_DIR)
-        
-        # Clean up temp backup file
-        temp_backup.unlink()
-        
-        # Sync cron with restored alarms
-        sync_cron()
-        
-        # Restart the service
-        try:
-            subprocess.run(
-                ["sudo", "systemctl", "start", "churchbell.service"],
-                check=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except Exception:
-            pass
-        
-        flash("Backup restored successfully. Service restarted.", "success")
+        job_manager.submit("restore", run_zip_restore_job, temp_backup, description=f"Restore {file.filename}")
+        flash("Restore started. Progress is shown below.", "success")
     except Exception as e:
         flash(f"Error restoring backup: {str(e)}", "error")
-        # Try to restart service even on error
-        try:
-            subprocess.run(
-                ["sudo", "systemctl", "start", "churchbell.service"],
-                check=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except Exception:
-            pass
     
     return redirect(url_for("backup_page"))
 
@@ -1003,6 +1852,17 @@ if __name__ == "__main__":
         init_db()
     except Exception as e:
         print(f"Warning: Database initialization issue: {e}")
+    try:
+        moved = snapshots.split_users(BACKUP_DIR)
+        if moved:
+            print(f"[INFO] Removed users and passwords from {moved} backup manifest(s)", flush=True)
+    except Exception as e:
+        print(f"[ERROR] Could not remove users from backup manifests: {e}", flush=True)
+    refresh_sequences()
+    refresh_messages()
+    analyze_sounds()
+    # Indexes sounds/ in the background, then follows changes
+    sound_watcher.start()
     
     # SSL certificate paths
     CERT_DIR = APP_DIR / "ssl"
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Audio output backends.
+All playback goes through one of these. The audio engine streams raw PCM
+into a backend (open/write/close). When the engine is not running, the
+Test button, scheduler.py and the cron scripts hand whole files to play().
+
+    pipewire  pw-play FILE; the engine's stream is one long-lived pw-cat pipe
+    alsa      aplay FILE; the stream is one long-lived aplay pipe
+              (CHURCHBELL_ALSA_DEVICE picks the device)
+    null      discards the audio, in real time
+    file      records WAV files in CHURCHBELL_RECORD_DIR, plus events.jsonl
+              noting when each sound started (wall clock and frame)
+
+CHURCHBELL_AUDIO_BACKEND selects one (default pipewire). null and file need
+no sound hardware, e.g. for tests and benchmarks on a headless machine.
+
+Every backend counts its start-up latency (spawning a player, or opening
+the stream) and, where it can see the audio, its first-frame latency: from
+a sound being started to its first audible frame being accepted by the
+sink. That is every stream, and files played by null and file; pw-play and
+aplay do not report it. /playback_status shows the counters for the engine
+and for the web app's fallback players.
+
+Usage:
+    audio_backends.py list
+    audio_backends.py play FILE [BACKEND]     play FILE and wait for it to finish
+    audio_backends.py bench FILE [REPEAT]     first-frame latency of each available backend
+"""
+import fcntl
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+
+import pcm
+
+APP_DIR = Path(__file__).resolve().parent
+DEFAULT_BACKEND = os.getenv("CHURCHBELL_AUDIO_BACKEND", "pipewire")
+RECORD_DIR = Path(os.getenv("CHURCHBELL_RECORD_DIR", str(APP_DIR / "recordings")))
+PIPE_BYTES = 4096                  # keep the pipe short so a new bell is not queued behind silence
+F_SETPIPE_SZ = 1031                # fcntl.F_SETPIPE_SZ, only exported by Python 3.10+
+CHUNK_SECONDS = 0.01               # granularity of the in-process players
+
+
+def player_env():
+    """Environment for a player process: the PipeWire/Pulse session lives in the
+    user's runtime directory, which cron and systemd do not always set."""
+    env = os.environ.copy()
+    env.setdefault("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
+    return env
+
+
+def _audible(data, width=2):
+    """True if `data` has any sample other than digital silence."""
+    return bool(data.strip(b"\x80" if width == 1 else b"\0"))
+
+
+class Player:
+    """Popen-like handle (poll, wait, terminate) for a file played inside this process."""
+
+    def __init__(self, backend, path):
+        self.args = [backend.name, str(path)]
+        self.returncode = None
+        self.stderr = io.StringIO()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(backend, path),
+                                        name=f"play-{backend.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self, backend, path):
+        try:
+            backend._render(path, self._stop)
+            self.returncode = -15 if self._stop.is_set() else 0
+        except Exception as e:
+            self.stderr.write(str(e))
+            self.stderr.seek(0)
+            self.returncode = 1
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._stop.set()
+
+    kill = terminate
+
+
+class Backend:
+    """Base class: latency counters and the first-frame bookkeeping.
+
+    Subclasses provide _open/_write/_close for streaming and _play for files.
+    """
+
+    name = None
+
+    def __init__(self, fmt=None):
+        self.fmt = fmt
+        self._expect = None  # monotonic time a sound was started, until its first frame is out
+        self._lock = threading.Lock()
+        self.counters = {kind: {"count": 0, "total": 0.0, "max": 0.0}
+                         for kind in ("startup", "first_frame")}
+
+    @property
+    def available(self):
+        return True
+
+    def _count(self, kind, seconds):
+        with self._lock:
+            c = self.counters[kind]
+            c["count"] += 1
+            c["total"] += seconds
+            c["max"] = max(c["max"], seconds)
+
+    def stats(self):
+        """{kind: {count, avg_ms, max_ms}} for startup and first_frame."""
+        with self._lock:
+            return {kind: {"count": c["count"],
+                           "avg_ms": round(1000 * c["total"] / c["count"], 2) if c["count"] else None,
+                           "max_ms": round(1000 * c["max"], 2)}
+                    for kind, c in self.counters.items()}
+
+    # ----- streaming (the audio engine) -----
+
+    def open(self):
+        started = time.monotonic()
+        self._open()
+        self._count("startup", time.monotonic() - started)
+
+    def expect_frame(self):
+        """A sound has just started; time how long until it reaches the sink."""
+        if self._expect is None:
+            self._expect = time.monotonic()
+
+    def write(self, data):
+        """Write raw PCM in self.fmt. Blocks for about as long as the audio lasts."""
+        self._write(data)
+        if self._expect is not None and _audible(data):
+            self._count("first_frame", time.monotonic() - self._expect)
+            self._expect = None
+
+    def close(self):
+        self._close()
+
+    # ----- whole files (fallback when the engine is not running) -----
+
+    def play(self, path, capture=False):
+        """Start playing the WAV at `path`; returns a Popen (or Player) without waiting.
+        With `capture`, the player's error output is readable from its .stderr."""
+        started = time.monotonic()
+        player = self._play(str(path), capture)
+        self._count("startup", time.monotonic() - started)
+        return player
+
+
+class ProcessBackend(Backend):
+    """A command-line player: one process per file, or one long-lived process reading
+    raw PCM from stdin for the stream."""
+
+    stream_binary = None  # program stream_command() runs
+
+    def __init__(self, fmt=None):
+        super().__init__(fmt)
+        self._proc = None
+
+    def file_command(self, path):
+        raise NotImplementedError
+
+    def stream_command(self):
+        raise NotImplementedError
+
+    @property
+    def available(self):
+        """Both the file player and the stream program are installed."""
+        return all(shutil.which(binary) is not None
+                   for binary in (self.file_command("")[0], self.stream_binary))
+
+    def _open(self):
+        self._proc = subprocess.Popen(self.stream_command(), stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=player_env())
+        try:
+            fcntl.fcntl(self._proc.stdin.fileno(), F_SETPIPE_SZ, PIPE_BYTES)
+        except OSError:
+            pass
+        print(f"[INFO] Opened sink: {' '.join(self.stream_command())}", flush=True)
+
+    def _write(self, data):
+        if self._proc is None or self._proc.poll() is not None:
+            self.open()
+        try:
+            self._proc.stdin.write(data)
+            self._proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            print("[WARN] Sink went away, reopening", flush=True)
+            self._proc = None
+            time.sleep(0.5)
+
+    def _close(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            self._proc.terminate()
+            self._proc = None
+
+    def _play(self, path, capture):
+        cmd = self.file_command(path)
+        print(f"[DEBUG] Executing: {' '.join(cmd)}", flush=True)
+        return subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE if capture else subprocess.DEVNULL,
+                                text=True, env=player_env())
+
+
+class PipeWireBackend(ProcessBackend):
+    name = "pipewire"
+    stream_binary = "pw-cat"
+
+    def file_command(self, path):
+        return [os.getenv("CHURCHBELL_PWPLAY", "pw-play"), path]
+
+    def stream_command(self):
+        return [self.stream_binary, "--playback", "--raw", "--format", "s16", "--rate", str(self.fmt.rate),
+                "--channels", str(self.fmt.channels), "-"]
+
+
+class AlsaBackend(ProcessBackend):
+    name = "alsa"
+    stream_binary = "aplay"
+
+    def _device(self):
+        device = os.getenv("CHURCHBELL_ALSA_DEVICE")
+        return ["-D", device] if device else []
+
+    def file_command(self, path):
+        return ["aplay", "-q", *self._device(), path]
+
+    def stream_command(self):
+        return [self.stream_binary, "-q", *self._device(), "-t", "raw", "-f", "S16_LE",
+                "-r", str(self.fmt.rate), "-c", str(self.fmt.channels), "-"]
+
+
+class NullBackend(Backend):
+    """Discards the audio at the rate a real sink would consume it."""
+
+    name = "null"
+
+    def __init__(self, fmt=None):
+        super().__init__(fmt)
+        self._clock = None
+
+    def _pace(self, clock, nbytes, fmt):
+        """Sleep until `nbytes` more audio would have played. `clock` is [start, seconds so far]."""
+        clock[1] += nbytes / (fmt.channels * fmt.width * fmt.rate)
+        delay = clock[0] + clock[1] - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -0.5:
+            clock[0], clock[1] = time.monotonic(), 0.0  # fell behind (suspend, load); resync
+
+    def _open(self):
+        self._clock = [time.monotonic(), 0.0]
+
+    def _write(self, data):
+        if self._clock is None:
+            self.open()
+        self._pace(self._clock, len(data), self.fmt)
+
+    def _close(self):
+        self._clock = None
+
+    def _play(self, path, capture):
+        return Player(self, path)
+
+    def _render(self, path, stop):
+        """Play a file in real time on the calling thread until it ends or `stop` is set."""
+        started = time.monotonic()
+        info, data = pcm.read_frames(path)
+        fmt = pcm.info_format(info)
+        out = self._start_file(path, fmt)
+        try:
+            step = max(1, int(fmt.rate * CHUNK_SECONDS)) * fmt.channels * fmt.width
+            clock = [time.monotonic(), 0.0]
+            pending = True
+            for pos in range(0, len(data), step):
+                if stop.is_set():
+                    return
+                chunk = data[pos:pos + step]
+                self._file_chunk(out, chunk, pos // (fmt.channels * fmt.width))
+                if pending and _audible(chunk, fmt.width):
+                    self._count("first_frame", time.monotonic() - started)
+                    pending = False
+                self._pace(clock, len(chunk), fmt)
+        finally:
+            self._end_file(out)
+
+    def _start_file(self, path, fmt):
+        return None
+
+    def _file_chunk(self, out, chunk, frame):
+        pass
+
+    def _end_file(self, out):
+        pass
+
+
+class FileBackend(NullBackend):
+    """Like null, but records everything to WAV files and logs when each sound started.
+
+    The stream goes to stream-<time>.wav, one record in events.jsonl per
+    silence-to-sound transition; each file played goes to <time>-<name>.wav.
+    """
+
+    name = "file"
+
+    def __init__(self, fmt=None, directory=RECORD_DIR):
+        super().__init__(fmt)
+        self.directory = Path(directory)
+        self._wav = None
+        self._name = None
+        self._frames = 0
+        self._silent = True
+
+    def _log(self, **fields):
+        with open(self.directory / "events.jsonl", "a") as f:
+            f.write(json.dumps({"time": time.time(), **fields}) + "\n")
+
+    def _create(self, name, fmt):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        w = wave.open(str(self.directory / name), "wb")
+        w.setnchannels(fmt.channels)
+        w.setsampwidth(fmt.width)
+        w.setframerate(fmt.rate)
+        return w
+
+    def _open(self):
+        super()._open()
+        self._name = f"stream-{datetime.now():%Y%m%d-%H%M%S}.wav"
+        self._wav = self._create(self._name, self.fmt)
+        self._frames = 0
+        self._silent = True
+        self._log(event="open", file=self._name)
+
+    def _write(self, data):
+        if self._wav is None:
+            self.open()
+        audible = _audible(data)
+        if audible and self._silent:
+            self._log(event="onset", file=self._name, frame=self._frames)
+        self._silent = not audible
+        self._wav.writeframes(data)
+        self._frames += len(data) // (self.fmt.channels * self.fmt.width)
+        super()._write(data)
+
+    def _close(self):
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+            self._log(event="close", file=self._name, frames=self._frames)
+        super()._close()
+
+    def _start_file(self, path, fmt):
+        name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{Path(path).name}"
+        out = self._create(name, fmt)
+        self._log(event="play", file=name, source=str(path))
+        return out
+
+    def _file_chunk(self, out, chunk, frame):
+        out.writeframes(chunk)
+
+    def _end_file(self, out):
+        out.close()
+
+
+BACKENDS = {cls.name: cls for cls in (PipeWireBackend, AlsaBackend, NullBackend, FileBackend)}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def create(name=None, fmt=None):
+    """A new backend instance, for a stream in `fmt` (the audio engine's sink)."""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"audio backend must be one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](fmt)
+
+
+def get(name=None):
+    """The shared backend for playing whole files in this process; its counters accumulate."""
+    name = name or DEFAULT_BACKEND
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = create(name)
+        return _shared[name]
+
+
+def stats():
+    """Latency counters of the backends this process has played files through."""
+    with _shared_lock:
+        return {name: backend.stats() for name, backend in _shared.items()}
+
+
+# ---------- command line ----------
+
+def bench(path, repeat=5):
+    """Stream `path` through each available backend `repeat` times, as the engine would,
+    and report first-frame latency. Silence is written between plays so each
+    sound has to get through a pipe that is already full, like a real bell."""
+    fmt = pcm.PcmFormat(int(os.getenv("CHURCHBELL_SINK_RATE", "48000")),
+                        int(os.getenv("CHURCHBELL_SINK_CHANNELS", "2")), 2)
+    clip = bytes(pcm.load(path, fmt)[0])
+    step = int(fmt.rate * CHUNK_SECONDS) * fmt.channels * fmt.width
+    silence = bytes(step)
+    results = {}
+    for name, cls in BACKENDS.items():
+        backend = cls(fmt)
+        if name == "file":
+            backend.directory = Path(tempfile.mkdtemp(prefix="churchbell-bench-"))
+        if not backend.available:
+            results[name] = None
+            continue
+        backend.open()
+        try:
+            for _ in range(repeat):
+                for _ in range(20):
+                    backend.write(silence)
+                backend.expect_frame()
+                for pos in range(0, len(clip), step):
+                    backend.write(clip[pos:pos + step])
+        finally:
+            backend.close()
+        results[name] = backend.stats()
+    return results
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ("list", "play", "bench"):
+        print(__doc__.strip().split("Usage:")[1], file=sys.stderr)
+        return 2
+    if argv[1] == "list":
+        for name, cls in BACKENDS.items():
+            marker = "*" if name == DEFAULT_BACKEND else " "
+            print(f"{marker} {name:<10}{'available' if cls().available else 'not installed'}")
+        return 0
+    if len(argv) < 3:
+        print(f"usage: audio_backends.py {argv[1]} FILE ...", file=sys.stderr)
+        return 2
+    if argv[1] == "bench":
+        print(json.dumps(bench(argv[2], int(argv[3]) if len(argv) > 3 else 5), indent=2))
+        return 0
+    try:
+        backend = get(argv[3] if len(argv) > 3 else None)
+        player = backend.play(argv[2], capture=True)
+    except (ValueError, OSError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    code = player.wait()
+    if code:
+        print(f"[ERROR] {backend.name} failed (exit code {code}): {player.stderr.read().strip()}",
+              file=sys.stderr)
+    return 1 if code else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+ChurchBell playback engine.
+Keeps one output stream open (by default a pw-cat process fed from a pipe;
+see audio_backends.py) and holds decoded PCM for the files in sounds/ in an LRU cache, so starting a bell is
+just a matter of writing frames that are already in memory.
+
+app.py, scheduler.py and the cron scripts talk to the engine over a Unix
+socket (audio.sock), one JSON request per line:
+
+    {"cmd": "play", "path": "/abs/path.wav"}  -> {"ok": true, "id": 3}
+    {"cmd": "play", "path": ..., "overlap": "queue", "priority": "announcement"}
+        -> {"ok": false, "busy": true, "error": ...} when refused
+    {"cmd": "stop"} | {"cmd": "status"}
+    {"cmd": "stop", "id": 3}            (just that sound, playing or queued)
+    {"cmd": "status", "id": 3}
+        -> {"ok": true, "id": 3, "state": "playing", "position": 1.2, "duration": 4.0}
+           (state is queued, playing, played, stopped, preempted or unknown)
+    {"cmd": "preload", "paths": [...]}  (no paths: every sound in the index)
+    {"cmd": "reload", "paths": [...]}   (decode again, e.g. after level analysis)
+
+Every sound has a priority: emergency > announcement > bell (the default)
+> preview. A higher priority starts at once and stops whatever is playing,
+except that bells carry on under an announcement, turned down by
+CHURCHBELL_DUCK_DB. A lower priority waits until the higher one has
+finished (previews are refused instead). Between sounds of the same
+priority, the overlap policy decides:
+
+    preempt  stop the others and play it now (the default)
+    queue    play it as soon as the current sounds have finished
+    mix      play it now on top of the current sounds
+
+Usage:
+    audio_engine.py serve          run the engine (churchbell-audio.service)
+    audio_engine.py play FILE [POLICY] [PRIORITY]
+                                   ask a running engine to play FILE
+    audio_engine.py status
+
+Exit status: 0 ok, 1 refused, failed or timed out (final: do not play it
+some other way), 2 usage, 3 (EXIT_UNREACHABLE) the engine is not running.
+"""
+import itertools
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import audio_backends
+import db
+import pcm
+import sound_library
+
+APP_DIR = Path(__file__).resolve().parent
+SOUNDS_DIR = APP_DIR / "sounds"
+SOCKET_PATH = Path(os.getenv("CHURCHBELL_AUDIO_SOCKET", str(APP_DIR / "audio.sock")))
+
+SINK_FORMAT = pcm.PcmFormat(
+    int(os.getenv("CHURCHBELL_SINK_RATE", "48000")),
+    int(os.getenv("CHURCHBELL_SINK_CHANNELS", "2")),
+    2,
+)
+CACHE_BYTES = int(os.getenv("CHURCHBELL_PCM_CACHE_MB", "64")) * 1024 * 1024
+MMAP_THRESHOLD = 4 * 1024 * 1024   # map, rather than copy, sink-format files at least this big
+CHUNK_SECONDS = 0.01               # frames written to the sink per iteration
+APPLY_LEVELS = os.getenv("CHURCHBELL_LOUDNESS", "1") != "0"  # per-clip gain and silence trim
+MIN_GAIN_DB = 0.1                  # smaller corrections are not worth a copy of the buffer
+OVERLAP_POLICIES = ("preempt", "queue", "mix")
+PRIORITIES = ("preview", "bell", "announcement", "emergency")  # lowest first
+PREVIEW, BELL, ANNOUNCEMENT, EMERGENCY = range(len(PRIORITIES))
+QUEUE_DEPTH = {"preview": 0, "bell": 16, "announcement": 8, "emergency": 4}  # previews never wait
+DUCK_DB = float(os.getenv("CHURCHBELL_DUCK_DB", "15"))  # bells under an announcement; 0 stops them
+DUCK_GAIN = 10 ** (-DUCK_DB / 20)
+KEEP_FINISHED = 256                # outcomes remembered for status-by-id queries
+EXIT_UNREACHABLE = 3               # CLI exit status when no engine is running (callers may fall back)
+PLAY_TIMEOUT = 30.0                # seconds to wait for a play reply; covers decoding a long cold file
+BACKEND_RETRY = 5.0                # first wait for a missing backend, doubled up to MAX_BACKEND_RETRY
+MAX_BACKEND_RETRY = 300.0
+
+
+class Busy(Exception):
+    """A play request was refused: outranked with no room to wait."""
+
+
+class PcmCache:
+    """LRU of decoded sounds keyed by path, invalidated when the file changes.
+
+    Memory-mapped entries live in the page cache, not the heap, so they do not
+    count against the byte budget. When a sound is decoded, its index entry
+    (see index_entry) supplies the parsed header and the loudness analysis:
+    leading and trailing silence are cut and the clip's gain is applied once,
+    here, rather than on every playback.
+    """
+
+    def __init__(self, fmt=SINK_FORMAT, max_bytes=CACHE_BYTES, lookup=None):
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.lookup = lookup
+        self._entries = OrderedDict()  # path -> (stamp, buffer, cost)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, meta=None):
+        """Decoded PCM for `path`. `meta` is its index entry if the caller already
+        has it; either way it is used only while the file still matches it."""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+        # Decode outside the lock; a racing decode of the same file is harmless.
+        if meta is None and self.lookup is not None:
+            meta = self.lookup(path)
+        if meta is not None and meta["stamp"] != stamp:
+            meta = None
+        buffer, mapped = pcm.load(path, self.fmt, MMAP_THRESHOLD, meta and meta["info"])
+        if meta is not None and APPLY_LEVELS:
+            buffer, mapped = self._apply_levels(buffer, mapped, meta)
+        cost = 0 if mapped else len(buffer)
+        with self._lock:
+            self.misses += 1
+            old = self._entries.pop(path, None)
+            if old:
+                self._bytes -= old[2]
+            self._entries[path] = (stamp, buffer, cost)
+            self._bytes += cost
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return buffer
+
+    def _apply_levels(self, buffer, mapped, meta):
+        frame_bytes = self.fmt.channels * self.fmt.width
+        frames = len(buffer) // frame_bytes
+        lead = min(frames, int((meta["lead_s"] or 0) * self.fmt.rate))
+        trail = min(frames - lead, int((meta["trail_s"] or 0) * self.fmt.rate))
+        if lead or trail:
+            buffer = memoryview(buffer)[lead * frame_bytes:(frames - trail) * frame_bytes]
+        if meta["gain_db"] and abs(meta["gain_db"]) >= MIN_GAIN_DB:
+            buffer = pcm.apply_gain(bytes(buffer), 10 ** (meta["gain_db"] / 20))
+            mapped = False
+        return buffer, mapped
+
+    def invalidate(self, paths):
+        with self._lock:
+            for path in paths:
+                old = self._entries.pop(path, None)
+                if old:
+                    self._bytes -= old[2]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class Engine:
+    """Feeds the sink continuously: the sounds playing now mixed together, or silence when idle.
+
+    Requests carry a priority (PRIORITIES). A sound that outranks everything
+    playing starts at once, stopping or ducking the rest; one that is
+    outranked waits in its level's queue (or is refused if the queue is
+    full) and starts when nothing above it is playing. Admission and dispatch
+    only touch the short voice list and one deque per level.
+    """
+
+    def __init__(self, sink=None, cache=None):
+        self.sink = sink or audio_backends.create(fmt=SINK_FORMAT)
+        self.cache = cache or PcmCache(self.sink.fmt, lookup=index_entry)
+        fmt = self.sink.fmt
+        self.frame_bytes = fmt.channels * fmt.width
+        self.chunk_bytes = int(fmt.rate * CHUNK_SECONDS) * self.frame_bytes
+        self._silence = bytes(self.chunk_bytes)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._voices = []  # playing now: dict(id, path, buffer, pos, level, queued_at)
+        self._queues = [deque() for _ in PRIORITIES]  # waiting, one FIFO per level
+        self._finished = OrderedDict()  # id -> played/stopped/preempted, oldest first
+        self._running = False
+        self.played = 0
+        self.metrics = {name: {"started": 0, "queued": 0, "refused": 0, "preempted": 0,
+                               "wait_total": 0.0, "wait_max": 0.0} for name in PRIORITIES}
+
+    def _top(self):
+        return max((v["level"] for v in self._voices), default=-1)
+
+    def _finish(self, voices, outcome):
+        """Record how `voices` ended. Caller holds the lock."""
+        for voice in voices:
+            self._finished[voice["id"]] = outcome
+            if outcome == "preempted":
+                self.metrics[PRIORITIES[voice["level"]]]["preempted"] += 1
+        while len(self._finished) > KEEP_FINISHED:
+            self._finished.popitem(last=False)
+
+    def _start(self, voice):
+        """Make `voice` audible now, above everything of lower priority. Caller holds the lock."""
+        level = voice["level"]
+        # An announcement talks over bells (ducked, see _next_chunk); anything else is stopped
+        ducks = DUCK_DB > 0 and level == ANNOUNCEMENT
+        keep, stopped = [], []
+        for other in self._voices:
+            if other["level"] < level and not (ducks and other["level"] > PREVIEW):
+                stopped.append(other)
+            else:
+                keep.append(other)
+        self._finish(stopped, "preempted")
+        keep.append(voice)
+        self._voices = keep
+        self.sink.expect_frame()
+        wait = time.monotonic() - voice["queued_at"]
+        stats = self.metrics[PRIORITIES[level]]
+        stats["started"] += 1
+        stats["wait_total"] += wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+
+    def play(self, path, overlap="preempt", priority="bell"):
+        """Start or queue `path`. Returns its id; raises Busy if it was refused."""
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"overlap must be one of {', '.join(OVERLAP_POLICIES)}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        level = PRIORITIES.index(priority)
+        # Decoding a cold file happens here, in the requesting thread, outside the lock
+        buffer = self.cache.get(path)
+        with self._lock:
+            play_id = next(self._ids)
+            voice = {"id": play_id, "path": path, "buffer": buffer, "pos": 0,
+                     "level": level, "queued_at": time.monotonic()}
+            top = self._top()
+            if level > top:
+                self._start(voice)
+            elif level == top and overlap == "preempt":
+                keep = [v for v in self._voices if v["level"] != level]
+                self._finish([v for v in self._voices if v["level"] == level], "preempted")
+                self._finish(self._queues[level], "preempted")
+                self._voices = keep
+                self._queues[level].clear()
+                self._start(voice)
+            elif level == top and overlap == "mix":
+                self._start(voice)
+            elif len(self._queues[level]) < QUEUE_DEPTH[priority]:
+                self._queues[level].append(voice)
+                self.metrics[priority]["queued"] += 1
+            else:
+                self.metrics[priority]["refused"] += 1
+                playing = PRIORITIES[top]
+                raise Busy(f"a {playing} is playing" if level < top else f"the {priority} queue is full")
+        return play_id
+
+    def stop(self, play_id=None):
+        """Stop everything, or only sound `play_id`. Returns False if that id was not active."""
+        with self._lock:
+            if play_id is None:
+                self._finish(self._voices, "stopped")
+                self._voices = []
+                for queue in self._queues:
+                    self._finish(queue, "stopped")
+                    queue.clear()
+                return True
+            for voice in self._voices:
+                if voice["id"] == play_id:
+                    self._voices.remove(voice)
+                    self._finish([voice], "stopped")
+                    self._dispatch()
+                    return True
+            for queue in self._queues:
+                for voice in queue:
+                    if voice["id"] == play_id:
+                        queue.remove(voice)
+                        self._finish([voice], "stopped")
+                        return True
+        return False
+
+    def lookup(self, play_id):
+        """State of one sound: queued or playing (with position and duration), else how it ended."""
+        rate = self.sink.fmt.rate
+        with self._lock:
+            for voice in self._voices:
+                if voice["id"] == play_id:
+                    return {"id": play_id, "state": "playing",
+                            "position": voice["pos"] / self.frame_bytes / rate,
+                            "duration": len(voice["buffer"]) / self.frame_bytes / rate}
+            for queue in self._queues:
+                for voice in queue:
+                    if voice["id"] == play_id:
+                        return {"id": play_id, "state": "queued",
+                                "duration": len(voice["buffer"]) / self.frame_bytes / rate}
+            return {"id": play_id, "state": self._finished.get(play_id, "unknown")}
+
+    def status(self):
+        rate = self.sink.fmt.rate
+        with self._lock:
+            voices = [{"id": v["id"], "path": v["path"], "priority": PRIORITIES[v["level"]],
+                       "position": v["pos"] / self.frame_bytes / rate} for v in self._voices]
+            queued = [{"id": v["id"], "path": v["path"], "priority": PRIORITIES[level]}
+                      for level in reversed(range(len(PRIORITIES))) for v in self._queues[level]]
+            metrics = {name: dict(m) for name, m in self.metrics.items()}
+        return {"playing": voices[0] if voices else None, "voices": voices, "queued": queued,
+                "played": self.played, "metrics": metrics, "cache": self.cache.stats(),
+                "format": self.sink.fmt._asdict(), "backend": self.sink.name,
+                "latency": self.sink.stats()}
+
+    def _dispatch(self):
+        """Start queued sounds that nothing playing outranks. Caller holds the lock."""
+        for level in reversed(range(len(PRIORITIES))):
+            queue = self._queues[level]
+            while queue and level > self._top():
+                self._start(queue.popleft())
+
+    def _next_chunk(self):
+        with self._lock:
+            if not self._voices:
+                return self._silence
+            top = self._top()
+            chunks, gains = [], []
+            for voice in self._voices:
+                pos = voice["pos"]
+                chunks.append(voice["buffer"][pos:pos + self.chunk_bytes])
+                gains.append(1.0 if voice["level"] == top else DUCK_GAIN)
+                voice["pos"] = pos + len(chunks[-1])
+            live = [v for v in self._voices if v["pos"] < len(v["buffer"])]
+            if len(live) < len(self._voices):
+                self.played += len(self._voices) - len(live)
+                self._finish([v for v in self._voices if v["pos"] >= len(v["buffer"])], "played")
+                self._voices = live
+                self._dispatch()
+        # Buffers are immutable, so mixing can happen outside the lock
+        if len(chunks) == 1 and gains[0] == 1.0:
+            chunk = chunks[0]
+        else:
+            chunk = pcm.mix(chunks, gains)
+        if len(chunk) < self.chunk_bytes:
+            chunk = bytes(chunk) + self._silence[len(chunk):]
+        return chunk
+
+    def run(self):
+        self._running = True
+        self.sink.open()
+        while self._running:
+            # Blocks on the pipe, which paces the loop at the sink's sample rate.
+            self.sink.write(self._next_chunk())
+        self.sink.close()
+
+    def shutdown(self):
+        self._running = False
+
+
+# ---------- socket server ----------
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class EngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, engine, path=SOCKET_PATH):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(str(path), _Handler)
+        self.engine = engine
+
+    def dispatch(self, req):
+        cmd = req.get("cmd")
+        if cmd == "play":
+            path = req.get("path", "")
+            if not os.path.isfile(path):
+                return {"ok": False, "error": f"File not found: {path}"}
+            try:
+                play_id = self.engine.play(path, req.get("overlap") or "preempt",
+                                           req.get("priority") or "bell")
+            except Busy as e:
+                return {"ok": False, "busy": True, "error": str(e)}
+            return {"ok": True, "id": play_id}
+        if cmd == "stop":
+            return {"ok": self.engine.stop(req.get("id"))}
+        if cmd == "status":
+            if req.get("id") is not None:
+                return {"ok": True, **self.engine.lookup(req["id"])}
+            return {"ok": True, **self.engine.status()}
+        if cmd in ("preload", "reload"):
+            if "paths" in req:
+                entries = [(path, None) for path in req["paths"]]
+            else:
+                entries = library()
+            if cmd == "reload":
+                # The files' levels were (re)analyzed; decode them again
+                self.engine.cache.invalidate([path for path, _ in entries])
+            loaded = 0
+            for path, meta in entries:
+                try:
+                    self.engine.cache.get(path, meta)
+                    loaded += 1
+                except (OSError, pcm.WavError) as e:
+                    print(f"[WARN] Preload failed for {path}: {e}", flush=True)
+            return {"ok": True, "loaded": loaded}
+        return {"ok": False, "error": f"Unknown command: {cmd}"}
+
+
+# ---------- client ----------
+
+def request(payload, timeout=2.0):
+    """Send one request to the engine. Returns the reply dict, or None if the
+    engine is not running (no socket, or nothing listening on it).
+
+    Any other failure, a timeout included, is an {"ok": False, ...} reply, never
+    None: the engine may still carry the request out, so a caller must not
+    play the sound some other way."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(SOCKET_PATH))
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except OSError as e:
+            return {"ok": False, "error": f"Cannot connect to the audio engine: {e}"}
+        data = b""
+        try:
+            sock.sendall((json.dumps(payload) + "\n").encode())
+            while not data.endswith(b"\n"):
+                part = sock.recv(65536)
+                if not part:
+                    break
+                data += part
+        except socket.timeout:
+            return {"ok": False, "timeout": True,
+                    "error": f"No reply from the audio engine within {timeout:g}s"}
+        except OSError as e:
+            return {"ok": False, "error": f"Audio engine connection failed: {e}"}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {"ok": False, "error": "Audio engine closed the connection without a reply"}
+
+
+def play(path, overlap=None, priority=None):
+    payload = {"cmd": "play", "path": str(path)}
+    if overlap:
+        payload["overlap"] = overlap
+    if priority:
+        payload["priority"] = priority
+    # The reply comes after a cold file has been decoded
+    return request(payload, timeout=PLAY_TIMEOUT)
+
+
+def _meta(row):
+    analyzed = row["analyzed_sha256"] is not None and row["analyzed_sha256"] == row["sha256"]
+    return {
+        "stamp": (row["mtime_ns"], row["size"]),
+        "info": sound_library.wav_info(row),
+        "gain_db": row["gain_db"] if analyzed else None,
+        "lead_s": row["lead_s"] if analyzed else None,
+        "trail_s": row["trail_s"] if analyzed else None,
+    }
+
+
+def index_entry(path):
+    """Header and loudness analysis for a file in sounds/, or None if it is not indexed."""
+    path = Path(path)
+    if path.parent != SOUNDS_DIR or not sound_library.DB_PATH.exists():
+        return None
+    try:
+        with db.connection(sound_library.DB_PATH) as conn:
+            row = sound_library.get(conn, path.name)
+    except Exception as e:
+        print(f"[WARN] Sound index unavailable: {e}", flush=True)
+        return None
+    return _meta(row) if row is not None and not row["error"] else None
+
+
+def library():
+    """(path, index entry) for every playable sound in the index.
+    Falls back to listing sounds/ if the index cannot be read. The engine
+    never creates bells.db; until the web app has, sounds/ is listed."""
+    try:
+        if not sound_library.DB_PATH.exists():
+            raise FileNotFoundError(sound_library.DB_PATH)
+        with db.connection(sound_library.DB_PATH) as conn:
+            rows = sound_library.list_sounds(conn)
+    except Exception as e:
+        print(f"[WARN] Sound index unavailable ({e}); scanning {SOUNDS_DIR}", flush=True)
+        if not SOUNDS_DIR.exists():
+            return []
+        return [(str(p), None) for p in sorted(SOUNDS_DIR.iterdir()) if p.suffix.lower() == ".wav"]
+    return [(str(SOUNDS_DIR / r["name"]), _meta(r)) for r in rows if not r["error"]]
+
+
+def wait_for_backend(sink):
+    """Block until the backend is installed, re-checking with a growing delay.
+    Returns False if SIGTERM arrives first."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    delay = BACKEND_RETRY
+    while not sink.available:
+        # Without a socket the cron scripts and the scheduler use their fallback player
+        print(f"[WARN] Audio backend '{sink.name}' is not installed; "
+              f"checking again in {delay:.0f}s", flush=True)
+        if stop.wait(delay):
+            return False
+        delay = min(delay * 2, MAX_BACKEND_RETRY)
+    return True
+
+
+def serve():
+    engine = Engine()
+    # Staying up (rather than exiting) keeps systemd from restarting us in a tight loop
+    if not wait_for_backend(engine.sink):
+        return 0
+    server = EngineServer(engine)
+    threading.Thread(target=server.serve_forever, name="engine-socket", daemon=True).start()
+    threading.Thread(target=lambda: server.dispatch({"cmd": "preload"}),
+                     name="engine-preload", daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: engine.shutdown())
+    print(f"[INFO] Audio engine listening on {SOCKET_PATH}", flush=True)
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(SOCKET_PATH)
+        except FileNotFoundError:
+            pass
+    return 0
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ("serve", "play", "status"):
+        print(__doc__.strip().split("Usage:")[1], file=sys.stderr)
+        return 2
+    if argv[1] == "serve":
+        return serve()
+    if argv[1] == "play":
+        options = argv[3:]
+        if len(argv) < 3 or any(o not in OVERLAP_POLICIES + PRIORITIES for o in options):
+            print(f"usage: audio_engine.py play FILE [{'|'.join(OVERLAP_POLICIES)}] "
+                  f"[{'|'.join(PRIORITIES)}]", file=sys.stderr)
+            return 2
+        reply = play(os.path.abspath(argv[2]),
+                     next((o for o in options if o in OVERLAP_POLICIES), None),
+                     next((o for o in options if o in PRIORITIES), None))
+    else:
+        reply = request({"cmd": "status"})
+    if reply is None:
+        print("[ERROR] Audio engine is not running", file=sys.stderr)
+        return EXIT_UNREACHABLE
+    print(json.dumps(reply))
+    return 0 if reply.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
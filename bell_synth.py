@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Bell synthesis.
+Renders bell sounds from additive partial models: each strike is a sum of
+exponentially decaying sine partials (hum, prime, tierce, quint, nominal...)
+and a peal overlays several strikes at a fixed interval. Whole buffers are
+computed at once with NumPy when it is installed; otherwise each partial is
+generated with a two-multiply damped-oscillator recurrence instead of a
+sin()/exp() call per sample. The WAV is written with a single writeframes().
+
+Renders are cached in cache/synth/, keyed by a hash of their parameters, so
+asking for the same bell twice costs a file copy.
+
+Usage:
+    bell_synth.py OUTPUT.wav [--model church] [--pitch 440] [--decay 1.5]
+                             [--strikes 1] [--interval 2.0] [--duration SECONDS]
+"""
+import argparse
+import hashlib
+import json
+import math
+import operator
+import os
+import shutil
+import sys
+import tempfile
+import wave
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+APP_DIR = Path(__file__).resolve().parent
+CACHE_DIR = APP_DIR / "cache" / "synth"
+CACHE_FILES = 100        # renders kept in the cache, least recently used dropped first
+SYNTH_VERSION = 1        # bump when the synthesis changes, to invalidate old renders
+DEFAULT_RATE = 48000     # the audio engine's sink rate, so playback needs no resampling
+PEAK = 0.9               # normalized peak level, leaving a little headroom
+TAIL = math.log(1000.0)  # a partial is rendered until it has decayed by 60 dB
+MAX_DURATION = 120.0
+MAX_STRIKES = 60
+
+# Partial models: (frequency ratio to the pitch, amplitude, decay multiplier)
+MODELS = {
+    # Tuned church bell: hum, prime, tierce, quint, nominal, superquint, octave nominal
+    "church": [(0.5, 0.6, 0.35), (1.0, 0.8, 0.6), (1.2, 0.5, 0.8), (1.5, 0.3, 1.0),
+               (2.0, 1.0, 1.2), (3.0, 0.35, 1.8), (4.0, 0.25, 2.5)],
+    # Handbell: strong fundamental, odd twelfth and a bright upper partial
+    "handbell": [(1.0, 1.0, 1.0), (3.0, 0.35, 2.2), (5.2, 0.12, 3.5)],
+    # The original generate_chime.py major triad (C5 E5 G5 when pitch is 523.25)
+    "chime": [(1.0, 0.3, 1.0), (1.2599, 0.25, 1.0), (1.4983, 0.2, 1.0)],
+}
+
+BellParams = namedtuple("BellParams", "model pitch decay strikes interval duration rate")
+BellParams.__new__.__defaults__ = ("church", 440.0, 1.5, 1, 2.0, None, DEFAULT_RATE)
+
+
+def validate(params):
+    """Raise ValueError if the parameters cannot be rendered sensibly."""
+    if params.model not in MODELS:
+        raise ValueError(f"Unknown bell model: {params.model}")
+    if not 20.0 <= params.pitch <= 5000.0:
+        raise ValueError("Pitch must be between 20 and 5000 Hz")
+    if not 0.05 <= params.decay <= 50.0:
+        raise ValueError("Decay must be between 0.05 and 50 per second")
+    if not 1 <= params.strikes <= MAX_STRIKES:
+        raise ValueError(f"Strikes must be between 1 and {MAX_STRIKES}")
+    if params.strikes > 1 and not 0.05 <= params.interval <= 60.0:
+        raise ValueError("Interval must be between 0.05 and 60 seconds")
+    if params.duration is not None and not 0.05 <= params.duration <= MAX_DURATION:
+        raise ValueError(f"Duration must be between 0.05 and {MAX_DURATION:g} seconds")
+    if not 8000 <= params.rate <= 96000:
+        raise ValueError("Sample rate must be between 8000 and 96000 Hz")
+
+
+def ring_time(params):
+    """Seconds until the slowest partial of one strike has decayed by 60 dB."""
+    slowest = min(mult for _, _, mult in MODELS[params.model])
+    return TAIL / (params.decay * slowest)
+
+
+def total_duration(params):
+    if params.duration is not None:
+        return params.duration
+    return min(MAX_DURATION, (params.strikes - 1) * params.interval + ring_time(params))
+
+
+# ---------- rendering ----------
+
+def _strike_numpy(partials, decay, rate, n):
+    t = np.arange(n) / rate
+    out = np.zeros(n)
+    for freq, amp, mult in partials:
+        m = min(n, int(TAIL / (decay * mult) * rate))
+        out[:m] += amp * np.exp(-decay * mult * t[:m]) * np.sin(2 * math.pi * freq * t[:m])
+    return out
+
+
+def _strike_python(partials, decay, rate, n):
+    out = array("d", bytes(8 * n))
+    for freq, amp, mult in partials:
+        # y[k] = A r^k sin(wk) satisfies y[k] = 2r cos(w) y[k-1] - r^2 y[k-2]
+        r = math.exp(-decay * mult / rate)
+        w = 2 * math.pi * freq / rate
+        c1, c2 = 2 * r * math.cos(w), r * r
+        m = min(n, int(TAIL / (decay * mult) * rate))
+        y2, y1 = 0.0, amp * r * math.sin(w)
+        for k in range(1, m):
+            out[k] += y1
+            y2, y1 = y1, c1 * y1 - c2 * y2
+    return out
+
+
+def _overlay_python(strike, period, strikes, n):
+    """Sum `strikes` copies of `strike` spaced `period` samples apart.
+
+    Output block b (samples b*period .. (b+1)*period) is the sum of
+    strike[j + q*period] over the strikes still ringing, i.e. a difference of
+    two running sums over q. Building those sums touches each strike sample
+    once, so this costs O(len(strike) + n) rather than O(strikes * len(strike)).
+    """
+    blocks = -(-len(strike) // period)
+    padded = strike + array("d", bytes(8 * (blocks * period - len(strike))))
+    sums = [padded[:period]]
+    for q in range(1, blocks):
+        sums.append(array("d", map(operator.add, sums[-1], padded[q * period:(q + 1) * period])))
+    silence = array("d", bytes(8 * period))
+    out = array("d")
+    for b in range(-(-n // period)):
+        ended = b - strikes  # running sum of the strikes that have finished
+        if ended < 0:
+            out.extend(sums[min(b, blocks - 1)])
+        elif ended >= blocks - 1:
+            out.extend(silence)
+        else:
+            out.extend(map(operator.sub, sums[min(b, blocks - 1)], sums[ended]))
+    del out[n:]
+    return out
+
+
+def render(params):
+    """Render `params` to mono 16-bit little-endian PCM bytes."""
+    validate(params)
+    rate = params.rate
+    n_total = max(1, int(total_duration(params) * rate))
+    n_strike = min(n_total, int(ring_time(params) * rate) + 1)
+    # Partials above Nyquist would alias into audible noise
+    partials = [(params.pitch * ratio, amp, mult) for ratio, amp, mult in MODELS[params.model]
+                if params.pitch * ratio < rate / 2]
+    period = max(1, int(round(params.interval * rate)))
+    offsets = [k * period for k in range(params.strikes) if k * period < n_total]
+
+    if np is not None:
+        strike = _strike_numpy(partials, params.decay, rate, n_strike)
+        out = np.zeros(n_total)
+        for off in offsets:
+            m = min(n_strike, n_total - off)
+            out[off:off + m] += strike[:m]
+        peak = float(np.max(np.abs(out))) or 1.0
+        return (out * (PEAK * 32767 / peak)).astype("<i2").tobytes()
+
+    strike = _strike_python(partials, params.decay, rate, n_strike)
+    if len(offsets) > 1:
+        out = _overlay_python(strike, period, len(offsets), n_total)
+    else:
+        out = strike + array("d", bytes(8 * (n_total - n_strike)))
+    peak = max(max(out), -min(out)) or 1.0
+    scale = PEAK * 32767 / peak
+    samples = array("h", map(round, map(scale.__mul__, out)))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def write_wav(path, data, rate):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(data)
+
+
+# ---------- cache ----------
+
+def cache_key(params):
+    blob = json.dumps({"version": SYNTH_VERSION, **params._asdict()}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def _prune_cache(cache_dir):
+    renders = sorted(cache_dir.glob("*.wav"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in renders[CACHE_FILES:]:
+        old.unlink(missing_ok=True)
+
+
+def cached_render(params, cache_dir=CACHE_DIR):
+    """Path of a WAV file for `params`, rendering it only if it is not cached."""
+    validate(params)
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"{cache_key(params)}.wav"
+    if path.exists():
+        os.utime(path)  # mark as recently used
+        return path
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(cache_dir), prefix=".tmp-", suffix=".wav")
+    os.close(fd)
+    try:
+        write_wav(tmp, render(params), params.rate)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _prune_cache(cache_dir)
+    return path
+
+
+def save(params, dest, cache_dir=CACHE_DIR):
+    """Render (or fetch from the cache) and copy the result to `dest`."""
+    src = cached_render(params, cache_dir)
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(dest.parent), prefix=".tmp-", suffix=".wav")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return dest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a bell sound to a WAV file")
+    parser.add_argument("output")
+    parser.add_argument("--model", default="church", choices=sorted(MODELS))
+    parser.add_argument("--pitch", type=float, default=440.0, help="Hz")
+    parser.add_argument("--decay", type=float, default=1.5, help="decay rate per second")
+    parser.add_argument("--strikes", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between strikes")
+    parser.add_argument("--duration", type=float, default=None, help="seconds (default: until the bell dies away)")
+    parser.add_argument("--rate", type=int, default=DEFAULT_RATE)
+    args = parser.parse_args(argv)
+    params = BellParams(args.model, args.pitch, args.decay, args.strikes, args.interval, args.duration, args.rate)
+    try:
+        save(params, args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"✓ Bell rendered: {args.output} ({total_duration(params):.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
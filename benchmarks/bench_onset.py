@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Bell-onset latency benchmark.
+Fires a test bell hundreds of times through the real scheduling and
+playback code and measures how long after its scheduled time the first
+audible frame reaches the (fake) sink. Needs no sound hardware: pw-play and
+pw-cat are replaced by benchmarks/fake_sink.py on PATH.
+
+Scenarios (each optionally with the audio engine running, suffix -engine):
+    cron        the crontab entry sync_cron.py builds, run via /bin/sh the
+                way cron would, i.e. play_cron_sound.sh
+    scheduler   scheduler.Scheduler's timer loop and play_alarm()
+    preview     app.preview_player, as used by the Test button (needs Flask)
+
+Absolute numbers include the fake sink's own interpreter start-up, so
+compare runs against each other rather than against real hardware.
+
+Usage:
+    python3 benchmarks/bench_onset.py [--fires 200] [--interval 0.3]
+                                      [--scenarios cron,scheduler-engine] [--json]
+"""
+import argparse
+import contextlib
+import heapq
+import json
+import math
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent
+SCENARIOS = ["cron", "cron-engine", "scheduler", "scheduler-engine", "preview", "preview-engine"]
+
+
+def write_test_bell(path, lead_silence=0.0, rate=44100):
+    """100 ms 880 Hz burst after `lead_silence` seconds of digital silence."""
+    lead = int(rate * lead_silence)
+    tone = int(rate * 0.1)
+    samples = array("h", bytes(2 * lead))
+    samples.extend(int(12000 * math.sin(2 * math.pi * 880 * i / rate)) for i in range(tone))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+
+def setup_environment(work):
+    """Put the fake sink on PATH and point every socket/log/database at the work dir."""
+    fakebin = work / "bin"
+    fakebin.mkdir()
+    for name in ("pw-play", "pw-cat"):
+        (fakebin / name).symlink_to(BENCH_DIR / "fake_sink.py")
+    os.chmod(BENCH_DIR / "fake_sink.py", 0o755)
+    os.environ["PATH"] = f"{fakebin}{os.pathsep}{os.environ['PATH']}"
+    os.environ["CHURCHBELL_FAKE_SINK_LOG"] = str(work / "sink.log")
+    os.environ["CHURCHBELL_AUDIO_SOCKET"] = str(work / "audio.sock")
+    os.environ["CHURCHBELL_PWPLAY"] = str(fakebin / "pw-play")
+    os.environ["CHURCHBELL_CRON_LOG"] = str(work / "cron_alarm.log")
+    os.environ["CHURCHBELL_DB"] = str(work / "bells.db")
+    sys.path.insert(0, str(APP_DIR))
+
+
+def start_engine(work, sound):
+    import audio_engine
+    proc = subprocess.Popen([sys.executable, str(APP_DIR / "audio_engine.py"), "serve"],
+                            stdout=open(work / "engine.log", "a"), stderr=subprocess.STDOUT)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        reply = audio_engine.request({"cmd": "preload", "paths": [str(sound)]})
+        if reply and reply.get("ok"):
+            # Let the engine settle into its idle silence loop
+            time.sleep(0.5)
+            return proc
+        time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("audio engine did not start")
+
+
+def sleep_until(ts):
+    while True:
+        remaining = ts - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 0.05) if remaining > 0.002 else 0)
+
+
+# ---------- scenarios: each fires at the given wall-clock times ----------
+
+def run_cron(times, sound, work):
+    import recurrence
+    import sync_cron
+    row = {"id": 1, "day_of_week": 0, "time_str": "00:00", "sound_path": str(sound)}
+    entry = sync_cron.build_cron_lines([recurrence.Rule(row)])[0].splitlines()[1]
+    command = entry.split(None, 5)[5]
+    if not os.access(sync_cron.PLAY_SCRIPT, os.X_OK):
+        # Fresh checkouts lack the executable bit that install.sh sets
+        command = f"bash {command}"
+    procs = []
+    for ts in times:
+        sleep_until(ts)
+        procs.append(subprocess.Popen(["/bin/sh", "-c", command]))
+    for p in procs:
+        p.wait()
+
+
+def run_scheduler(times, sound, work):
+    import scheduler
+
+    class BenchScheduler(scheduler.Scheduler):
+        """Scheduler that also rings the test bell once at each of `times`.
+        These entries use negative ids so they never collide with table rows."""
+
+        def load_all(self, now=None):
+            super().load_all(now)
+            for i, ts in enumerate(times, 1):
+                self._alarms[-i] = {"id": -i, "sound_path": str(sound)}
+                self._generation[-i] = 1
+                heapq.heappush(self._heap, (ts, -i, 1))
+
+        def _schedule(self, alarm_id, after):
+            if alarm_id > 0:
+                super()._schedule(alarm_id, after)
+
+    db = work / "sched.db"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE IF NOT EXISTS alarms (id INTEGER PRIMARY KEY, day_of_week INTEGER,"
+                 " time_str TEXT, sound_path TEXT, enabled INTEGER)")
+    conn.close()
+    sched = BenchScheduler(fire=scheduler.play_alarm, db_path=db)
+    thread = threading.Thread(target=sched.run, daemon=True)
+    thread.start()
+    sleep_until(times[-1] + 1.0)
+    sched.stop()
+    thread.join()
+    for p in sched._players:
+        p.wait()
+
+
+def run_preview(times, sound, work):
+    import app
+    started = []
+    for ts in times:
+        sleep_until(ts)
+        started.append(app.preview_player.start(str(sound)))
+    for preview in started:
+        if preview.proc is not None:
+            preview.proc.wait()
+
+
+RUNNERS = {"cron": run_cron, "scheduler": run_scheduler, "preview": run_preview}
+
+
+# ---------- measurement ----------
+
+def read_onsets(log_path, offset):
+    onsets = []
+    with open(log_path) as f:
+        f.seek(offset)
+        for line in f:
+            onset = json.loads(line).get("onset")
+            if onset is not None:
+                onsets.append(onset)
+    return sorted(onsets)
+
+
+def match(times, onsets, interval):
+    """Pair each scheduled time with the first onset inside its interval."""
+    latencies = []
+    j = 0
+    for ts in times:
+        while j < len(onsets) and onsets[j] < ts:
+            j += 1
+        if j < len(onsets) and onsets[j] < ts + interval:
+            latencies.append(onsets[j] - ts)
+            j += 1
+    return latencies
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(name, fires, latencies):
+    ms = [v * 1000 for v in latencies]
+    result = {"scenario": name, "fires": fires, "missed": fires - len(ms)}
+    if ms:
+        result.update(
+            p50=percentile(ms, 50), p95=percentile(ms, 95), p99=percentile(ms, 99),
+            max=max(ms), jitter=statistics.pstdev(ms),
+        )
+    return result
+
+
+def run_scenario(name, args, sound, work):
+    base, _, engine = name.partition("-")
+    log_path = Path(os.environ["CHURCHBELL_FAKE_SINK_LOG"])
+    log_path.touch()
+    engine_proc = start_engine(work, sound) if engine else None
+    try:
+        offset = log_path.stat().st_size
+        start = time.time() + 1.0
+        times = [start + i * args.interval for i in range(args.fires)]
+        # Keep the app/scheduler debug prints out of the results table
+        with open(work / "scenario.log", "a") as log, contextlib.redirect_stdout(log):
+            RUNNERS[base](times, sound, work)
+        time.sleep(args.interval)
+        return summarize(name, args.fires, match(times, read_onsets(log_path, offset), args.interval))
+    finally:
+        if engine_proc:
+            engine_proc.terminate()
+            engine_proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bell-onset latency benchmark")
+    parser.add_argument("--fires", type=int, default=200, help="bells per scenario")
+    parser.add_argument("--interval", type=float, default=0.3, help="seconds between bells")
+    parser.add_argument("--lead-silence", type=float, default=0.0,
+                        help="seconds of silence before the tone in the test bell")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="churchbell-bench-"))
+    setup_environment(work)
+    sound = work / "bench_bell.wav"
+    write_test_bell(sound, args.lead_silence)
+
+    results = []
+    for name in args.scenarios.split(","):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+        try:
+            results.append(run_scenario(name, args, sound, work))
+        except ImportError as e:
+            results.append({"scenario": name, "skipped": str(e)})
+        if not args.json:
+            print_row(results[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+def print_row(result):
+    if not getattr(print_row, "header", False):
+        print(f"{'scenario':<20}{'fires':>6}{'missed':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'jitter':>9}  (ms)")
+        print_row.header = True
+    if "skipped" in result:
+        print(f"{result['scenario']:<20}skipped: {result['skipped']}")
+    elif "p50" not in result:
+        print(f"{result['scenario']:<20}{result['fires']:>6}{result['missed']:>7}  no onsets recorded")
+    else:
+        print(f"{result['scenario']:<20}{result['fires']:>6}{result['missed']:>7}"
+              f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}"
+              f"{result['max']:>9.1f}{result['jitter']:>9.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
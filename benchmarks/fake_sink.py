@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Stand-in for pw-play / pw-cat used by the onset-latency benchmarks.
+Install it on PATH under either name (bench_onset.py does this with
+symlinks). Instead of producing sound it appends one JSON line per bell to
+$CHURCHBELL_FAKE_SINK_LOG with the wall-clock time of the first non-silent
+frame:
+
+    pw-play FILE        onset = process start + offset of the first loud frame
+    pw-cat ... -        raw s16 stream on stdin, consumed in real time; one
+                        record per silence -> sound transition
+"""
+import json
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+
+STARTED = time.time()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import pcm  # noqa: E402
+
+THRESHOLD = 64  # |sample| above this (16-bit scale) counts as audible
+LOG_PATH = os.getenv("CHURCHBELL_FAKE_SINK_LOG", "fake_sink.log")
+
+
+def record(**fields):
+    with open(LOG_PATH, "a") as f:
+        f.write(json.dumps(fields) + "\n")
+
+
+def first_loud_sample(data, width):
+    """Index of the first sample above THRESHOLD, or None."""
+    if width == 2:
+        samples = array("h")
+        samples.frombytes(bytes(data[:len(data) - len(data) % 2]))
+        if sys.byteorder == "big":
+            samples.byteswap()
+        for i, s in enumerate(samples):
+            if abs(s) > THRESHOLD:
+                return i
+        return None
+    # Other widths: compare the most significant byte only
+    threshold = THRESHOLD >> 8 or 1
+    for i in range(0, len(data) - width + 1, width):
+        top = int.from_bytes(data[i:i + width], "little", signed=width > 1) >> (8 * (width - 1))
+        if width == 1:
+            top -= 128
+        if abs(top) >= threshold:
+            return i // width
+    return None
+
+
+def play_file(path):
+    info, data = pcm.read_frames(path)
+    index = first_loud_sample(data, info.width)
+    if index is None:
+        record(tool="pw-play", file=path, onset=None)
+        return 0
+    offset = (index // info.channels) / info.rate
+    record(tool="pw-play", file=path, onset=STARTED + offset, startup=time.time() - STARTED)
+    return 0
+
+
+def play_stream(rate, channels):
+    frame_bytes = 2 * channels
+    chunk = frame_bytes * max(1, rate // 100)
+    stream = sys.stdin.buffer
+    silent = True
+    clock = time.monotonic()
+    while True:
+        data = stream.read(chunk)
+        if not data:
+            return 0
+        received = time.time()
+        index = first_loud_sample(data, 2)
+        if index is not None and silent:
+            record(tool="pw-cat", onset=received + (index // channels) / rate)
+        silent = index is None
+        # Consume at the sample rate, like a real sink draining its buffer
+        clock += len(data) / frame_bytes / rate
+        delay = clock - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            clock = time.monotonic()
+
+
+def option(args, name, default):
+    if name in args:
+        return args[args.index(name) + 1]
+    return default
+
+
+def main(argv):
+    args = argv[1:]
+    if "--playback" in args or os.path.basename(argv[0]) == "pw-cat":
+        return play_stream(int(option(args, "--rate", 48000)), int(option(args, "--channels", 2)))
+    files = [a for a in args if not a.startswith("-")]
+    if not files:
+        print("fake_sink: no file given", file=sys.stderr)
+        return 1
+    return play_file(files[-1])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
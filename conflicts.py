@@ -0,0 +1,105 @@
+"""
+Overlap detection between bells.
+Every occurrence becomes an interval [fire time, fire time + clip length).
+IntervalIndex keeps them sorted by start together with the longest interval
+length L: anything overlapping [start, end) must start before `end` and after
+`start - L`, so two bisections bound the scan. Checking one occurrence costs
+O(log n) plus the intervals starting in that window, which for bell clips of
+at most a few minutes is the overlaps it reports and a few neighbours.
+
+What actually happens when bells overlap is decided at fire time by the
+audio engine's overlap policy (see audio_engine.OVERLAP_POLICIES).
+"""
+import bisect
+import heapq
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import recurrence
+
+DEFAULT_DURATION = 5.0  # seconds assumed for a clip whose length is unknown
+LOOKAHEAD_DAYS = 366    # how far to look for the next bell of a rule outside the window
+
+Interval = namedtuple("Interval", "start end alarm_id sound")
+
+
+def interval(ts, alarm_id, sound, duration):
+    return Interval(ts, ts + (duration or DEFAULT_DURATION), alarm_id, sound)
+
+
+class IntervalIndex:
+    """Immutable set of intervals answering "what overlaps [start, end)?"."""
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.starts = [iv.start for iv in self.intervals]
+        self.longest = max((iv.end - iv.start for iv in self.intervals), default=0.0)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def overlapping(self, start, end, exclude=None):
+        """Intervals overlapping [start, end), latest first; `exclude` skips one alarm id."""
+        # No interval is longer than self.longest, so one starting at or
+        # before start - longest has ended by `start`
+        lo = bisect.bisect_right(self.starts, start - self.longest)
+        hi = bisect.bisect_left(self.starts, end)
+        return [iv for iv in reversed(self.intervals[lo:hi])
+                if iv.end > start and iv.alarm_id != exclude]
+
+    def overlaps(self):
+        """Every overlapping pair (a, b) with a starting first, by a sweep over the starts."""
+        pairs = []
+        active = []  # (end, interval) of intervals still sounding
+        for iv in self.intervals:
+            while active and active[0][0] <= iv.start:
+                heapq.heappop(active)
+            pairs.extend((other, iv) for _, other in active if other.alarm_id != iv.alarm_id)
+            heapq.heappush(active, (iv.end, iv))
+        return pairs
+
+
+def durations(conn):
+    """{sound file name: length in seconds} from the sound index."""
+    return dict(conn.execute("SELECT name, duration FROM sounds WHERE duration IS NOT NULL").fetchall())
+
+
+def rule_intervals(rule, t1, t2, duration):
+    sound = Path(rule.row["sound_path"]).name
+    return [interval(ts, rule.id, sound, duration) for ts, _ in rule.occurrences(t1, t2)]
+
+
+def check_rule(conn, rule, index, t1, t2, lengths=None):
+    """Conflicts for one alarm: [(its Interval, [overlapping Intervals])].
+
+    Occurrences in [t1, t2) are looked up in `index`, which covers that
+    window. A rule with no bell in the window (a monthly or one-time alarm
+    further out) has its next bell checked against the alarms around it.
+    """
+    lengths = durations(conn) if lengths is None else lengths
+    duration = lengths.get(Path(rule.row["sound_path"]).name)
+    own = rule_intervals(rule, t1, t2, duration)
+    if own:
+        found = [(iv, index.overlapping(iv.start, iv.end, exclude=rule.id)) for iv in own]
+        return [(iv, hits) for iv, hits in found if hits]
+    ts = rule.next_after(t2)
+    if ts is None or ts > t2 + LOOKAHEAD_DAYS * 86400:
+        return []
+    mine = interval(ts, rule.id, Path(rule.row["sound_path"]).name, duration)
+    longest = max([DEFAULT_DURATION, *lengths.values()])
+    nearby = IntervalIndex(
+        interval(other_ts, other.id, Path(other.row["sound_path"]).name,
+                 lengths.get(Path(other.row["sound_path"]).name))
+        for other_ts, other in recurrence.occurrences_between(conn, ts - longest, mine.end)
+    )
+    hits = nearby.overlapping(mine.start, mine.end, exclude=rule.id)
+    return [(mine, hits)] if hits else []
+
+
+def describe(pair):
+    """One line for a report about an (earlier, later) pair of Intervals."""
+    a, b = pair
+    def fmt(iv):
+        return f"{datetime.fromtimestamp(iv.start):%a %Y-%m-%d %H:%M} {iv.sound} (alarm {iv.alarm_id})"
+    return f"{fmt(b)} starts {b.start - a.start:.0f}s into {fmt(a)}, which plays until {datetime.fromtimestamp(a.end):%H:%M:%S}"
@@ -0,0 +1,125 @@
+"""
+SQLite access shared by the web app, the scheduler and sync_cron.py.
+Connections are opened once, tuned with the pragmas below and kept in a
+small pool, so a request or a schedule sync borrows a warm connection
+(with its prepared-statement cache) instead of opening the file again.
+The database runs in WAL mode: readers never block the writer, and a
+writer waits up to BUSY_TIMEOUT instead of failing with "database is locked".
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = Path(os.getenv("CHURCHBELL_DB", APP_DIR / "bells.db"))
+
+BUSY_TIMEOUT = 5.0        # seconds a connection waits for a lock
+POOL_SIZE = int(os.getenv("CHURCHBELL_DB_POOL", "4"))  # idle connections kept per database
+CACHED_STATEMENTS = 256   # prepared statements kept per connection
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",   # durable at checkpoints; safe with WAL
+    "PRAGMA cache_size = -8192",     # 8 MiB page cache
+    "PRAGMA mmap_size = 67108864",   # 64 MiB of the file read through mmap
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}",
+)
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_alarms_enabled_day_time ON alarms (enabled, day_of_week, time_str)",
+    # date bounds for recurrence.occurrences_between()
+    "CREATE INDEX IF NOT EXISTS idx_alarms_window ON alarms (enabled, end_date, start_date)",
+    "CREATE INDEX IF NOT EXISTS idx_user_permissions_user ON user_permissions (user_id)",
+)
+
+
+def connect(path=DB_PATH):
+    """Open a new tuned connection. Most callers want connection() instead."""
+    conn = sqlite3.connect(
+        str(path),
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.OperationalError as e:
+            # e.g. WAL on a read-only directory; the connection still works
+            print(f"[WARN] {pragma} failed: {e}")
+    return conn
+
+
+class ConnectionPool:
+    """Idle connections to one database file, handed out one borrower at a time."""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.path)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool(path=DB_PATH):
+    key = str(Path(path).resolve())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(path)
+        return _pools[key]
+
+
+@contextmanager
+def connection(path=DB_PATH):
+    """Borrow a pooled connection. Uncommitted work is rolled back on return."""
+    p = pool(path)
+    conn = p.acquire()
+    try:
+        yield conn
+    finally:
+        p.release(conn)
+
+
+def ensure_indexes(conn):
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+def add_columns(conn, table, columns):
+    """Add whichever of `columns` ({name: declaration}) `table` does not have yet."""
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
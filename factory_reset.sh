@@ -18,6 +18,8 @@ LOG_DIR="/var/log/churchbell"
 LOGFILE="${LOG_DIR}/factory_reset.log"
 SERVICE_NAME="churchbell.service"
 HOME_SERVICE_NAME="churchbell-home.service"
+SCHEDULER_SERVICE_NAME="churchbell-scheduler.service"
+AUDIO_SERVICE_NAME="churchbell-audio.service"
 PURGE=false
 
 # Parse arguments
@@ -34,6 +36,7 @@ echo "=== Factory reset started at $(date) ===" | tee -a "$LOGFILE"
 # Stop services
 systemctl stop "$SERVICE_NAME" || true
 systemctl stop "$HOME_SERVICE_NAME" || true
+systemctl stop "$SCHEDULER_SERVICE_NAME" || true
 
 # Purge mode
 if [ "$PURGE" = true ]; then
@@ -46,7 +49,7 @@ fi
 
 # Reset database and cron
 echo "[INFO] Resetting database..." | tee -a "$LOGFILE"
-rm -f "$APP_DIR/bells.db"
+rm -f "$APP_DIR/bells.db" "$APP_DIR/bells.db-wal" "$APP_DIR/bells.db-shm"
 
 PYTHON_BIN="$APP_DIR/venv/bin/python"
 if [ ! -x "$PYTHON_BIN" ]; then
@@ -55,10 +58,12 @@ fi
 
 cd "$APP_DIR"
 $PYTHON_BIN -c "import app; app.init_db()" >> "$LOGFILE" 2>&1 || true
-$PYTHON_BIN "$APP_DIR/sync_cron.py" >> "$LOGFILE" 2>&1 || true
+$PYTHON_BIN "$APP_DIR/sync_cron.py" --force >> "$LOGFILE" 2>&1 || true
 
 # Restart service
 systemctl start "$SERVICE_NAME"
 systemctl start "$HOME_SERVICE_NAME"
+systemctl start "$SCHEDULER_SERVICE_NAME" || true
+systemctl start "$AUDIO_SERVICE_NAME" || true
 
 echo "=== Factory reset completed at $(date) ===" | tee -a "$LOGFILE"
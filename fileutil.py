@@ -0,0 +1,15 @@
+"""
+Small file helpers shared by the sound index and the backups.
+"""
+import hashlib
+
+READ_CHUNK = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of a file's contents as hex, read in READ_CHUNK pieces."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -24,6 +24,8 @@ fi
 
 SERVICE_FILE="/etc/systemd/system/churchbell.service"
 HOME_SERVICE_FILE="/etc/systemd/system/churchbell-home.service"
+SCHEDULER_SERVICE_FILE="/etc/systemd/system/churchbell-scheduler.service"
+AUDIO_SERVICE_FILE="/etc/systemd/system/churchbell-audio.service"
 # Use the current user as the service user (no separate service user)
 SERVICE_USER="${CHURCHBELL_SERVICE_USER:-$(whoami)}"
 ADMIN_USER="${CHURCHBELL_ADMIN_USER:-admin}"
@@ -62,6 +64,8 @@ sudo mkdir -p "$APP_DIR"
 sudo rsync -a \
     --exclude "venv" \
     --exclude "bells.db" \
+    --exclude "bells.db-wal" \
+    --exclude "bells.db-shm" \
     --exclude "sounds" \
     --exclude "backups" \
     "$SOURCE_DIR"/ "$APP_DIR"/
@@ -105,6 +109,8 @@ source venv/bin/activate
 echo "[6/12] Installing Python packages..."
 pip install --upgrade pip
 pip install flask
+# Optional: speeds up bell synthesis and sound conversion
+pip install numpy || echo "[WARN] numpy not installed - using the slower pure-Python code paths"
 
 # ------------------------------------------------------------
 # 6b. Generate default chime sound
@@ -129,7 +135,7 @@ fi
 # 7. Permissions for scripts
 # ------------------------------------------------------------
 echo "[7/12] Setting script permissions..."
-SCRIPTS=(install.sh update.sh sync_cron.py update_play_alarm_path.py play_alarm.sh play_cron_sound.sh generate_ssl_cert.sh cleanup_ssl_certs.sh factory_reset.sh postinstall.sh list_alarms.sh uninstall.sh generate_chime.py)
+SCRIPTS=(install.sh update.sh sync_cron.py scheduler.py audio_engine.py update_play_alarm_path.py play_alarm.sh play_cron_sound.sh generate_ssl_cert.sh cleanup_ssl_certs.sh factory_reset.sh postinstall.sh list_alarms.sh uninstall.sh generate_chime.py bell_synth.py)
 for script in "${SCRIPTS[@]}"; do
   if [ -f "$APP_DIR/$script" ]; then
     chmod +x "$APP_DIR/$script"
@@ -194,11 +200,50 @@ NoNewPrivileges=true
 WantedBy=multi-user.target
 EOF
 
+sudo bash -c "cat > $AUDIO_SERVICE_FILE" <<EOF
+[Unit]
+Description=ChurchBell Audio Engine
+After=sound.target pipewire.service pipewire-pulse.service
+Wants=pipewire.service pipewire-pulse.service
+
+[Service]
+User=$SERVICE_USER
+WorkingDirectory=$APP_DIR
+Environment="XDG_RUNTIME_DIR=/run/user/${SERVICE_UID}"
+ExecStart=$APP_DIR/venv/bin/python audio_engine.py serve
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo bash -c "cat > $SCHEDULER_SERVICE_FILE" <<EOF
+[Unit]
+Description=ChurchBell Bell Scheduler
+After=network.target sound.target time-sync.target churchbell-audio.service
+Wants=churchbell-audio.service
+
+[Service]
+User=$SERVICE_USER
+WorkingDirectory=$APP_DIR
+Environment="XDG_RUNTIME_DIR=/run/user/${SERVICE_UID}"
+ExecStart=$APP_DIR/venv/bin/python scheduler.py
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 sudo systemctl daemon-reload
 sudo systemctl enable churchbell.service
 sudo systemctl enable churchbell-home.service
+sudo systemctl enable churchbell-scheduler.service
+sudo systemctl enable churchbell-audio.service
+sudo systemctl restart churchbell-audio.service
 sudo systemctl restart churchbell.service
 sudo systemctl restart churchbell-home.service
+sudo systemctl restart churchbell-scheduler.service
 
 # ------------------------------------------------------------
 # 10. PipeWire audio setup (required for Pi3)
@@ -236,7 +281,7 @@ sudo systemctl start cron
 
 echo "Syncing cron with current alarms..."
 cd "$APP_DIR"
-python3 sync_cron.py || true
+python3 sync_cron.py --force || true
 
 echo "Updating play_alarm.sh with correct project path..."
 python3 update_play_alarm_path.py || true
@@ -246,8 +291,10 @@ python3 update_play_alarm_path.py || true
 # ------------------------------------------------------------
 echo "[12/12] Performing final service restart..."
 sudo systemctl daemon-reload
+sudo systemctl restart churchbell-audio.service
 sudo systemctl restart churchbell.service
 sudo systemctl restart churchbell-home.service
+sudo systemctl restart churchbell-scheduler.service
 sleep 2  # Brief pause to ensure services are fully started
 echo "[OK] Services restarted with all configurations"
 
@@ -0,0 +1,163 @@
+"""
+Background jobs for long-running work (backups, exports, restores).
+Jobs run on a small thread pool so the request that starts one returns at
+once. Each job has an ID, reports progress as bytes and entries processed,
+and can be cancelled; the work function checks for cancellation every time
+it reports progress.
+"""
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 2
+KEEP_FINISHED = 50  # finished jobs kept around for status queries
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, kind, description=""):
+        self.id = job_id
+        self.kind = kind
+        self.description = description
+        self.state = QUEUED
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.entries_done = 0
+        self.entries_total = 0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def set_total(self, nbytes=None, entries=None):
+        with self._lock:
+            if nbytes is not None:
+                self.bytes_total = nbytes
+            if entries is not None:
+                self.entries_total = entries
+
+    def progress(self, nbytes=0, entries=0, message=None):
+        """Record work done; raises JobCancelled once cancel() has been called."""
+        with self._lock:
+            self.bytes_done += nbytes
+            self.entries_done += entries
+            if message is not None:
+                self.message = message
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def to_dict(self):
+        with self._lock:
+            percent = None
+            if self.bytes_total:
+                percent = min(100.0, 100.0 * self.bytes_done / self.bytes_total)
+            elif self.entries_total:
+                percent = min(100.0, 100.0 * self.entries_done / self.entries_total)
+            if self.state == DONE:
+                percent = 100.0
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "description": self.description,
+                "state": self.state,
+                "active": self.active,
+                "message": self.message,
+                "result": self.result,
+                "error": self.error,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.bytes_total,
+                "entries_done": self.entries_done,
+                "entries_total": self.entries_total,
+                "percent": percent,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, description="", **kwargs):
+        """Run fn(job, *args, **kwargs) in the pool. Its return value becomes job.result."""
+        with self._lock:
+            job = Job(f"{int(time.time())}-{next(self._ids)}", kind, description)
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            job.state, job.finished = CANCELLED, time.time()
+            return
+        job.state, job.started = RUNNING, time.time()
+        print(f"[INFO] Job {job.id} ({job.kind}) started", flush=True)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.state = DONE
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+            print(f"[ERROR] Job {job.id} ({job.kind}) failed: {traceback.format_exc()}", flush=True)
+        job.finished = time.time()
+        print(f"[INFO] Job {job.id} ({job.kind}) {job.state} in {job.finished - job.started:.1f}s", flush=True)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kinds=None, active_only=False):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j for j in jobs
+                if (kinds is None or j.kind in kinds) and (j.active or not active_only)]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel()
+        return True
+
+    def shutdown(self, wait=False):
+        for job in self.list(active_only=True):
+            job.cancel()
+        self._pool.shutdown(wait=wait)
@@ -14,6 +14,7 @@ else
     APP_DIR="$CHURCHBELL_APP_DIR"
 fi
 sqlite3 "$APP_DIR/bells.db" <<EOF
+.timeout 5000
 .headers on
 .mode column
 SELECT id, day_of_week, time_str, sound_path, enabled
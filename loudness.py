@@ -0,0 +1,124 @@
+"""
+Loudness analysis for the sound library.
+Each sound is measured once (peak and RMS level, and how much silence it
+starts and ends with) and the results are stored in the sounds table next to
+the hash they were measured from. The audio engine turns them into a per-clip
+gain towards TARGET_DBFS and trims the silence, so clips play at a similar
+level and a bell's audible onset lands on the scheduled second.
+
+analyze_pending() only looks at sounds whose hash changed since they were
+last measured; app.py runs it as a background job.
+"""
+import math
+import operator
+import os
+
+import pcm
+
+TARGET_DBFS = float(os.getenv("CHURCHBELL_TARGET_DBFS", "-20"))  # RMS level clips are brought to
+PEAK_CEILING_DBFS = -1.0  # gain never pushes a clip's peak above this
+MAX_GAIN_DB = 12.0        # limit for both boost and cut
+SILENCE_DBFS = -60.0      # samples quieter than this count as silence
+ONSET_PAD = 0.005         # seconds kept before the first audible sample
+BLOCK = 4096              # samples per block when searching for the onset without NumPy
+
+FULL_SCALE = 32768.0
+
+
+def to_dbfs(level):
+    return 20 * math.log10(level / FULL_SCALE) if level > 0 else None
+
+
+def _first_loud(samples, threshold, reverse=False):
+    """Index of the first (or last) sample louder than `threshold`, or None."""
+    n = len(samples)
+    starts = range(((n - 1) // BLOCK) * BLOCK, -1, -BLOCK) if reverse else range(0, n, BLOCK)
+    for start in starts:
+        block = samples[start:start + BLOCK]
+        if max(block) > threshold or -min(block) > threshold:
+            indexes = range(len(block) - 1, -1, -1) if reverse else range(len(block))
+            for i in indexes:
+                if abs(block[i]) > threshold:
+                    return start + i
+    return None
+
+
+def measure(samples, channels, rate):
+    """Levels of int16 `samples`. RMS is taken over the audible part only."""
+    threshold = FULL_SCALE * 10 ** (SILENCE_DBFS / 20)
+    frames = len(samples) // channels
+    if pcm.np is not None:
+        loud = pcm.np.flatnonzero(pcm.np.abs(samples.astype(pcm.np.int32)) > threshold)
+        first, last = (int(loud[0]), int(loud[-1])) if len(loud) else (None, None)
+    else:
+        first = _first_loud(samples, threshold)
+        last = _first_loud(samples, threshold, reverse=True) if first is not None else None
+    if first is None:
+        return {"peak_db": None, "rms_db": None, "gain_db": 0.0,
+                "lead_s": 0.0, "trail_s": 0.0}
+
+    first_frame, last_frame = first // channels, last // channels
+    audible = samples[first_frame * channels:(last_frame + 1) * channels]
+    if pcm.np is not None:
+        wide = audible.astype(pcm.np.float64)
+        peak = float(pcm.np.max(pcm.np.abs(wide)))
+        rms = math.sqrt(float(pcm.np.mean(wide * wide)))
+    else:
+        peak = float(max(max(audible), -min(audible)))
+        rms = math.sqrt(sum(map(operator.mul, audible, audible)) / len(audible))
+
+    peak_db, rms_db = to_dbfs(peak), to_dbfs(rms)
+    gain = min(TARGET_DBFS - rms_db, PEAK_CEILING_DBFS - peak_db)
+    return {
+        "peak_db": peak_db,
+        "rms_db": rms_db,
+        "gain_db": max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain)),
+        "lead_s": max(0.0, first_frame / rate - ONSET_PAD),
+        "trail_s": (frames - last_frame - 1) / rate,
+    }
+
+
+def analyze(path):
+    info, data = pcm.read_frames(path)
+    return measure(pcm.to_samples(data, info.width), info.channels, info.rate)
+
+
+def pending(conn):
+    """Indexed sounds never measured, or changed since they were."""
+    return conn.execute(
+        """
+        SELECT name, sha256 FROM sounds
+        WHERE error IS NULL AND (analyzed_sha256 IS NULL OR analyzed_sha256 != sha256)
+        ORDER BY name
+        """
+    ).fetchall()
+
+
+def analyze_pending(conn, sounds_dir, job=None):
+    """Measure every pending sound. Returns the names whose levels were stored."""
+    rows = pending(conn)
+    if job:
+        job.set_total(entries=len(rows))
+    done = []
+    for row in rows:
+        try:
+            levels = analyze(os.path.join(sounds_dir, row["name"]))
+        except (OSError, pcm.WavError) as e:
+            print(f"[WARN] Could not analyze {row['name']}: {e}", flush=True)
+        else:
+            # Skip the update if the file was re-indexed while it was being measured
+            cur = conn.execute(
+                """
+                UPDATE sounds
+                SET peak_db = :peak_db, rms_db = :rms_db, gain_db = :gain_db,
+                    lead_s = :lead_s, trail_s = :trail_s, analyzed_sha256 = :sha256
+                WHERE name = :name AND sha256 = :sha256
+                """,
+                {**levels, "name": row["name"], "sha256": row["sha256"]},
+            )
+            conn.commit()
+            if cur.rowcount:
+                done.append(row["name"])
+        if job:
+            job.progress(entries=1, message=f"Analyzed {row['name']}")
+    return done
@@ -0,0 +1,318 @@
+"""
+PCM helpers shared by the playback engine and anything that renders audio.
+Parses WAV headers directly (including WAVE_FORMAT_EXTENSIBLE, which the
+wave module rejects on older Pythons) and converts sample data between
+formats. NumPy is used when it is installed; otherwise the conversions fall
+back to the standard library, which is slower but only runs once per file.
+"""
+import mmap
+import operator
+import os
+import struct
+import sys
+import tempfile
+import wave
+from array import array
+from collections import namedtuple
+from itertools import chain, repeat
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+PcmFormat = namedtuple("PcmFormat", "rate channels width")
+WavInfo = namedtuple("WavInfo", "rate channels width frames data_offset data_size")
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavError(ValueError):
+    pass
+
+
+def wav_info(path):
+    """Parse the RIFF header of a PCM WAV file without reading the samples."""
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise WavError(f"{path}: not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise WavError(f"{path}: no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size + (size & 1))
+                tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]
+                if tag != WAVE_FORMAT_PCM:
+                    raise WavError(f"{path}: unsupported WAV encoding 0x{tag:04x}")
+                if bits not in (8, 16, 24, 32) or not channels:
+                    raise WavError(f"{path}: unsupported sample format ({bits} bit, {channels} ch)")
+                fmt = PcmFormat(rate, channels, bits // 8)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise WavError(f"{path}: data chunk before fmt chunk")
+                offset = f.tell()
+                f.seek(0, 2)
+                size = min(size, f.tell() - offset)  # tolerate truncated files
+                frame_size = fmt.channels * fmt.width
+                size -= size % frame_size
+                return WavInfo(fmt.rate, fmt.channels, fmt.width, size // frame_size, offset, size)
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def info_format(info):
+    return PcmFormat(info.rate, info.channels, info.width)
+
+
+def read_frames(path, info=None):
+    """Return (WavInfo, raw sample bytes)."""
+    info = info or wav_info(path)
+    with open(path, "rb") as f:
+        f.seek(info.data_offset)
+        return info, f.read(info.data_size)
+
+
+def map_frames(path, info=None):
+    """Return (WavInfo, memoryview) over a read-only mapping of the sample data."""
+    info = info or wav_info(path)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return info, memoryview(mapped)[info.data_offset:info.data_offset + info.data_size]
+
+
+# ---------- conversion ----------
+
+def _to_int16(data, width):
+    """Decode little-endian PCM of any supported width to a list/array of int16 values."""
+    if np is not None:
+        if width == 1:
+            return (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+        if width == 2:
+            return np.frombuffer(data, dtype="<i2").astype(np.int16)
+        if width == 3:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            return ((raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 16).astype(np.int16)
+        return (np.frombuffer(data, dtype="<i4") >> 16).astype(np.int16)
+    if width == 1:
+        return array("h", ((b - 128) << 8 for b in data))
+    if width == 2:
+        samples = array("h")
+        samples.frombytes(bytes(data))
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return samples
+    if width == 3:
+        mv = memoryview(data)
+        return array("h", (int.from_bytes(mv[i:i + 3], "little", signed=True) >> 8
+                           for i in range(0, len(mv), 3)))
+    samples = array("i")
+    samples.frombytes(bytes(data))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return array("h", (s >> 16 for s in samples))
+
+
+def _remix(samples, src_channels, dst_channels):
+    if src_channels == dst_channels:
+        return samples
+    if np is not None:
+        frames = samples.reshape(-1, src_channels).astype(np.int32)
+        mono = frames.mean(axis=1) if src_channels > 1 else frames[:, 0]
+        return np.repeat(mono.astype(np.int16), dst_channels)
+    if src_channels > 1:
+        samples = array("h", (sum(samples[i:i + src_channels]) // src_channels
+                              for i in range(0, len(samples), src_channels)))
+    if dst_channels == 1:
+        return samples
+    return array("h", (s for s in samples for _ in range(dst_channels)))
+
+
+def _resample(samples, channels, src_rate, dst_rate):
+    """Linear-interpolation resampler; good enough for bells and speech."""
+    if src_rate == dst_rate or not len(samples):
+        return samples
+    src_frames = len(samples) // channels
+    dst_frames = int(src_frames * dst_rate / src_rate)
+    if np is not None:
+        frames = samples.reshape(-1, channels).astype(np.float64)
+        positions = np.arange(dst_frames) * (src_rate / dst_rate)
+        index = np.arange(src_frames)
+        out = np.empty((dst_frames, channels), dtype=np.int16)
+        for ch in range(channels):
+            out[:, ch] = np.interp(positions, index, frames[:, ch]).astype(np.int16)
+        return out.reshape(-1)
+    out = array("h", bytes(2 * dst_frames * channels))
+    step = src_rate / dst_rate
+    last = src_frames - 1
+    for i in range(dst_frames):
+        pos = i * step
+        j = int(pos)
+        frac = pos - j
+        k = min(j + 1, last)
+        for ch in range(channels):
+            a = samples[j * channels + ch]
+            b = samples[k * channels + ch]
+            out[i * channels + ch] = int(a + (b - a) * frac)
+    return out
+
+
+def _to_bytes(samples):
+    if np is not None and isinstance(samples, np.ndarray):
+        return samples.astype("<i2").tobytes()
+    if sys.byteorder == "big":
+        samples = array("h", samples)
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def convert(data, src, dst):
+    """Convert raw PCM `data` from format `src` to `dst` (16-bit output only)."""
+    if dst.width != 2:
+        raise ValueError("only 16-bit output is supported")
+    if src == dst:
+        return bytes(data)
+    samples = _to_int16(data, src.width)
+    samples = _remix(samples, src.channels, dst.channels)
+    samples = _resample(samples, dst.channels, src.rate, dst.rate)
+    return _to_bytes(samples)
+
+
+def load(path, fmt, mmap_threshold=None, info=None):
+    """Decode a WAV file into `fmt`.
+
+    Files already in `fmt` and at least `mmap_threshold` bytes long are
+    memory-mapped instead of copied; everything else is converted once.
+    `info` skips header parsing when the caller already has it.
+    Returns (buffer, mapped).
+    """
+    info = info or wav_info(path)
+    if info_format(info) == fmt and mmap_threshold is not None and info.data_size >= mmap_threshold:
+        return map_frames(path, info)[1], True
+    _, data = read_frames(path, info)
+    return convert(data, info_format(info), fmt), False
+
+
+# ---------- files ----------
+
+def describe(fmt):
+    channels = {1: "mono", 2: "stereo"}.get(fmt.channels, f"{fmt.channels} ch")
+    return f"{fmt.rate / 1000:g} kHz, {fmt.width * 8}-bit, {channels}"
+
+
+def write_wav(path, data, fmt):
+    """Write 16-bit PCM `data` in `fmt` to `path` atomically (temp file + rename)."""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp-", suffix=".wav")
+    os.close(fd)
+    try:
+        with wave.open(tmp, "wb") as w:
+            w.setnchannels(fmt.channels)
+            w.setsampwidth(fmt.width)
+            w.setframerate(fmt.rate)
+            w.writeframes(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def normalize_file(path, fmt):
+    """Rewrite the WAV at `path` in `fmt`, in place. Returns its original format,
+    or None if it was already in `fmt`. Raises WavError if the file changed
+    while it was being converted."""
+    before = os.stat(path)
+    info = wav_info(path)
+    src = info_format(info)
+    if src == fmt:
+        return None
+    _, data = read_frames(path, info)
+    converted = convert(data, src, fmt)
+    after = os.stat(path)
+    if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+        raise WavError(f"{path}: changed during conversion")
+    write_wav(path, converted, fmt)
+    return src
+
+
+# ---------- levels ----------
+
+def to_samples(data, width):
+    """Decode raw little-endian PCM to int16 samples (a NumPy array or array('h'))."""
+    return _to_int16(data, width)
+
+
+def apply_gain(data, gain):
+    """Scale 16-bit PCM bytes by the linear factor `gain`, clipping at full scale."""
+    if np is not None:
+        scaled = np.rint(np.frombuffer(data, dtype="<i2") * gain)
+        return np.clip(scaled, -32768, 32767).astype("<i2").tobytes()
+    # One multiply per possible sample value instead of one per sample
+    table = array("h", (max(-32768, min(32767, round(v * gain))) for v in range(-32768, 32768)))
+    samples = _to_int16(data, 2)
+    return _to_bytes(array("h", map(table.__getitem__, map((32768).__add__, samples))))
+
+
+def mix(chunks, gains=None):
+    """Sum 16-bit PCM byte strings sample by sample (shorter ones padded with
+    silence), each scaled by its entry in `gains`, clipping at full scale."""
+    length = max(map(len, chunks)) // 2
+    gains = gains or [1.0] * len(chunks)
+    if np is not None:
+        total = np.zeros(length, dtype=np.int32)
+        for chunk, gain in zip(chunks, gains):
+            samples = np.frombuffer(chunk, dtype="<i2")
+            total[:len(samples)] += samples if gain == 1.0 else (samples * gain).astype(np.int32)
+        return np.clip(total, -32768, 32767).astype("<i2").tobytes()
+    def summed():
+        # One lazy pass over all the voices; nothing is materialized until the end
+        total = None
+        for chunk, gain in zip(chunks, gains):
+            samples = _to_int16(chunk, 2)
+            if len(samples) < length:
+                samples = chain(samples, repeat(0, length - len(samples)))
+            if gain != 1.0:
+                # Fixed-point: multiply by gain * 2^16, shift back down
+                samples = map((16).__rrshift__, map(int(gain * 65536).__mul__, samples))
+            total = samples if total is None else map(operator.add, total, samples)
+        return total
+    try:
+        out = array("h", summed())
+    except OverflowError:
+        out = array("h", (max(-32768, min(32767, s)) for s in summed()))
+    return _to_bytes(out)
+
+
+def mix_at(placements, length):
+    """Sum 16-bit PCM byte strings into one buffer of `length` samples, each
+    starting at its sample offset: placements is [(offset, chunk)]. Clips at
+    full scale. Chunks are decoded once however often they are placed."""
+    decoded = {}
+    if np is not None:
+        total = np.zeros(length, dtype=np.int32)
+        for offset, chunk in placements:
+            samples = decoded.get(id(chunk))
+            if samples is None:
+                samples = decoded[id(chunk)] = np.frombuffer(chunk, dtype="<i2")
+            total[offset:offset + len(samples)] += samples
+        return np.clip(total, -32768, 32767).astype("<i2").tobytes()
+    total = array("i", bytes(4 * length))
+    for offset, chunk in placements:
+        samples = decoded.get(id(chunk))
+        if samples is None:
+            samples = decoded[id(chunk)] = _to_int16(chunk, 2)
+        end = offset + len(samples)
+        total[offset:end] = array("i", map(operator.add, total[offset:end], samples))
+    try:
+        out = array("h", total)
+    except OverflowError:
+        out = array("h", (max(-32768, min(32767, s)) for s in total))
+    return _to_bytes(out)
@@ -1,7 +1,7 @@
 #!/bin/bash
 # Scheduled alarm sound player
 # Extracts filename from any path and plays from /home/pi/ChurchBell/sounds/
-# NOTE: Uses pw-play (PipeWire). aplay (ALSA) is NOT supported in future Pi3 builds.
+# Plays through the audio engine, or the backend in audio_backends.py (pw-play by default)
 
 SOUNDS_DIR="/home/pi/ChurchBell/sounds"
 SOUND_PATH="$1"
@@ -20,5 +20,19 @@ if [ ! -f "$FULL_PATH" ]; then
   exit 0
 fi
 
-# Play the sound file
-pw-play "$FULL_PATH" >/dev/null 2>&1
+export XDG_RUNTIME_DIR="${XDG_RUNTIME_DIR:-/run/user/$(id -u)}"
+
+# Play the sound file, preferring the persistent audio engine. Fall back to
+# a one-off player only when the engine is not running (exit status 3); a
+# refusal by the engine's priority queue is final
+APP_DIR="$(dirname "$(readlink -f "$0")")"
+ENGINE_UNREACHABLE=3
+STATUS=$ENGINE_UNREACHABLE
+if [ -f "$APP_DIR/audio_engine.py" ]; then
+  python3 "$APP_DIR/audio_engine.py" play "$FULL_PATH" >/dev/null 2>&1
+  STATUS=$?
+fi
+if [ "$STATUS" -ne "$ENGINE_UNREACHABLE" ]; then
+  exit "$STATUS"
+fi
+python3 "$APP_DIR/audio_backends.py" play "$FULL_PATH" >/dev/null 2>&1
@@ -1,9 +1,10 @@
 #!/bin/bash
 
-export XDG_RUNTIME_DIR=/run/user/1000
+# cron does not set the session's runtime directory; use the crontab owner's
+export XDG_RUNTIME_DIR="${XDG_RUNTIME_DIR:-/run/user/$(id -u)}"
 
-LOGFILE="/home/pi/ChurchBell/cron_alarm.log"
-PWPLAY="/usr/bin/pw-play"
+APP_DIR="$(dirname "$(readlink -f "$0")")"
+LOGFILE="${CHURCHBELL_CRON_LOG:-$APP_DIR/cron_alarm.log}"
 
 SOUND="$1"
 
@@ -14,4 +15,25 @@ fi
 
 echo "$(date '+%Y-%m-%d %H:%M:%S') - Playing: $SOUND" >> "$LOGFILE"
 
-"$PWPLAY" "$SOUND" >> "$LOGFILE" 2>&1
+# Spoken messages (tts.py) are announcements, ducking a bell that is still ringing
+case "$(basename "$SOUND")" in
+    tts-*) PRIORITY=announcement ;;
+    *) PRIORITY=bell ;;
+esac
+
+# Prefer the persistent audio engine (warm stream, cached PCM). Only when it
+# is not running (exit status 3) fall back to a one-off player from
+# audio_backends.py (CHURCHBELL_AUDIO_BACKEND); a refusal, e.g. while an
+# announcement is playing, is final
+ENGINE_UNREACHABLE=3
+STATUS=$ENGINE_UNREACHABLE
+if [ -f "$APP_DIR/audio_engine.py" ]; then
+    python3 "$APP_DIR/audio_engine.py" play "$SOUND" "${CHURCHBELL_OVERLAP_POLICY:-mix}" "$PRIORITY" >> "$LOGFILE" 2>&1
+    STATUS=$?
+fi
+if [ "$STATUS" -ne "$ENGINE_UNREACHABLE" ]; then
+    [ "$STATUS" -eq 0 ] || echo "$(date '+%Y-%m-%d %H:%M:%S') - Not played (audio engine refused or failed)" >> "$LOGFILE"
+    exit "$STATUS"
+fi
+
+python3 "$APP_DIR/audio_backends.py" play "$SOUND" >> "$LOGFILE" 2>&1
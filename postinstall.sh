@@ -39,7 +39,7 @@ echo "=== ChurchBell Post‑Install Verification ==="
 # ---------------------------------------------------------
 # 1. Check systemd services
 # ---------------------------------------------------------
-SERVICES=("churchbell-home.service" "churchbell.service")
+SERVICES=("churchbell-home.service" "churchbell.service" "churchbell-scheduler.service" "churchbell-audio.service")
 
 for svc in "${SERVICES[@]}"; do
     if systemctl list-unit-files | grep -q "$svc"; then
@@ -0,0 +1,185 @@
+"""
+Sound previews ("Test" buttons).
+A preview is started and returns at once; the page then polls its state and
+can stop it. Previews go through the audio engine at "preview" priority, the
+same path scheduled bells take, so they never talk over a bell. If the
+engine is not running, the file is handed to the audio backend instead
+(pw-play by default, see audio_backends.py) and the player is tracked,
+rather than waited on, in the request thread.
+"""
+import itertools
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+import audio_backends
+import audio_engine
+
+KEEP_FINISHED = 50  # finished previews kept around for status queries
+MAX_PROCESSES = 4   # concurrent fallback players
+MAX_SECONDS = 600   # a fallback process still running after this long is stopped
+
+QUEUED, PLAYING, DONE, STOPPED, PREEMPTED, FAILED = "queued", "playing", "done", "stopped", "preempted", "failed"
+ENGINE_STATES = {"queued": QUEUED, "playing": PLAYING, "played": DONE,
+                 "stopped": STOPPED, "preempted": PREEMPTED}
+
+
+class Busy(Exception):
+    """The preview was refused, e.g. because a bell is playing."""
+
+
+class Preview:
+    def __init__(self, preview_id, name, backend, duration=None):
+        self.id = preview_id
+        self.name = name
+        self.backend = backend  # "engine" or the audio backend's name
+        self.duration = duration
+        self.position = None
+        self.state = PLAYING
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.play_id = None  # engine id
+        self.proc = None     # fallback player (Popen-like)
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, PLAYING)
+
+    def to_dict(self):
+        elapsed = (self.finished or time.time()) - self.started
+        position = self.position
+        if position is None and self.proc is not None:
+            position = elapsed if self.duration is None else min(elapsed, self.duration)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "backend": self.backend,
+            "state": self.state,
+            "active": self.active,
+            "position": position,
+            "duration": self.duration,
+            "error": self.error,
+        }
+
+
+class Previews:
+    """Starts previews and answers status and stop requests for them by id."""
+
+    def __init__(self, app_dir):
+        self.app_dir = app_dir
+        self._previews = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, sound_path, duration=None):
+        """Start previewing `sound_path` (relative to the app directory). Returns the Preview.
+        Raises Busy if it was refused and OSError if it could not be started."""
+        full_path = str((self.app_dir / sound_path).resolve())
+        if not os.path.exists(full_path):
+            raise FileNotFoundError(f"File not found: {full_path}")
+        name = os.path.basename(full_path)
+        preview_id = f"{int(time.time())}-{next(self._ids)}"
+
+        # Preferred path: the engine already has the stream open and the PCM cached
+        reply = audio_engine.play(full_path, priority="preview")
+        if reply is not None:
+            if reply.get("busy"):
+                print(f"[INFO] Audio engine refused preview of {full_path}: {reply.get('error')}", flush=True)
+                raise Busy(reply.get("error"))
+            if not reply.get("ok"):
+                raise OSError(f"Audio engine error: {reply.get('error')}")
+            preview = Preview(preview_id, name, "engine", duration)
+            preview.play_id = reply["id"]
+        else:
+            backend = audio_backends.get()
+            preview = Preview(preview_id, name, backend.name, duration)
+            with self._lock:
+                self._poll_processes()
+                running = sum(1 for p in self._previews.values() if p.proc is not None and p.active)
+            if running >= MAX_PROCESSES:
+                raise Busy(f"{running} previews are already playing")
+            preview.proc = backend.play(full_path, capture=True)
+        print(f"[INFO] Preview {preview.id} started via {preview.backend}: {full_path}", flush=True)
+        with self._lock:
+            self._previews[preview.id] = preview
+            self._prune()
+        return preview
+
+    def _poll_processes(self):
+        """Reap finished fallback players. Caller holds the lock."""
+        for preview in self._previews.values():
+            if preview.proc is None or preview.finished is not None:
+                continue
+            code = preview.proc.poll()
+            if code is None and time.time() - preview.started > MAX_SECONDS:
+                preview.proc.kill()
+                code = preview.proc.wait()
+            if code is None:
+                continue
+            preview.finished = time.time()
+            if code == 0 and preview.state != STOPPED:
+                preview.state = DONE
+            elif preview.state != STOPPED:
+                preview.state = FAILED
+                preview.error = f"{preview.backend} failed (exit code {code}): {preview.proc.stderr.read().strip()}"
+                print(f"[ERROR] Preview {preview.id}: {preview.error}", flush=True)
+            preview.proc.stderr.close()
+
+    def _refresh(self, preview):
+        if not preview.active:
+            return
+        if preview.proc is not None:
+            with self._lock:
+                self._poll_processes()
+            return
+        reply = audio_engine.request({"cmd": "status", "id": preview.play_id})
+        if reply is None:
+            # The engine went away (restart); whatever it was playing has stopped
+            preview.state, preview.error = STOPPED, "Audio engine is not running"
+        elif not reply.get("ok"):
+            # Slow or garbled reply: keep the last known state and ask again next time
+            return
+        else:
+            preview.state = ENGINE_STATES.get(reply.get("state"), DONE)
+            preview.duration = reply.get("duration", preview.duration)
+            if "position" in reply:
+                preview.position = reply["position"]
+            elif preview.state == DONE:
+                preview.position = preview.duration
+        if not preview.active:
+            preview.finished = time.time()
+
+    def get(self, preview_id):
+        with self._lock:
+            preview = self._previews.get(preview_id)
+        if preview is not None:
+            self._refresh(preview)
+        return preview
+
+    def stop(self, preview_id):
+        """Stop one preview. Returns False if it was unknown or had already finished."""
+        preview = self.get(preview_id)
+        if preview is None or not preview.active:
+            return False
+        if preview.proc is not None:
+            preview.state = STOPPED
+            preview.proc.terminate()
+            try:
+                preview.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                preview.proc.kill()
+            with self._lock:
+                self._poll_processes()
+        else:
+            audio_engine.request({"cmd": "stop", "id": preview.play_id})
+            self._refresh(preview)
+        print(f"[INFO] Preview {preview.id} stopped", flush=True)
+        return True
+
+    def _prune(self):
+        finished = [p for p in self._previews.values() if not p.active]
+        for preview in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._previews[preview.id]
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Alarm recurrence rules.
+An alarm rings at its time_str on the dates its rule produces:
+
+    weekly   every day_of_week
+    monthly  the month_week-th day_of_week of each month (1-4, or -1 for the last)
+    once     on start_date only
+
+bounded by start_date/end_date (inclusive, either may be empty) and minus
+the dates listed in `exceptions` (comma-separated YYYY-MM-DD).
+
+Rules are expanded lazily: Rule.dates() is a generator that steps straight
+from one matching date to the next (7 days, or one month), so asking for the
+next bell or for a multi-year window never materializes a calendar.
+occurrences_between() first narrows the alarms table with the indexed date
+bounds (and the weekday for short windows), then merges the per-rule
+generators in time order.
+
+`recurrence.py --fire ID` exits 0 only if alarm ID is due this minute; cron
+lines for rules cron cannot express on its own are guarded with it.
+"""
+import argparse
+import calendar
+import heapq
+import sys
+import time
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+from pathlib import Path
+
+import db
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = db.DB_PATH
+
+WEEKLY, MONTHLY, ONCE = "weekly", "monthly", "once"
+RECURRENCES = (WEEKLY, MONTHLY, ONCE)
+MONTH_WEEKS = (1, 2, 3, 4, -1)
+MAX_EXCEPTIONS = 366
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+ORDINALS = {1: "1st", 2: "2nd", 3: "3rd", 4: "4th", -1: "last"}
+
+
+def parse_date(value):
+    """date from 'YYYY-MM-DD' (or a date); None for empty values."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def parse_exceptions(value):
+    """frozenset of dates from a comma/whitespace separated string or a list."""
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        value = value.replace(",", " ").split()
+    return frozenset(parse_date(v) for v in value if v)
+
+
+def format_exceptions(dates):
+    return ",".join(sorted(d.isoformat() for d in dates)) or None
+
+
+def normalize(fields):
+    """Validate a rule's recurrence columns and return them in canonical form.
+
+    `fields` maps column names to values (missing ones take their defaults).
+    One-shot rules get day_of_week and end_date from their date, which keeps
+    them inside the weekday and date-bound indexes. Raises ValueError.
+    """
+    kind = fields.get("recurrence") or WEEKLY
+    if kind not in RECURRENCES:
+        raise ValueError(f"recurrence must be one of {', '.join(RECURRENCES)}")
+    start = parse_date(fields.get("start_date"))
+    end = parse_date(fields.get("end_date"))
+    exceptions = parse_exceptions(fields.get("exceptions"))
+    if len(exceptions) > MAX_EXCEPTIONS:
+        raise ValueError(f"at most {MAX_EXCEPTIONS} skipped dates per alarm")
+    day = fields.get("day_of_week")
+    month_week = None
+    if kind == ONCE:
+        if start is None:
+            raise ValueError("a one-time alarm needs a date")
+        day, end, exceptions = start.weekday(), start, frozenset()
+    else:
+        if isinstance(day, bool) or not isinstance(day, int) or not 0 <= day <= 6:
+            raise ValueError("day_of_week must be an integer from 0 (Monday) to 6 (Sunday)")
+        if kind == MONTHLY:
+            month_week = fields.get("month_week")
+            try:
+                month_week = int(month_week)
+            except (TypeError, ValueError):
+                month_week = None
+            if month_week not in MONTH_WEEKS:
+                raise ValueError("month_week must be 1-4, or -1 for the last week")
+        if start and end and end < start:
+            raise ValueError("end_date is before start_date")
+    return {
+        "day_of_week": day,
+        "recurrence": kind,
+        "month_week": month_week,
+        "start_date": start.isoformat() if start else None,
+        "end_date": end.isoformat() if end else None,
+        "exceptions": format_exceptions(exceptions),
+    }
+
+
+def nth_weekday(year, month, weekday, n):
+    """Date of the n-th (1-4, or -1 for last) `weekday` in a month."""
+    if n == -1:
+        last = calendar.monthrange(year, month)[1]
+        return date(year, month, last - (date(year, month, last).weekday() - weekday) % 7)
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def epoch(day, hour, minute):
+    """Local wall-clock time on `day` as an epoch; mktime(isdst=-1) applies that date's UTC offset."""
+    return time.mktime((day.year, day.month, day.day, hour, minute, 0, 0, 0, -1))
+
+
+class Rule:
+    """One alarm row, parsed once for repeated expansion."""
+
+    __slots__ = ("id", "row", "weekday", "hour", "minute", "kind", "month_week",
+                 "start", "end", "exceptions")
+
+    def __init__(self, row):
+        keys = row.keys()
+        self.row = row
+        self.id = row["id"]
+        self.weekday = row["day_of_week"]
+        hour, minute = (int(p) for p in row["time_str"].split(":"))
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"invalid time {row['time_str']!r}")
+        self.hour, self.minute = hour, minute
+        # Rows read before the migration ran lack the recurrence columns
+        self.kind = (row["recurrence"] if "recurrence" in keys else None) or WEEKLY
+        self.month_week = row["month_week"] if "month_week" in keys else None
+        self.start = parse_date(row["start_date"]) if "start_date" in keys else None
+        self.end = parse_date(row["end_date"]) if "end_date" in keys else None
+        self.exceptions = parse_exceptions(row["exceptions"]) if "exceptions" in keys else frozenset()
+
+    @property
+    def plain(self):
+        """True for an unbounded weekly rule without exceptions, i.e. a plain cron line."""
+        return self.kind == WEEKLY and not (self.start or self.end or self.exceptions)
+
+    def dates(self, first, last=date.max):
+        """Yield the matching dates in [first, last], earliest first."""
+        lo = max(first, self.start) if self.start else first
+        hi = min(last, self.end) if self.end else last
+        if lo > hi:
+            return
+        skip = self.exceptions
+        if self.kind == ONCE:
+            if lo <= self.start <= hi and self.start not in skip:
+                yield self.start
+        elif self.kind == WEEKLY:
+            day = lo + timedelta(days=(self.weekday - lo.weekday()) % 7)
+            week = timedelta(days=7)
+            while day <= hi:
+                if day not in skip:
+                    yield day
+                if hi - day < week:
+                    return
+                day += week
+        else:
+            year, month = lo.year, lo.month
+            while True:
+                day = nth_weekday(year, month, self.weekday, self.month_week)
+                if day > hi:
+                    return
+                if day >= lo and day not in skip:
+                    yield day
+                if month == 12:
+                    if year == date.max.year:
+                        return
+                    year, month = year + 1, 1
+                else:
+                    month += 1
+
+    def occurrences(self, t1, t2):
+        """Yield (epoch, rule) for fire times in [t1, t2)."""
+        last = date.fromtimestamp(t2)
+        for day in self.dates(date.fromtimestamp(t1) - timedelta(days=1), last):
+            ts = epoch(day, self.hour, self.minute)
+            if ts >= t2:
+                return
+            if ts >= t1:
+                yield ts, self
+
+    def next_after(self, after):
+        """First fire time strictly after epoch `after`, or None if the rule has ended."""
+        for day in self.dates(date.fromtimestamp(after)):
+            ts = epoch(day, self.hour, self.minute)
+            if ts > after:
+                return ts
+        return None
+
+
+def describe(row):
+    """Short human description of an alarm's rule, e.g. '2nd Sunday monthly until 2027-06-30'."""
+    keys = row.keys()
+    get = lambda k: row[k] if k in keys else None
+    kind = get("recurrence") or WEEKLY
+    day = DAY_NAMES[row["day_of_week"]]
+    if kind == ONCE:
+        return f"Once on {day} {get('start_date')}"
+    if kind == MONTHLY:
+        text = f"{ORDINALS.get(get('month_week'), '?')} {day} monthly"
+    else:
+        text = f"Every {day}"
+    if get("start_date"):
+        text += f" from {get('start_date')}"
+    if get("end_date"):
+        text += f" until {get('end_date')}"
+    skipped = len(parse_exceptions(get("exceptions")))
+    if skipped:
+        text += f", {skipped} date{'s' if skipped != 1 else ''} skipped"
+    return text
+
+
+# ---------- queries ----------
+
+def load_rules(conn, ids=None, enabled_only=True):
+    """Rules for the given alarm ids (all alarms if None); rows with a bad time are skipped."""
+    sql = "SELECT * FROM alarms"
+    where, params = [], []
+    if enabled_only:
+        where.append("enabled = 1")
+    if ids is not None:
+        where.append(f"id IN ({','.join('?' * len(ids))})")
+        params.extend(ids)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return _rules(conn.execute(sql, params))
+
+
+def _rules(rows):
+    rules = []
+    for row in rows:
+        try:
+            rules.append(Rule(row))
+        except (ValueError, AttributeError):
+            print(f"[WARN] Alarm {row['id']}: invalid schedule, ignored", flush=True)
+    return rules
+
+
+def candidates(conn, t1, t2):
+    """Enabled rules that can fire in [t1, t2), narrowed in SQL.
+
+    The date bounds use idx_alarms_window, so expired and not-yet-started
+    rules (one-time alarms pile up over the years) are never read; windows
+    shorter than a week also filter on the weekdays they cover.
+    """
+    first = date.fromtimestamp(t1) - timedelta(days=1)
+    last = date.fromtimestamp(t2)
+    where = " AND (start_date IS NULL OR start_date <= ?)"
+    params = [last.isoformat()]
+    span = (last - first).days + 1
+    if span < 7:
+        days = sorted({(first + timedelta(days=n)).weekday() for n in range(span)})
+        where += f" AND day_of_week IN ({','.join('?' * len(days))})"
+        params.extend(days)
+    # Two halves rather than "end_date IS NULL OR end_date >= ?", which SQLite
+    # would answer by scanning every enabled row
+    sql = (f"SELECT * FROM alarms WHERE enabled = 1 AND end_date IS NULL{where}"
+           f" UNION ALL "
+           f"SELECT * FROM alarms WHERE enabled = 1 AND end_date >= ?{where}")
+    return _rules(conn.execute(sql, params + [first.isoformat()] + params))
+
+
+def occurrences_between(conn, t1, t2):
+    """Iterator of (epoch, Rule) for every enabled alarm firing in [t1, t2), in time order.
+    The merge is lazy, so stopping early leaves the rest of the window unexpanded."""
+    return heapq.merge(*(rule.occurrences(t1, t2) for rule in candidates(conn, t1, t2)),
+                       key=itemgetter(0))
+
+
+def fires_now(alarm_id, now=None, db_path=DB_PATH):
+    """True if enabled alarm `alarm_id` has an occurrence in the current minute."""
+    now = time.time() if now is None else now
+    minute = now - now % 60
+    with db.connection(db_path) as conn:
+        rules = load_rules(conn, [alarm_id])
+    return any(True for _ in rules[0].occurrences(minute, minute + 60)) if rules else False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alarm recurrence rules")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--fire", type=int, metavar="ID",
+                       help="exit 0 if alarm ID is due this minute (cron guard)")
+    group.add_argument("--between", nargs=2, metavar=("FROM", "TO"),
+                       help="list occurrences between two dates (YYYY-MM-DD)")
+    args = parser.parse_args()
+    if args.fire is not None:
+        return 0 if fires_now(args.fire) else 1
+    t1, t2 = (epoch(parse_date(d), 0, 0) for d in args.between)
+    with db.connection(DB_PATH) as conn:
+        for ts, rule in occurrences_between(conn, t1, t2):
+            print(f"{datetime.fromtimestamp(ts):%Y-%m-%d %a %H:%M}  alarm {rule.id}  "
+                  f"{rule.row['sound_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
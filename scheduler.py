@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+ChurchBell scheduler daemon.
+Keeps every enabled alarm in a heap ordered by its next fire time and sleeps
+until the earliest one, so bells ring with sub-second accuracy instead of
+waiting on cron's once-a-minute tick and a fork per bell.
+
+While this daemon runs, sync_cron.py leaves the crontab without alarm lines.
+app.py tells the daemon which alarm IDs changed over a Unix datagram socket,
+and only those rows are re-read from the database. Fire times come from
+recurrence.Rule, so monthly, bounded and one-time alarms and skipped dates
+are handled here exactly as in the cron guard.
+"""
+import heapq
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import audio_backends
+import audio_engine
+import db
+import recurrence
+import sync_cron
+import tts
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = db.DB_PATH
+SOCKET_PATH = APP_DIR / "scheduler.sock"
+PID_FILE = sync_cron.SCHEDULER_PID_FILE
+
+MAX_SLEEP = 30.0    # re-check the wall clock at least this often (seconds)
+LATE_GRACE = 60.0   # still ring a bell this late, skip anything older
+CLOCK_JUMP = 2.0    # wall clock vs monotonic disagreement treated as a clock change
+# What the engine does with a bell that starts while another is still playing
+OVERLAP_POLICY = os.getenv("CHURCHBELL_OVERLAP_POLICY", "mix")
+if OVERLAP_POLICY not in audio_engine.OVERLAP_POLICIES:
+    print(f"[WARN] Unknown CHURCHBELL_OVERLAP_POLICY '{OVERLAP_POLICY}', using 'mix'", flush=True)
+    OVERLAP_POLICY = "mix"
+
+
+def notify(alarm_ids=None):
+    """Tell a running scheduler which alarms changed (None reloads everything)."""
+    message = json.dumps({"ids": list(alarm_ids) if alarm_ids is not None else None})
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message.encode(), str(SOCKET_PATH))
+        return True
+    except OSError:
+        # Daemon not running; cron handles the alarms.
+        return False
+
+
+def play_alarm(alarm):
+    """Start playback for an alarm without waiting for it to finish."""
+    full_path = sync_cron.resolve_sound_path(alarm["sound_path"])
+    if not os.path.exists(full_path):
+        print(f"[ERROR] Alarm {alarm['id']}: file not found: {full_path}", flush=True)
+        return None
+    # Spoken messages are announcements: a bell still ringing is ducked under them
+    priority = "announcement" if Path(full_path).name.startswith(tts.OUTPUT_PREFIX) else "bell"
+    reply = audio_engine.play(full_path, OVERLAP_POLICY, priority)
+    if reply is not None:
+        # Refused, failed or timed out: final, the engine may still be playing it
+        if not reply.get("ok"):
+            print(f"[ERROR] Alarm {alarm['id']}: {reply.get('error')}", flush=True)
+        return None
+    # Engine not running: fall back to a one-off player (PipeWire mixes
+    # overlapping streams, whatever the policy)
+    return audio_backends.get().play(full_path)
+
+
+class Scheduler:
+    """Next-fire heap over the alarms table."""
+
+    def __init__(self, fire=play_alarm, db_path=DB_PATH):
+        self._fire = fire
+        self._db_path = db_path
+        self._alarms = {}       # alarm id -> row dict (with its recurrence.Rule under "rule")
+        self._generation = {}   # alarm id -> generation of its live heap entry
+        self._heap = []         # (fire_ts, alarm_id, generation)
+        self._last_fired = {}   # alarm id -> latest occurrence already rung (or skipped)
+        self._players = []
+        self._pending = set()
+        self._reload_all = False
+        self._lock = threading.RLock()  # notify() also runs from the SIGHUP handler
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    # ----- loading -----
+
+    def _query(self, ids=None):
+        # Rows with an invalid schedule are left out (and logged), which drops them from the heap
+        with db.connection(self._db_path) as conn:
+            rules = recurrence.load_rules(conn, ids, enabled_only=False)
+        return [dict(rule.row, rule=rule) for rule in rules]
+
+    def _set_alarm(self, alarm_id, row, now):
+        """Replace one alarm; older heap entries become stale via the generation bump."""
+        gen = self._generation.get(alarm_id, 0) + 1
+        self._generation[alarm_id] = gen
+        if row is None or not row["enabled"]:
+            self._alarms.pop(alarm_id, None)
+            self._last_fired.pop(alarm_id, None)
+            return
+        self._alarms[alarm_id] = row
+        self._schedule(alarm_id, now)
+
+    def _schedule(self, alarm_id, after):
+        # Never before an occurrence already handled, even if the wall clock
+        # has since been set back. None once a bounded or one-time rule has
+        # no occurrences left.
+        after = max(after, self._last_fired.get(alarm_id, after))
+        ts = self._alarms[alarm_id]["rule"].next_after(after)
+        if ts is not None:
+            heapq.heappush(self._heap, (ts, alarm_id, self._generation[alarm_id]))
+
+    def load_all(self, now=None):
+        now = time.time() if now is None else now
+        rows = {r["id"]: r for r in self._query()}
+        for alarm_id in set(self._alarms) - set(rows):
+            self._set_alarm(alarm_id, None, now)
+        self._heap = []
+        for alarm_id, row in rows.items():
+            self._set_alarm(alarm_id, row, now)
+        print(f"[INFO] Loaded {len(self._alarms)} enabled alarms", flush=True)
+
+    def reload(self, alarm_ids, now=None):
+        now = time.time() if now is None else now
+        rows = {r["id"]: r for r in self._query(alarm_ids)}
+        for alarm_id in alarm_ids:
+            self._set_alarm(alarm_id, rows.get(alarm_id), now)
+
+    def notify(self, alarm_ids=None):
+        """Queue a reload from any thread and wake the main loop."""
+        with self._lock:
+            if alarm_ids is None:
+                self._reload_all = True
+            else:
+                self._pending.update(int(i) for i in alarm_ids)
+        self._wake.set()
+
+    def _apply_pending(self):
+        with self._lock:
+            reload_all, self._reload_all = self._reload_all, False
+            pending, self._pending = self._pending, set()
+        if reload_all:
+            self.load_all()
+        elif pending:
+            self.reload(sorted(pending))
+
+    # ----- firing -----
+
+    def next_fire(self):
+        """(fire_ts, alarm_id) of the next live heap entry, or None."""
+        while self._heap:
+            ts, alarm_id, gen = self._heap[0]
+            if self._generation.get(alarm_id) == gen:
+                return ts, alarm_id
+            heapq.heappop(self._heap)
+        return None
+
+    def fire_due(self, now):
+        while True:
+            nxt = self.next_fire()
+            if nxt is None or nxt[0] > now:
+                return
+            ts, alarm_id = nxt
+            heapq.heappop(self._heap)
+            alarm = self._alarms[alarm_id]
+            self._last_fired[alarm_id] = ts
+            lateness = now - ts
+            if lateness <= LATE_GRACE:
+                print(f"[INFO] Firing alarm {alarm_id} ({alarm['sound_path']}), {lateness * 1000:.0f} ms late", flush=True)
+                try:
+                    player = self._fire(alarm)
+                    if player is not None:
+                        self._players.append(player)
+                except Exception as e:
+                    print(f"[ERROR] Alarm {alarm_id}: {e}", flush=True)
+            else:
+                print(f"[WARN] Skipping alarm {alarm_id}, {lateness:.0f}s overdue", flush=True)
+            self._schedule(alarm_id, now)
+
+    def _reap(self):
+        self._players = [p for p in self._players if hasattr(p, "poll") and p.poll() is None]
+
+    def run(self):
+        self.load_all()
+        last_wall, last_mono = time.time(), time.monotonic()
+        while not self._stop.is_set():
+            self._apply_pending()
+            now, mono = time.time(), time.monotonic()
+            # A forward jump just makes entries due (and fire_due skips stale ones).
+            # After a backward jump the heap is kept as it is: each entry already
+            # lies after the alarm's last ring, so nothing rings twice.
+            if (now - last_wall) - (mono - last_mono) < -CLOCK_JUMP:
+                print("[INFO] Wall clock moved backwards; bells already rung will not repeat", flush=True)
+            last_wall, last_mono = now, mono
+            self.fire_due(now)
+            self._reap()
+            nxt = self.next_fire()
+            delay = MAX_SLEEP if nxt is None else min(MAX_SLEEP, nxt[0] - time.time())
+            if delay > 0:
+                self._wake.wait(delay)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def listen(scheduler):
+    """Receive change notifications from app.py on SOCKET_PATH."""
+    try:
+        SOCKET_PATH.unlink()
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(str(SOCKET_PATH))
+
+    def loop():
+        while True:
+            try:
+                data = sock.recv(65536)
+                ids = json.loads(data.decode()).get("ids")
+                scheduler.notify(ids)
+            except (ValueError, AttributeError):
+                print("[WARN] Ignoring malformed notification", flush=True)
+            except OSError:
+                return
+
+    threading.Thread(target=loop, name="scheduler-listener", daemon=True).start()
+    return sock
+
+
+def main():
+    scheduler = Scheduler()
+    PID_FILE.write_text(str(os.getpid()))
+    # Take over from cron: remove the per-alarm crontab lines.
+    sync_cron.sync()
+    sock = listen(scheduler)
+
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda *_: scheduler.stop())
+    signal.signal(signal.SIGHUP, lambda *_: scheduler.notify(None))
+
+    try:
+        scheduler.run()
+    finally:
+        sock.close()
+        for path in (SOCKET_PATH, PID_FILE):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        # Hand the alarms back to cron so bells keep ringing while we are down.
+        sync_cron.sync()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
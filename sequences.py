@@ -0,0 +1,162 @@
+"""
+Bell sequences: tolls, peals and chimes made of several sounds.
+A sequence is an ordered list of steps (sound, repeat count, gap), stored in
+the sequences table and rendered once into a single WAV in sounds/, so an
+alarm that plays it is one playback with sample-accurate spacing instead of
+several alarms a few seconds apart.
+
+The gap is the time from the start of one strike to the start of the next;
+0 means "when the previous sound ends". Overlapping tails are mixed, the
+way a real bell keeps ringing under the next strike.
+
+Each render records a fingerprint of its steps and of every source file's
+size and mtime; refresh() re-renders only the sequences whose fingerprint no
+longer matches. Mixing goes through pcm.mix_at (NumPy when installed), and
+app.py runs refresh() as a background job so a long toll never holds up a
+request.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import pcm
+from audio_engine import SINK_FORMAT
+
+APP_DIR = Path(__file__).resolve().parent
+SOUNDS_DIR = APP_DIR / "sounds"
+OUTPUT_PREFIX = "sequence-"
+MAX_STEPS = 50
+MAX_REPEAT = 100
+MAX_GAP = 60.0
+
+
+class SequenceError(ValueError):
+    pass
+
+
+def output_name(name):
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "sequence"
+    return f"{OUTPUT_PREFIX}{slug}.wav"
+
+
+def parse_steps(text):
+    """Parse one step per line: "sound.wav, repeat, gap" (repeat and gap optional)."""
+    steps = []
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [p.strip() for p in line.split(",")]
+        try:
+            step = {
+                "sound": Path(parts[0]).name,
+                "repeat": int(parts[1]) if len(parts) > 1 and parts[1] else 1,
+                "gap": float(parts[2]) if len(parts) > 2 and parts[2] else 0.0,
+            }
+        except ValueError:
+            raise SequenceError(f"Line {n}: expected 'sound.wav, repeat, gap'")
+        steps.append(step)
+    validate_steps(steps)
+    return steps
+
+
+def validate_steps(steps):
+    if not steps:
+        raise SequenceError("A sequence needs at least one sound")
+    if len(steps) > MAX_STEPS:
+        raise SequenceError(f"A sequence can have at most {MAX_STEPS} steps")
+    for n, step in enumerate(steps, 1):
+        if not step["sound"].lower().endswith(".wav"):
+            raise SequenceError(f"Step {n}: {step['sound']} is not a WAV file")
+        if step["sound"].startswith(OUTPUT_PREFIX):
+            raise SequenceError(f"Step {n}: sequences cannot contain other sequences")
+        if not 1 <= step["repeat"] <= MAX_REPEAT:
+            raise SequenceError(f"Step {n}: repeat must be between 1 and {MAX_REPEAT}")
+        if not 0.0 <= step["gap"] <= MAX_GAP:
+            raise SequenceError(f"Step {n}: gap must be between 0 and {MAX_GAP:g} seconds")
+
+
+def format_steps(steps):
+    """Inverse of parse_steps, for editing."""
+    return "\n".join(f"{s['sound']}, {s['repeat']}, {s['gap']:g}" for s in steps)
+
+
+def fingerprint(steps, sounds_dir=SOUNDS_DIR):
+    """Hash of the steps, the output format and each source file's size and mtime.
+    Raises OSError if a source file is missing."""
+    h = hashlib.sha1(json.dumps([steps, list(SINK_FORMAT)], sort_keys=True).encode())
+    for sound in sorted({s["sound"] for s in steps}):
+        st = os.stat(Path(sounds_dir) / sound)
+        h.update(f"{sound}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+# ---------- rendering ----------
+
+def render(steps, dest, sounds_dir=SOUNDS_DIR, fmt=SINK_FORMAT):
+    """Mix the sequence into one WAV at `dest`. Returns its duration in seconds."""
+    sounds_dir = Path(sounds_dir)
+    decoded = {}
+    for step in steps:
+        if step["sound"] not in decoded:
+            info, data = pcm.read_frames(sounds_dir / step["sound"])
+            decoded[step["sound"]] = pcm.convert(data, pcm.info_format(info), fmt)
+
+    # Place every strike on the timeline first, so the buffer is allocated once
+    frame_size = fmt.channels * fmt.width
+    placements = []
+    frame = 0
+    for step in steps:
+        data = decoded[step["sound"]]
+        frames = len(data) // frame_size
+        spacing = int(round(step["gap"] * fmt.rate)) or frames
+        for _ in range(step["repeat"]):
+            placements.append((frame * fmt.channels, data))
+            frame += spacing
+    end = max(start + len(data) // fmt.width for start, data in placements)
+
+    # Overlapping strikes are clipped rather than wrapped around
+    pcm.write_wav(dest, pcm.mix_at(placements, end), fmt)
+    return end // fmt.channels / fmt.rate
+
+
+def refresh(conn, sounds_dir=SOUNDS_DIR, ids=None, force=False, job=None):
+    """Re-render sequences whose steps or source files changed. Returns the names rendered.
+    `job` (see jobs.Job) is told about each sequence checked and may cancel between them."""
+    sounds_dir = Path(sounds_dir)
+    sql = "SELECT id, name, steps, output, fingerprint FROM sequences"
+    params = []
+    if ids is not None:
+        sql += f" WHERE id IN ({','.join('?' * len(ids))})"
+        params = list(ids)
+    rendered = []
+    rows = conn.execute(sql, params).fetchall()
+    if job:
+        job.set_total(entries=len(rows))
+    for row in rows:
+        if job:
+            job.progress(0, 1, message=row["name"])
+        steps = json.loads(row["steps"])
+        output = sounds_dir / row["output"]
+        try:
+            current = fingerprint(steps, sounds_dir)
+        except OSError as e:
+            print(f"[WARN] Sequence '{row['name']}' not rendered: {e}", flush=True)
+            continue
+        if not force and current == row["fingerprint"] and output.exists():
+            continue
+        try:
+            duration = render(steps, output, sounds_dir)
+        except (OSError, pcm.WavError) as e:
+            print(f"[WARN] Sequence '{row['name']}' not rendered: {e}", flush=True)
+            continue
+        conn.execute(
+            "UPDATE sequences SET fingerprint = ?, duration = ? WHERE id = ?",
+            (current, duration, row["id"])
+        )
+        conn.commit()
+        rendered.append(row["name"])
+        print(f"[INFO] Rendered sequence '{row['name']}' -> {row['output']} ({duration:.1f}s)", flush=True)
+    return rendered
@@ -0,0 +1,620 @@
+"""
+Content-addressed incremental backups.
+A snapshot is a small JSON manifest (alarms, settings and a list of sound
+files with their SHA-256) written to backups/. User accounts go to a separate
+churchbells-users-*.json next to it, without passwords, so the manifest and
+its exports can be handed to anyone with the backup permission. The sound data lives
+once in backups/blobs/, named by its hash, so a snapshot of an unchanged
+library stores nothing but the manifest. Hashes are cached by
+(path, size, mtime_ns) in blobs/index.json, so unchanged files are not even
+re-read. Blobs no longer referenced by any snapshot are removed by gc().
+
+The long-running functions take an optional `job` (see jobs.Job) and report
+bytes and entries processed to it; job.progress() raises to cancel.
+
+The old churchbells-backup-*.zip layout (alarms.json + sounds/) is still
+produced by export_zip(), for downloads and for restoring on another unit.
+
+Restores never touch the live system until everything has been validated
+and staged; RestoreStage then applies the database changes and swaps in the
+new sounds/ directory in one step, and puts everything back on failure.
+"""
+import ctypes
+import errno
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import recurrence
+from fileutil import READ_CHUNK, hash_file
+
+APP_DIR = Path(__file__).resolve().parent
+BACKUP_DIR = APP_DIR / "backups"
+SOUNDS_DIR = APP_DIR / "sounds"
+BLOB_DIR = BACKUP_DIR / "blobs"
+HASH_INDEX = BLOB_DIR / "index.json"
+
+SNAPSHOT_PREFIX = "churchbells-snapshot-"
+USERS_PREFIX = "churchbells-users-"
+EXPORT_PREFIX = "churchbells-backup-"
+FORMAT = "churchbell-snapshot"
+VERSION = 1
+
+# Alarm columns saved in backups and restored, in INSERT order
+ALARM_COLUMNS = ("id", "day_of_week", "time_str", "sound_path", "enabled", "last_run_date",
+                 "recurrence", "month_week", "start_date", "end_date", "exceptions")
+# Already-compressed or barely-compressible audio is stored, not deflated
+STORED_SUFFIXES = {".wav", ".mp3", ".ogg", ".flac", ".m4a", ".opus"}
+
+# Held while writing a snapshot or collecting garbage, so gc() never sees a
+# freshly stored blob before the manifest that references it
+_store_lock = threading.Lock()
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# ---------- blobs ----------
+
+def blob_path(digest, blob_dir=BLOB_DIR):
+    return Path(blob_dir) / digest[:2] / digest
+
+
+def _write_json(path, data):
+    """Write JSON next to `path` and rename it into place."""
+    fd, tmp = tempfile.mkstemp(dir=str(Path(path).parent), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class HashIndex:
+    """SHA-256 of each sound file, reused while its size and mtime are unchanged."""
+
+    def __init__(self, path=HASH_INDEX):
+        self.path = Path(path)
+        try:
+            self._entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self._entries = {}
+        self._dirty = False
+
+    def digest(self, path):
+        st = os.stat(path)
+        key = str(path)
+        cached = self._entries.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hash_file(path)
+        self._entries[key] = [st.st_size, st.st_mtime_ns, digest]
+        self._dirty = True
+        return digest
+
+    def prune(self, digests):
+        """Forget every file whose hash is not in `digests`."""
+        kept = {k: v for k, v in self._entries.items() if v[2] in digests}
+        self._dirty = self._dirty or len(kept) != len(self._entries)
+        self._entries = kept
+
+    def save(self):
+        if self._dirty:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            _write_json(self.path, self._entries)
+            self._dirty = False
+
+
+def store_blob(path, digest, blob_dir=BLOB_DIR):
+    """Copy `path` into the blob store unless that content is already there.
+    Returns the number of bytes written (0 when the blob was reused)."""
+    target = blob_path(digest, blob_dir)
+    if target.exists():
+        return 0
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(target.parent), prefix=".tmp-")
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return target.stat().st_size
+
+
+# ---------- snapshots ----------
+
+def users_path(snapshot_path):
+    """The admin-only file holding the user accounts of a snapshot."""
+    path = Path(snapshot_path)
+    return path.with_name(USERS_PREFIX + path.name[len(SNAPSHOT_PREFIX):])
+
+
+def _dump_database(conn):
+    alarms = [dict(r) for r in conn.execute(
+        f"SELECT {', '.join(ALARM_COLUMNS)} FROM alarms ORDER BY id"
+    )]
+    row = conn.execute("SELECT * FROM settings WHERE id = 1").fetchone()
+    settings = {k: row[k] for k in row.keys() if k != "id"} if row else {}
+    users = []
+    for r in conn.execute(
+        """
+        SELECT u.username, u.role, GROUP_CONCAT(p.permission) AS permissions
+        FROM users u
+        LEFT JOIN user_permissions p ON p.user_id = u.id
+        GROUP BY u.id
+        ORDER BY u.id
+        """
+    ):
+        users.append({
+            "username": r["username"],
+            "role": r["role"],
+            "permissions": sorted(r["permissions"].split(",")) if r["permissions"] else [],
+        })
+    return alarms, settings, users
+
+
+def create_snapshot(conn, sounds_dir=SOUNDS_DIR, backup_dir=BACKUP_DIR, job=None):
+    """Write a snapshot manifest and any new blobs. Returns (manifest path, stats)."""
+    with _store_lock:
+        return _create_snapshot(conn, Path(sounds_dir), Path(backup_dir), job)
+
+
+def _create_snapshot(conn, sounds_dir, backup_dir, job):
+    blob_dir = backup_dir / "blobs"
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    index = HashIndex(blob_dir / "index.json")
+    stats = {"files": 0, "stored": 0, "reused": 0, "bytes_stored": 0, "bytes_total": 0}
+
+    files = [p for p in sorted(sounds_dir.rglob("*")) if p.is_file()] if sounds_dir.exists() else []
+    if job:
+        job.set_total(nbytes=sum(p.stat().st_size for p in files), entries=len(files))
+    sounds = {}
+    try:
+        for path in files:
+            digest = index.digest(path)
+            written = store_blob(path, digest, blob_dir)
+            size = path.stat().st_size
+            sounds[path.relative_to(sounds_dir).as_posix()] = {"sha256": digest, "size": size}
+            stats["files"] += 1
+            stats["bytes_total"] += size
+            if written:
+                stats["stored"] += 1
+                stats["bytes_stored"] += written
+            else:
+                stats["reused"] += 1
+            if job:
+                job.progress(size, 1, message=path.name)
+    finally:
+        # Keep the hashes computed so far even if the job was cancelled
+        index.save()
+
+    alarms, settings, users = _dump_database(conn)
+    now = datetime.now()
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "created": now.isoformat(timespec="seconds"),
+        "alarms": alarms,
+        "settings": settings,
+        "sounds": sounds,
+    }
+    path = backup_dir / f"{SNAPSHOT_PREFIX}{now.strftime('%Y%m%d-%H%M%S')}.json"
+    suffix = 1
+    while path.exists():
+        suffix += 1
+        path = backup_dir / f"{SNAPSHOT_PREFIX}{now.strftime('%Y%m%d-%H%M%S')}-{suffix}.json"
+    # Users first, so a manifest never exists without them
+    _write_json(users_path(path), {"format": FORMAT, "version": VERSION, "users": users})
+    _write_json(path, manifest)
+    return path, stats
+
+
+def load_snapshot(path):
+    try:
+        manifest = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot read snapshot {Path(path).name}: {e}")
+    if manifest.get("format") != FORMAT or manifest.get("version", 0) > VERSION:
+        raise SnapshotError(f"{Path(path).name} is not a supported snapshot")
+    return manifest
+
+
+def _strip_passwords(users):
+    return [{k: v for k, v in u.items() if k != "password"} for u in users]
+
+
+def load_users(snapshot_path):
+    """User accounts saved with a snapshot (never with passwords)."""
+    path = users_path(snapshot_path)
+    if path.exists():
+        try:
+            return _strip_passwords(json.loads(path.read_text()).get("users", []))
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Cannot read {path.name}: {e}")
+    # Manifests written before users had their own file
+    return _strip_passwords(load_snapshot(snapshot_path).get("users", []))
+
+
+def split_users(backup_dir=BACKUP_DIR):
+    """Move the users (and their plaintext passwords) out of older manifests
+    into password-free users files. Returns the number of manifests rewritten."""
+    count = 0
+    with _store_lock:
+        for path in Path(backup_dir).glob(f"{SNAPSHOT_PREFIX}*.json"):
+            try:
+                manifest = load_snapshot(path)
+            except SnapshotError:
+                continue
+            if "users" not in manifest:
+                continue
+            if not users_path(path).exists():
+                _write_json(users_path(path), {"format": FORMAT, "version": VERSION,
+                                               "users": _strip_passwords(manifest["users"])})
+            del manifest["users"]
+            _write_json(path, manifest)
+            count += 1
+    return count
+
+
+def contains_users(path):
+    """True if the backup file at `path` holds user accounts (users files,
+    and manifests or exported ZIPs from before users had their own file)."""
+    path = Path(path)
+    if path.name.startswith(USERS_PREFIX):
+        return True
+    try:
+        if path.suffix == ".json":
+            return "users" in json.loads(path.read_text())
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zipf:
+                if "snapshot.json" in zipf.namelist():
+                    return "users" in json.loads(zipf.read("snapshot.json"))
+    except (OSError, ValueError, zipfile.BadZipFile):
+        # Unreadable: treat as sensitive
+        return True
+    return False
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Newest first, with the size of each snapshot's sound data."""
+    result = []
+    for path in sorted(Path(backup_dir).glob(f"{SNAPSHOT_PREFIX}*.json"), reverse=True):
+        try:
+            manifest = load_snapshot(path)
+        except SnapshotError:
+            continue
+        sounds = manifest.get("sounds", {})
+        result.append({
+            "filename": path.name,
+            "created": manifest.get("created", "").replace("T", " "),
+            "alarms": len(manifest.get("alarms", [])),
+            "sounds": len(sounds),
+            "size": sum(s.get("size", 0) for s in sounds.values()),
+        })
+    return result
+
+
+def missing_blobs(manifest, blob_dir=BLOB_DIR):
+    return sorted(name for name, s in manifest.get("sounds", {}).items()
+                  if not blob_path(s["sha256"], blob_dir).exists())
+
+
+def export_zip(manifest, dest, blob_dir=BLOB_DIR, job=None):
+    """Write `manifest` as a legacy backup zip (alarms.json + sounds/)."""
+    missing = missing_blobs(manifest, blob_dir)
+    if missing:
+        raise SnapshotError(f"Snapshot is missing sound data for: {', '.join(missing)}")
+    sounds = manifest.get("sounds", {})
+    if job:
+        job.set_total(nbytes=sum(s["size"] for s in sounds.values()), entries=len(sounds))
+    dest = Path(dest)
+    fd, tmp = tempfile.mkstemp(dir=str(dest.parent), prefix=".tmp-", suffix=".zip")
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr("alarms.json", json.dumps(manifest.get("alarms", []), indent=2))
+            zipf.writestr("snapshot.json", json.dumps({k: v for k, v in manifest.items() if k != "users"}, indent=2))
+            for name, s in sorted(sounds.items()):
+                compress = zipfile.ZIP_STORED if Path(name).suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+                zipf.write(blob_path(s["sha256"], blob_dir), f"sounds/{name}", compress_type=compress)
+                if job:
+                    job.progress(s["size"], 1, message=name)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return dest
+
+
+# ---------- restore ----------
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+def _exchange(a, b):
+    """Swap two directories. Uses renameat2(RENAME_EXCHANGE) where the kernel
+    and libc support it, so there is no moment without a sounds/ directory."""
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        renameat2 = None
+    if renameat2 is not None:
+        if renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+            raise OSError(err, os.strerror(err), str(a))
+    tmp = Path(f"{a}.swap")
+    os.rename(a, tmp)
+    try:
+        os.rename(b, a)
+    except OSError:
+        os.rename(tmp, a)
+        raise
+    os.rename(tmp, b)
+
+
+def _check_name(name):
+    parts = Path(name).parts
+    if not parts or Path(name).is_absolute() or ".." in parts:
+        raise SnapshotError(f"Refusing to restore outside sounds/: {name}")
+
+
+def validate_alarms(alarms):
+    """Check restored alarm rows before anything is changed. Returns rows ready for INSERT."""
+    if not isinstance(alarms, list):
+        raise SnapshotError("alarms must be a list")
+    rows = []
+    for n, alarm in enumerate(alarms, 1):
+        try:
+            day = int(alarm["day_of_week"])
+            hour, minute = (int(x) for x in str(alarm["time_str"]).split(":"))
+            sound = alarm["sound_path"]
+            enabled = int(alarm.get("enabled", 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise SnapshotError(f"Alarm {n} is malformed: {alarm!r}")
+        if not (0 <= day <= 6 and 0 <= hour <= 23 and 0 <= minute <= 59):
+            raise SnapshotError(f"Alarm {n} has an invalid day or time: {alarm!r}")
+        if not isinstance(sound, str) or not sound:
+            raise SnapshotError(f"Alarm {n} has no sound file")
+        try:
+            # Backups from before recurrence rules have none of these keys: weekly
+            rule = recurrence.normalize(dict(alarm, day_of_week=day))
+        except ValueError as e:
+            raise SnapshotError(f"Alarm {n} has an invalid schedule: {e}")
+        rows.append((alarm.get("id"), rule["day_of_week"], f"{hour:02d}:{minute:02d}", sound,
+                     1 if enabled else 0, alarm.get("last_run_date"), rule["recurrence"],
+                     rule["month_week"], rule["start_date"], rule["end_date"], rule["exceptions"]))
+    return rows
+
+
+class RestoreStage:
+    """A restore built up off to the side and applied all at once.
+
+    Sounds are written to a staging directory next to sounds/ that starts as
+    a hard-linked copy of the current library, so files the backup does not
+    mention are kept. apply() then replaces the alarms (staged in a temporary
+    table), settings and users in one transaction and swaps the directories
+    just before committing. If anything fails, the swap is undone and the
+    transaction rolled back, leaving the live system exactly as it was.
+    """
+
+    def __init__(self, sounds_dir=SOUNDS_DIR):
+        self.sounds_dir = Path(sounds_dir)
+        self.sounds_dir.parent.mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix=".sounds-restore-", dir=str(self.sounds_dir.parent)))
+        # mkdtemp creates 0700; the swapped-in directory should look like the old one
+        os.chmod(self.path, self.sounds_dir.stat().st_mode & 0o7777 if self.sounds_dir.exists() else 0o755)
+        if self.sounds_dir.exists():
+            for src in self.sounds_dir.rglob("*"):
+                dst = self.path / src.relative_to(self.sounds_dir)
+                if src.is_dir():
+                    dst.mkdir(exist_ok=True)
+                    continue
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+
+    def open(self, name):
+        """Writable file for sounds/`name` in the stage."""
+        _check_name(name)
+        target = self.path / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Never write through a hard link into the live library
+        target.unlink(missing_ok=True)
+        return open(target, "wb")
+
+    def add_file(self, name, src):
+        with self.open(name) as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out, READ_CHUNK)
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def apply(self, conn, alarm_rows=None, settings=None, users=None):
+        """Replace the database contents and swap in the staged sounds, atomically.
+        Returns the usernames of accounts created without a usable password."""
+        if alarm_rows is not None:
+            conn.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS restore_alarms (
+                    id INTEGER, day_of_week INTEGER, time_str TEXT,
+                    sound_path TEXT, enabled INTEGER, last_run_date TEXT,
+                    recurrence TEXT, month_week INTEGER, start_date TEXT,
+                    end_date TEXT, exceptions TEXT
+                )
+                """
+            )
+            conn.execute("DELETE FROM temp.restore_alarms")
+            conn.executemany(
+                f"INSERT INTO temp.restore_alarms VALUES ({', '.join('?' * len(ALARM_COLUMNS))})",
+                alarm_rows
+            )
+            # Only the temp table was written so far; take the write lock now
+            conn.commit()
+
+        swapped = False
+        created = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if alarm_rows is not None:
+                conn.execute("DELETE FROM alarms")
+                conn.execute(
+                    f"""
+                    INSERT INTO alarms ({', '.join(ALARM_COLUMNS)})
+                    SELECT {', '.join(ALARM_COLUMNS)}
+                    FROM temp.restore_alarms
+                    """
+                )
+            if settings:
+                columns = {r["name"] for r in conn.execute("PRAGMA table_info(settings)")} - {"id"}
+                settings = {k: v for k, v in settings.items() if k in columns}
+                if settings:
+                    conn.execute(
+                        f"UPDATE settings SET {', '.join(f'{k} = ?' for k in settings)} WHERE id = 1",
+                        list(settings.values())
+                    )
+            for user in users or []:
+                # Matched by username; accounts not in the backup are left alone.
+                # Passwords are not backed up: existing accounts keep theirs, new
+                # ones get a random one until an administrator sets it.
+                row = conn.execute("SELECT id FROM users WHERE username = ?", (user["username"],)).fetchone()
+                if row:
+                    user_id = row[0]
+                    conn.execute("UPDATE users SET role = ? WHERE id = ?", (user["role"], user_id))
+                else:
+                    user_id = conn.execute(
+                        "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                        (user["username"], secrets.token_urlsafe(32), user["role"])
+                    ).lastrowid
+                    created.append(user["username"])
+                conn.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO user_permissions (user_id, permission) VALUES (?, ?)",
+                    [(user_id, p) for p in user.get("permissions", [])]
+                )
+
+            if self.sounds_dir.exists():
+                _exchange(self.sounds_dir, self.path)
+            else:
+                os.rename(self.path, self.sounds_dir)
+                self.path.mkdir()
+            swapped = True
+            conn.commit()
+        except BaseException:
+            if swapped:
+                _exchange(self.sounds_dir, self.path)
+            conn.rollback()
+            raise
+        finally:
+            if alarm_rows is not None:
+                conn.execute("DROP TABLE IF EXISTS temp.restore_alarms")
+        # The stage now holds the previous library
+        self.discard()
+        return created
+
+
+def restore_snapshot(manifest, conn, sounds_dir=SOUNDS_DIR, blob_dir=BLOB_DIR, users=None, job=None):
+    """Replace alarms and settings (and the accounts in `users`, see load_users)
+    with the snapshot's, and restore its sounds. Everything is staged first; see
+    RestoreStage. Returns the usernames created without a usable password."""
+    missing = missing_blobs(manifest, blob_dir)
+    if missing:
+        raise SnapshotError(f"Snapshot is missing sound data for: {', '.join(missing)}")
+    sounds = manifest.get("sounds", {})
+    for name in sounds:
+        _check_name(name)
+    alarm_rows = validate_alarms(manifest.get("alarms", []))
+
+    if job:
+        job.set_total(nbytes=sum(s["size"] for s in sounds.values()), entries=len(sounds))
+    stage = RestoreStage(sounds_dir)
+    try:
+        for name, s in sounds.items():
+            stage.add_file(name, blob_path(s["sha256"], blob_dir))
+            if job:
+                job.progress(s["size"], 1, message=name)
+        if job:
+            job.message = "Applying"
+        return stage.apply(conn, alarm_rows, manifest.get("settings"), users)
+    finally:
+        stage.discard()
+
+
+def restore_zip(path, conn, sounds_dir=SOUNDS_DIR, job=None):
+    """Restore a classic backup zip (alarms.json + sounds/), staged like restore_snapshot.
+    Alarms are renumbered; a zip without alarms.json only restores sounds."""
+    if not zipfile.is_zipfile(path):
+        raise SnapshotError("Backup file is not a valid ZIP archive")
+    with zipfile.ZipFile(path) as zipf:
+        alarm_rows = None
+        if "alarms.json" in zipf.namelist():
+            try:
+                alarms = json.loads(zipf.read("alarms.json"))
+            except ValueError as e:
+                raise SnapshotError(f"alarms.json is not valid JSON: {e}")
+            # Old backups carry their own IDs; let SQLite assign new ones
+            alarm_rows = [(None, *row[1:]) for row in validate_alarms(alarms)]
+        members = [m for m in zipf.infolist() if m.filename.startswith("sounds/") and not m.is_dir()]
+        for member in members:
+            _check_name(member.filename[len("sounds/"):])
+        if alarm_rows is None and not members:
+            raise SnapshotError("Backup contains neither alarms.json nor sounds/")
+
+        if job:
+            job.set_total(nbytes=sum(m.file_size for m in members), entries=len(members))
+        stage = RestoreStage(sounds_dir)
+        try:
+            for member in members:
+                # Reading checks each member's CRC, so a damaged archive fails here
+                with zipf.open(member) as src, stage.open(member.filename[len("sounds/"):]) as out:
+                    shutil.copyfileobj(src, out, READ_CHUNK)
+                if job:
+                    job.progress(member.file_size, 1, message=member.filename)
+            if job:
+                job.message = "Applying"
+            stage.apply(conn, alarm_rows)
+        finally:
+            stage.discard()
+
+
+def gc(backup_dir=BACKUP_DIR):
+    """Delete blobs (and hash-index entries) no snapshot references. Returns bytes freed."""
+    with _store_lock:
+        return _gc(Path(backup_dir))
+
+
+def _gc(backup_dir):
+    blob_dir = backup_dir / "blobs"
+    if not blob_dir.exists():
+        return 0
+    referenced = set()
+    for path in backup_dir.glob(f"{SNAPSHOT_PREFIX}*.json"):
+        try:
+            manifest = load_snapshot(path)
+        except SnapshotError:
+            # Keep everything rather than risk deleting data a damaged manifest still needs
+            return 0
+        referenced.update(s["sha256"] for s in manifest.get("sounds", {}).values())
+    freed = 0
+    for blob in blob_dir.glob("??/*"):
+        if blob.name not in referenced:
+            freed += blob.stat().st_size
+            blob.unlink()
+    index = HashIndex(blob_dir / "index.json")
+    index.prune(referenced)
+    index.save()
+    return freed
@@ -0,0 +1,337 @@
+"""
+Sound library index.
+The sounds table holds one row per WAV file in sounds/: its size and mtime,
+SHA-256, parsed header (rate, channels, sample width, data offset) and
+duration. Pages and the audio engine read the table instead of listing the
+directory and parsing headers, which is slow on an SD card with hundreds of
+clips.
+
+Rows are refreshed when app.py changes a file and by Watcher, which follows
+the directory with inotify (polling when inotify is unavailable). Files are
+only re-read when their size or mtime changed.
+
+Uploads go through ingest(), which streams them to disk instead of holding
+them in memory; app.py then converts them once to the sink format in the
+background and records the original format here.
+"""
+import ctypes
+import hashlib
+import os
+import select
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import db
+import pcm
+from fileutil import hash_file
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = db.DB_PATH
+SOUNDS_DIR = APP_DIR / "sounds"
+
+POLL_INTERVAL = 10.0    # seconds between scans when inotify is unavailable
+RESCAN_INTERVAL = 600.0 # full scan even with inotify, in case an event was missed
+DEBOUNCE = 0.5          # wait for a burst of events to settle before indexing
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+MAX_UPLOAD_BYTES = int(os.getenv("CHURCHBELL_MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_CHUNK = 1024 * 1024
+
+# Columns refreshed from the file itself; the rest (source_*, normalized) describe
+# how it was ingested and survive re-indexing
+COLUMNS = ("name", "size", "mtime_ns", "sha256", "rate", "channels", "width",
+           "frames", "data_offset", "data_size", "duration", "error")
+
+
+class UploadError(ValueError):
+    pass
+
+
+def is_sound(name):
+    return name.lower().endswith(".wav") and not name.startswith(".")
+
+
+def scan_file(path):
+    """Metadata row for one file. Unreadable WAVs are indexed with `error` set."""
+    path = Path(path)
+    st = path.stat()
+    row = dict.fromkeys(COLUMNS)
+    row.update(name=path.name, size=st.st_size, mtime_ns=st.st_mtime_ns)
+    try:
+        info = pcm.wav_info(path)
+        row.update(rate=info.rate, channels=info.channels, width=info.width,
+                   frames=info.frames, data_offset=info.data_offset,
+                   data_size=info.data_size, duration=info.frames / info.rate)
+    except pcm.WavError as e:
+        row["error"] = str(e)
+    row["sha256"] = hash_file(path)
+    return row
+
+
+def update(conn, names, sounds_dir=SOUNDS_DIR, force=False):
+    """Re-index the named files; names that no longer exist are removed.
+    Files whose size and mtime match their row are skipped unless `force`."""
+    sounds_dir = Path(sounds_dir)
+    known = {}
+    if not force:
+        for r in conn.execute(
+            f"SELECT name, size, mtime_ns FROM sounds WHERE name IN ({','.join('?' * len(names))})",
+            list(names)
+        ):
+            known[r["name"]] = (r["size"], r["mtime_ns"])
+    rows, gone = [], []
+    for name in names:
+        try:
+            if name in known:
+                st = os.stat(sounds_dir / name)
+                if known[name] == (st.st_size, st.st_mtime_ns):
+                    continue
+            rows.append(scan_file(sounds_dir / name))
+        except FileNotFoundError:
+            gone.append((name,))
+        except OSError as e:
+            print(f"[WARN] Could not index {name}: {e}", flush=True)
+    if rows:
+        conn.executemany(
+            f"INSERT INTO sounds ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join(':' + c for c in COLUMNS)}) "
+            f"ON CONFLICT(name) DO UPDATE SET "
+            f"{', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])}",
+            rows,
+        )
+    if gone:
+        conn.executemany("DELETE FROM sounds WHERE name = ?", gone)
+    conn.commit()
+    return [r["name"] for r in rows], [g[0] for g in gone]
+
+
+def sync(conn, sounds_dir=SOUNDS_DIR):
+    """Reconcile the table with the directory. Returns (changed, removed) names."""
+    known = {r["name"]: (r["size"], r["mtime_ns"])
+             for r in conn.execute("SELECT name, size, mtime_ns FROM sounds")}
+    changed = []
+    try:
+        with os.scandir(sounds_dir) as it:
+            for entry in it:
+                if not is_sound(entry.name) or not entry.is_file():
+                    continue
+                st = entry.stat()
+                if known.pop(entry.name, None) != (st.st_size, st.st_mtime_ns):
+                    changed.append(entry.name)
+    except FileNotFoundError:
+        pass
+    # Whatever is left in `known` was not found on disk
+    return update(conn, sorted(changed) + sorted(known), sounds_dir, force=True)
+
+
+def list_sounds(conn):
+    return conn.execute("SELECT * FROM sounds ORDER BY name").fetchall()
+
+
+def get(conn, name):
+    return conn.execute("SELECT * FROM sounds WHERE name = ?", (name,)).fetchone()
+
+
+def wav_info(row):
+    """pcm.WavInfo from an index row, or None if the file could not be parsed."""
+    if row["error"] or row["rate"] is None:
+        return None
+    return pcm.WavInfo(row["rate"], row["channels"], row["width"], row["frames"],
+                       row["data_offset"], row["data_size"])
+
+
+# ---------- ingest ----------
+
+def ingest(stream, name, sounds_dir=SOUNDS_DIR, max_bytes=MAX_UPLOAD_BYTES):
+    """Copy an uploaded WAV from `stream` into sounds/`name` in chunks.
+
+    The data is hashed and size-checked as it arrives and lands in a hidden
+    temp file, which is only renamed into place once it has parsed as a WAV.
+    Returns (sha256, size, pcm.PcmFormat).
+    """
+    sounds_dir = Path(sounds_dir)
+    sounds_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(sounds_dir), prefix=".tmp-upload-", suffix=".wav")
+    try:
+        h = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                h.update(chunk)
+                f.write(chunk)
+        try:
+            fmt = pcm.info_format(pcm.wav_info(tmp))
+        except pcm.WavError:
+            raise UploadError("Not a PCM WAV file")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, sounds_dir / name)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return h.hexdigest(), size, fmt
+
+
+def record_source(conn, name, sha256, fmt, normalized=False):
+    """Remember what an ingested file looked like as uploaded."""
+    conn.execute(
+        "UPDATE sounds SET source_sha256 = ?, source_format = ?, normalized = ? WHERE name = ?",
+        (sha256, pcm.describe(fmt), int(normalized), name),
+    )
+    conn.commit()
+
+
+# ---------- watcher ----------
+
+class _Inotify:
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Yield (wd, mask, name) for the events that arrive within `timeout` seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Keeps the sounds table in step with sounds/ from a background thread.
+
+    `on_change(changed, removed)` is called (from the watcher thread) after
+    each batch of index updates.
+    """
+
+    def __init__(self, sounds_dir=SOUNDS_DIR, db_path=DB_PATH, on_change=None):
+        self.sounds_dir = Path(sounds_dir)
+        self.db_path = db_path
+        self.on_change = on_change
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sound-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _index(self, names=None):
+        try:
+            with db.connection(self.db_path) as conn:
+                if names is None:
+                    changed, removed = sync(conn, self.sounds_dir)
+                else:
+                    changed, removed = update(conn, sorted(names), self.sounds_dir)
+        except Exception as e:
+            print(f"[ERROR] Sound index update failed: {e}", flush=True)
+            return
+        if changed or removed:
+            print(f"[INFO] Sound index: {len(changed)} updated, {len(removed)} removed", flush=True)
+            if self.on_change:
+                try:
+                    self.on_change(changed, removed)
+                except Exception as e:
+                    print(f"[ERROR] Sound change handler failed: {e}", flush=True)
+
+    def _run(self):
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable ({e}); polling sounds/ every {POLL_INTERVAL:g}s", flush=True)
+            self._poll()
+            return
+        try:
+            self._watch(inotify)
+        finally:
+            inotify.close()
+
+    def _poll(self):
+        self.mode = "poll"
+        while not self._stop.is_set():
+            self._index()
+            self._stop.wait(POLL_INTERVAL)
+
+    def _watch(self, inotify):
+        self.mode = "inotify"
+        wd = None
+        pending = set()
+        rescan_at = 0.0
+        while not self._stop.is_set():
+            if wd is None:
+                try:
+                    wd = inotify.add_watch(self.sounds_dir)
+                    rescan_at = 0.0  # (re)attached: catch up with a full scan
+                except OSError:
+                    # sounds/ missing, e.g. mid-restore; try again shortly
+                    self._stop.wait(POLL_INTERVAL)
+                    continue
+            if time.monotonic() >= rescan_at:
+                pending.clear()
+                self._index()
+                rescan_at = time.monotonic() + RESCAN_INTERVAL
+            events = list(inotify.read(DEBOUNCE if pending else 1.0))
+            for event_wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    rescan_at = 0.0
+                elif event_wd != wd:
+                    continue  # left over from a directory we stopped watching
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    # The directory itself was replaced (restores swap it in)
+                    if not mask & IN_IGNORED:
+                        inotify.rm_watch(wd)
+                    wd = None
+                elif is_sound(name):
+                    pending.add(name)
+            if pending and not events:
+                names, pending = pending, set()
+                self._index(names)
@@ -0,0 +1,134 @@
+// Test-button previews: start one, poll its progress and offer a Stop button.
+// Used by the Bell Scheduler and Text-to-Speech pages.
+
+function escapeHtml(text) {
+  const div = document.createElement('div');
+  div.textContent = text;
+  return div.innerHTML;
+}
+
+function testSound(filename, buttonElement, url) {
+  const originalText = buttonElement.textContent;
+  buttonElement.textContent = 'Testing...';
+  buttonElement.disabled = true;
+  
+  // Create status display
+  const debugDiv = document.createElement('div');
+  debugDiv.className = 'alert alert-info mt-2';
+  debugDiv.id = 'test-debug-' + filename;
+  debugDiv.innerHTML = `<strong>Starting:</strong> <code>${escapeHtml(filename)}</code>`;
+  buttonElement.parentElement.parentElement.appendChild(debugDiv);
+  
+  const finish = () => {
+    buttonElement.textContent = originalText;
+    buttonElement.disabled = false;
+  };
+  const fail = message => {
+    debugDiv.className = 'alert alert-danger mt-2';
+    debugDiv.innerHTML = `<strong>Error:</strong> ${escapeHtml(message || 'Failed to play sound')}`;
+    finish();
+  };
+  
+  // The request returns as soon as playback has started; progress is polled
+  fetch(url || `/test_sound/${filename}`)
+    .then(previewJson)
+    .then(({ok, data}) => {
+      if (!ok) {
+        if (data.busy) {
+          debugDiv.className = 'alert alert-warning mt-2';
+          debugDiv.innerHTML = escapeHtml(data.error);
+          setTimeout(() => debugDiv.remove(), 5000);
+          finish();
+        } else {
+          fail(data.error);
+        }
+        return;
+      }
+      pollPreview(data, debugDiv, finish);
+    })
+    .catch(error => fail(error.message));
+}
+
+function renderPreview(preview, debugDiv) {
+  const position = preview.position != null ? preview.position.toFixed(1) + 's' : '';
+  const duration = preview.duration != null ? ' / ' + preview.duration.toFixed(1) + 's' : '';
+  if (preview.active) {
+    debugDiv.className = 'alert alert-info mt-2';
+    debugDiv.innerHTML = `<strong>Playing</strong> <code>${escapeHtml(preview.name)}</code> ` +
+      `${position}${duration} <small class="text-muted">(${preview.backend})</small> ` +
+      `<button type="button" class="btn btn-sm btn-outline-danger ms-2" ` +
+      `onclick="stopPreview('${preview.id}', this)">Stop</button>`;
+  } else if (preview.state === 'failed') {
+    debugDiv.className = 'alert alert-danger mt-2';
+    debugDiv.innerHTML = `<strong>Error:</strong> ${escapeHtml(preview.error || 'Failed to play sound')}`;
+  } else {
+    debugDiv.className = 'alert alert-success mt-2';
+    debugDiv.innerHTML = preview.state === 'done'
+      ? `<strong>Played</strong> <code>${escapeHtml(preview.name)}</code>`
+      : `<strong>${preview.state === 'preempted' ? 'Interrupted by a bell' : 'Stopped'}:</strong> ` +
+        `<code>${escapeHtml(preview.name)}</code>`;
+  }
+}
+
+const MAX_POLL_FAILURES = 5;  // consecutive network errors before giving up
+
+// Resolves to the JSON body, or rejects with a readable error when the server
+// answered with something else (e.g. a redirect to a login or dashboard page)
+function previewJson(response) {
+  const isJson = (response.headers.get('Content-Type') || '').includes('application/json');
+  if (!isJson) {
+    return Promise.reject(new Error(`Unexpected response from the server (HTTP ${response.status})`));
+  }
+  return response.json().then(data => ({status: response.status, ok: response.ok, data}));
+}
+
+function pollPreview(preview, debugDiv, finish, failures = 0) {
+  renderPreview(preview, debugDiv);
+  if (!preview.active) {
+    finish();
+    setTimeout(() => debugDiv.remove(), 3000);
+    return;
+  }
+  const fail = message => {
+    debugDiv.className = 'alert alert-danger mt-2';
+    debugDiv.innerHTML = `<strong>Error:</strong> ${escapeHtml(message)}`;
+    finish();
+  };
+  setTimeout(() => {
+    fetch(`/previews/${preview.id}`)
+      .then(response => previewJson(response).then(({status, ok, data}) => {
+        if (status === 404) {
+          // Forgotten by the server (restart or pruned): it is no longer playing
+          pollPreview({...preview, active: false, state: 'stopped'}, debugDiv, finish);
+        } else if (!ok) {
+          fail(data.error || `HTTP ${status}`);
+        } else {
+          pollPreview(data, debugDiv, finish);
+        }
+      }, error => fail(error.message)))
+      .catch(() => {
+        // Network error: retry a few times, then give up
+        if (failures + 1 >= MAX_POLL_FAILURES) {
+          fail('Lost contact with the server');
+        } else {
+          pollPreview(preview, debugDiv, finish, failures + 1);
+        }
+      });
+  }, 500);
+}
+
+function stopPreview(previewId, button) {
+  button.disabled = true;
+  fetch(`/previews/${previewId}/stop`, {method: 'POST'})
+    .then(previewJson)
+    .then(({ok, data}) => {
+      if (!ok) {
+        button.disabled = false;
+        button.title = data.error || 'Could not stop the preview';
+      }
+    })
+    .catch(error => {
+      button.disabled = false;
+      button.title = error.message;
+    });
+}
@@ -1,47 +1,80 @@
 #!/usr/bin/env python3
-import sqlite3
+"""
+Sync the ChurchBell alarms in the database into the user's crontab.
+A fingerprint of every entry written is kept in cron_state.json, so an
+unchanged schedule costs no crontab round-trips at all and a changed one
+only replaces the affected alarm blocks. Use --force to ignore the state
+file (e.g. after the crontab was edited by hand).
+
+Plain weekly alarms are ordinary cron lines. Cron cannot express monthly
+rules, date bounds or skipped dates, so those lines run every matching
+weekday (or on the date, for one-time alarms) behind a
+`recurrence.py --fire ID` guard that decides whether this is an occurrence.
+Alarms whose rule has ended get no line at all.
+"""
+import argparse
+import hashlib
+import json
+import os
 from pathlib import Path
 import subprocess
+from datetime import date
+
+import db
+import recurrence
 
 APP_DIR = Path(__file__).resolve().parent
-DB_PATH = APP_DIR / "bells.db"
+DB_PATH = db.DB_PATH
 PLAY_SCRIPT = APP_DIR / "play_cron_sound.sh"
+RECURRENCE_SCRIPT = APP_DIR / "recurrence.py"
+SCHEDULER_PID_FILE = APP_DIR / "scheduler.pid"
+STATE_PATH = APP_DIR / "cron_state.json"
+MARKER = "# ChurchBell Alarm ID"
+
+def scheduler_active():
+    """True when the scheduler daemon (scheduler.py) owns alarm playback."""
+    try:
+        pid = int(SCHEDULER_PID_FILE.read_text().strip())
+        os.kill(pid, 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+def resolve_sound_path(sound_path):
+    """Make a stored sound path absolute; relative paths live in APP_DIR/sounds."""
+    if not Path(sound_path).is_absolute():
+        return str((APP_DIR / "sounds" / Path(sound_path).name).resolve())
+    return sound_path
 
 def get_alarms():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, day_of_week, time_str, sound_path, enabled
-        FROM alarms
-        WHERE enabled = 1
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    """Enabled alarms whose rule can still fire, as recurrence.Rule objects."""
+    today = date.today()
+    with db.connection(DB_PATH) as conn:
+        rules = recurrence.load_rules(conn)
+    return [rule for rule in rules if rule.end is None or rule.end >= today]
 
 def build_cron_lines(alarms):
     lines = []
-    for row in alarms:
-        alarm_id = row["id"]
-        dow = row["day_of_week"]  # 0=Mon .. 6=Sun
-        time_str = row["time_str"]  # "HH:MM"
-        sound_path = row["sound_path"]
-
-        hour, minute = time_str.split(":")
-        # cron: minute hour * * day_of_week(1-7, Mon=1)
-        cron_dow = (dow + 1)  # 0->1, 6->7
+    for rule in alarms:
+        alarm_id = rule.id
+        sound_path = rule.row["sound_path"]
 
         # Convert to absolute paths
         play_script_abs = str(PLAY_SCRIPT.resolve())
-        # If sound_path is relative, make it absolute relative to APP_DIR/sounds
-        if not Path(sound_path).is_absolute():
-            sound_path_abs = str((APP_DIR / "sounds" / Path(sound_path).name).resolve())
+        sound_path_abs = resolve_sound_path(sound_path)
+        command = f"{play_script_abs} {sound_path_abs}"
+
+        if rule.kind == recurrence.ONCE:
+            # cron: minute hour day month *
+            when = f"{rule.minute} {rule.hour} {rule.start.day} {rule.start.month} *"
         else:
-            sound_path_abs = sound_path
+            # cron: minute hour * * day_of_week(1-7, Mon=1)
+            when = f"{rule.minute} {rule.hour} * * {rule.weekday + 1}"
+        if not rule.plain:
+            command = f"python3 {RECURRENCE_SCRIPT.resolve()} --fire {alarm_id} && {command}"
 
-        line = f"# ChurchBell Alarm ID {alarm_id}\n"
-        line += f"{int(minute)} {int(hour)} * * {cron_dow} {play_script_abs} {sound_path_abs}\n"
+        line = f"{MARKER} {alarm_id}\n"
+        line += f"{when} {command}\n"
         lines.append(line)
     return lines
 
@@ -59,31 +92,106 @@ def get_existing_crontab():
     except Exception:
         return ""
 
-def filter_out_churchbell(crontab_text):
+def parse_crontab(crontab_text):
+    """Split a crontab into foreign lines and our alarm blocks.
+
+    Returns (items, blocks): items keeps the original order, holding foreign
+    lines as strings and alarm blocks as their alarm id; blocks maps alarm id
+    to its two-line block. Duplicate blocks for the same id are dropped.
+    """
     lines = crontab_text.splitlines()
-    filtered = []
-    skip_next = False
-    for line in lines:
-        if line.strip().startswith("# ChurchBell Alarm ID"):
-            skip_next = True
-            continue
-        if skip_next:
-            skip_next = False
+    items = []
+    blocks = {}
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.strip().startswith(MARKER):
+            entry = lines[i + 1] if i + 1 < len(lines) else ""
+            try:
+                alarm_id = int(line.strip()[len(MARKER):])
+            except ValueError:
+                alarm_id = None
+            if alarm_id is not None and alarm_id not in blocks:
+                items.append(alarm_id)
+                blocks[alarm_id] = f"{line}\n{entry}\n"
+            i += 2
             continue
-        filtered.append(line)
-    return "\n".join(filtered).strip() + "\n"
+        items.append(line)
+        i += 1
+    return items, blocks
+
+def apply_diff(items, blocks, desired):
+    """Rebuild the crontab text, touching only alarm blocks that changed."""
+    out = []
+    for item in items:
+        if isinstance(item, int):
+            if item in desired:
+                out.append(desired[item].rstrip("\n"))
+        else:
+            out.append(item)
+    for alarm_id, block in desired.items():
+        if alarm_id not in blocks:
+            out.append(block.rstrip("\n"))
+    return "\n".join(out).strip() + "\n"
+
+def fingerprint(block):
+    return hashlib.sha1(block.encode()).hexdigest()
+
+def load_state():
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f).get("entries")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def save_state(entries):
+    tmp = STATE_PATH.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"entries": entries}, f)
+    os.replace(tmp, STATE_PATH)
 
 def write_crontab(new_text):
     proc = subprocess.Popen(["crontab", "-"], stdin=subprocess.PIPE, text=True)
     proc.communicate(new_text)
+    return proc.returncode == 0
+
+def sync(force=False):
+    """Bring the crontab in line with the database. Returns a summary dict."""
+    # While the scheduler daemon is running it plays the alarms itself,
+    # so only strip our entries to avoid every bell ringing twice.
+    alarms = [] if scheduler_active() else get_alarms()
+    desired = {rule.id: line for rule, line in zip(alarms, build_cron_lines(alarms))}
+    entries = {str(alarm_id): fingerprint(block) for alarm_id, block in desired.items()}
+    summary = {"added": 0, "changed": 0, "removed": 0, "written": False}
+
+    if not force and load_state() == entries:
+        return summary
+
+    items, blocks = parse_crontab(get_existing_crontab())
+    summary["added"] = len(desired.keys() - blocks.keys())
+    summary["removed"] = len(blocks.keys() - desired.keys())
+    summary["changed"] = sum(
+        1 for alarm_id in desired.keys() & blocks.keys()
+        if desired[alarm_id] != blocks[alarm_id]
+    )
+    if summary["added"] or summary["removed"] or summary["changed"] or force:
+        if not write_crontab(apply_diff(items, blocks, desired)):
+            raise RuntimeError("crontab - failed")
+        summary["written"] = True
+    save_state(entries)
+    return summary
 
 def main():
-    alarms = get_alarms()
-    cron = get_existing_crontab()
-    cron = filter_out_churchbell(cron)
-    alarm_lines = build_cron_lines(alarms)
-    new_cron = cron + ("\n".join(alarm_lines) + "\n" if alarm_lines else "")
-    write_crontab(new_cron)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true",
+                        help="ignore cron_state.json and rewrite the crontab")
+    args = parser.parse_args()
+    summary = sync(force=args.force)
+    if summary["written"]:
+        print(f"[OK] Crontab updated: {summary['added']} added, "
+              f"{summary['changed']} changed, {summary['removed']} removed")
+    else:
+        print("[INFO] Crontab already up to date")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+"""
+Upcoming-bells timeline.
+The next HORIZON of alarm occurrences is expanded once (recurrence.py) into
+a sorted list and kept until an alarm or setting changes, or the window has
+slid by REBUILD_AFTER. "What rings next" and "what rings today" are then
+bisections over the cached fire times, so a dashboard refreshed from many
+phones costs no database queries.
+"""
+import bisect
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import conflicts
+import db
+import recurrence
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = db.DB_PATH
+
+HORIZON_DAYS = 7
+REBUILD_AFTER = 3600.0  # seconds; keeps a full HORIZON_DAYS ahead of now
+
+
+class Snapshot:
+    """One immutable build of the timeline."""
+
+    __slots__ = ("version", "built_at", "until", "times", "entries", "alarm_count", "enabled_count",
+                 "_index")
+
+    def __init__(self, version, built_at, until, entries, alarm_count, enabled_count):
+        self.version = version
+        self.built_at = built_at
+        self.until = until
+        self.entries = entries
+        self.times = [e["ts"] for e in entries]
+        self.alarm_count = alarm_count
+        self.enabled_count = enabled_count
+        self._index = None
+
+    @property
+    def index(self):
+        """conflicts.IntervalIndex over these bells, built on first use."""
+        if self._index is None:
+            self._index = conflicts.IntervalIndex(
+                conflicts.interval(e["ts"], e["alarm_id"], e["sound"], e["duration"]) for e in self.entries
+            )
+        return self._index
+
+    def after(self, ts, limit=None):
+        """Entries firing strictly after `ts`, earliest first."""
+        i = bisect.bisect_right(self.times, ts)
+        return self.entries[i:] if limit is None else self.entries[i:i + limit]
+
+    def between(self, t1, t2):
+        """Entries firing in [t1, t2)."""
+        return self.entries[bisect.bisect_left(self.times, t1):bisect.bisect_left(self.times, t2)]
+
+
+class Timeline:
+    """Thread-safe cache of the upcoming occurrences of every enabled alarm."""
+
+    def __init__(self, db_path=DB_PATH, horizon_days=HORIZON_DAYS, rebuild_after=REBUILD_AFTER):
+        self.db_path = db_path
+        self.horizon = horizon_days * 86400
+        self.rebuild_after = rebuild_after
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._changes = 0
+
+    def invalidate(self):
+        """Drop the cached timeline; the next lookup rebuilds it."""
+        self._changes += 1
+        self._snapshot = None
+
+    def _build(self, now):
+        with db.connection(self.db_path) as conn:
+            counts = conn.execute(
+                "SELECT COUNT(*) AS total, COALESCE(SUM(enabled), 0) AS enabled FROM alarms"
+            ).fetchone()
+            durations = dict(conn.execute(
+                "SELECT name, duration FROM sounds WHERE duration IS NOT NULL"
+            ).fetchall())
+            entries = []
+            for ts, rule in recurrence.occurrences_between(conn, now, now + self.horizon):
+                sound = Path(rule.row["sound_path"]).name
+                entries.append({
+                    "ts": ts,
+                    "time": datetime.fromtimestamp(ts).isoformat(timespec="minutes"),
+                    "alarm_id": rule.id,
+                    "sound": sound,
+                    "duration": durations.get(sound),
+                    "schedule": recurrence.describe(rule.row),
+                })
+        self._version += 1
+        return Snapshot(self._version, now, now + self.horizon, entries,
+                        counts["total"], counts["enabled"])
+
+    def snapshot(self, now=None):
+        """The current timeline, rebuilt first if it was invalidated or has aged out."""
+        now = time.time() if now is None else now
+        snap = self._snapshot
+        if snap is not None and snap.built_at <= now < snap.built_at + self.rebuild_after:
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or not snap.built_at <= now < snap.built_at + self.rebuild_after:
+                started = time.perf_counter()
+                changes = self._changes
+                snap = self._build(now)
+                # An invalidate() during the build means it may have missed that change
+                if self._changes == changes:
+                    self._snapshot = snap
+                print(f"[INFO] Timeline rebuilt: {len(snap.entries)} bells in the next "
+                      f"{self.horizon // 86400} days ({(time.perf_counter() - started) * 1000:.0f} ms)", flush=True)
+            return snap
+
+    def next_bell(self, now=None):
+        now = time.time() if now is None else now
+        upcoming = self.snapshot(now).after(now, 1)
+        return upcoming[0] if upcoming else None
+
+    def today(self, now=None):
+        """Today's remaining bells."""
+        now = time.time() if now is None else now
+        tomorrow = date.fromtimestamp(now) + timedelta(days=1)
+        return self.snapshot(now).between(now, recurrence.epoch(tomorrow, 0, 0))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Text-to-speech announcements.
+A message ("Mass begins in five minutes") is synthesized offline by a local
+engine and saved into sounds/ as tts-<name>.wav, so alarms schedule and play
+it like any other sound: nothing is synthesized at fire time.
+
+    espeak  espeak-ng (or espeak) from the command line
+    stub    a short tone per word, for tests and machines without a speech engine
+
+Renders are kept in cache/tts/, named by a SHA-256 of the engine, voice, rate
+and text, and converted once to the audio engine's output format. Saving a
+message that was rendered before, or re-creating a file deleted from
+sounds/, is a file copy. The cache is trimmed to CHURCHBELL_TTS_CACHE_MB,
+least recently used first.
+
+Usage:
+    tts.py OUTPUT.wav "text" [--voice en] [--rate 160] [--engine espeak|stub]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+import pcm
+from audio_engine import SINK_FORMAT
+
+APP_DIR = Path(__file__).resolve().parent
+SOUNDS_DIR = APP_DIR / "sounds"
+CACHE_DIR = APP_DIR / "cache" / "tts"
+CACHE_BYTES = int(os.getenv("CHURCHBELL_TTS_CACHE_MB", "50")) * 1024 * 1024
+DEFAULT_ENGINE = os.getenv("CHURCHBELL_TTS_ENGINE", "espeak")
+OUTPUT_PREFIX = "tts-"
+TTS_VERSION = 1          # bump when rendering changes, to invalidate old renders
+MAX_TEXT = 500
+MIN_RATE, MAX_RATE = 80, 400  # words per minute
+DEFAULT_VOICE = "en"
+DEFAULT_RATE = 150
+RENDER_TIMEOUT = 120
+
+TtsParams = namedtuple("TtsParams", "text voice rate engine")
+
+
+class TtsError(ValueError):
+    pass
+
+
+def output_name(name):
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "message"
+    return f"{OUTPUT_PREFIX}{slug}.wav"
+
+
+def params(text, voice=None, rate=None, engine=None):
+    """Validated TtsParams; whitespace in the text is collapsed so trivial edits share a render."""
+    text = " ".join(str(text or "").split())
+    if not text:
+        raise TtsError("the message is empty")
+    if len(text) > MAX_TEXT:
+        raise TtsError(f"the message is longer than {MAX_TEXT} characters")
+    voice = (voice or DEFAULT_VOICE).strip()
+    if not re.fullmatch(r"[A-Za-z0-9_+-]{1,40}", voice):
+        raise TtsError(f"invalid voice {voice!r}")
+    try:
+        rate = int(rate or DEFAULT_RATE)
+    except (TypeError, ValueError):
+        raise TtsError("rate must be a whole number of words per minute")
+    if not MIN_RATE <= rate <= MAX_RATE:
+        raise TtsError(f"rate must be between {MIN_RATE} and {MAX_RATE} words per minute")
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise TtsError(f"engine must be one of {', '.join(ENGINES)}")
+    return TtsParams(text, voice, rate, engine)
+
+
+# ---------- engines ----------
+
+def _espeak_binary():
+    return shutil.which("espeak-ng") or shutil.which("espeak")
+
+
+def _render_espeak(p, dest):
+    binary = _espeak_binary()
+    if binary is None:
+        raise TtsError("espeak-ng is not installed (sudo apt install espeak-ng)")
+    result = subprocess.run(
+        [binary, "-v", p.voice, "-s", str(p.rate), "-w", str(dest), "--stdin"],
+        input=p.text, text=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        timeout=RENDER_TIMEOUT, check=False,
+    )
+    if result.returncode != 0:
+        raise TtsError(f"{Path(binary).name} failed: {result.stderr.strip() or result.returncode}")
+
+
+def _render_stub(p, dest):
+    """One beep per word, its pitch and length derived from the word, so renders are deterministic."""
+    rate = SINK_FORMAT.rate
+    word = int(rate * 60.0 / p.rate)  # samples per word at the requested speaking rate
+    samples = array("h")
+    for w in p.text.split():
+        pitch = 440.0 + hashlib.sha256(f"{p.voice}:{w}".encode()).digest()[0] * 2
+        tone = int(word * min(0.8, 0.2 + 0.1 * len(w)))
+        step = 2 * math.pi * pitch / rate
+        samples.extend(int(8000 * math.sin(step * i)) for i in range(tone))
+        samples.extend([0] * (word - tone))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    pcm.write_wav(dest, samples.tobytes(), pcm.PcmFormat(rate, 1, 2))
+
+
+ENGINES = {"espeak": _render_espeak, "stub": _render_stub}
+
+
+def available(engine=None):
+    engine = engine or DEFAULT_ENGINE
+    return engine == "stub" or (engine == "espeak" and _espeak_binary() is not None)
+
+
+# ---------- cache ----------
+
+def cache_key(p):
+    blob = json.dumps({"version": TTS_VERSION, **p._asdict()}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _prune_cache(cache_dir, max_bytes=CACHE_BYTES):
+    """Drop least recently used renders until the cache fits in `max_bytes` (the newest always stays)."""
+    renders = []
+    for path in cache_dir.glob("*.wav"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        renders.append((st.st_mtime, st.st_size, path))
+    renders.sort(reverse=True)
+    total = 0
+    for n, (_, size, path) in enumerate(renders):
+        total += size
+        if n and total > max_bytes:
+            path.unlink(missing_ok=True)
+
+
+def cached_render(p, cache_dir=CACHE_DIR):
+    """(path of a WAV in the sink format for `p`, True if it came from the cache)."""
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"{cache_key(p)}.wav"
+    if path.exists():
+        os.utime(path)  # mark as recently used
+        return path, True
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(cache_dir), prefix=".tmp-", suffix=".wav")
+    os.close(fd)
+    try:
+        ENGINES[p.engine](p, tmp)
+        # Convert once here so playback never resamples
+        pcm.normalize_file(tmp, SINK_FORMAT)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _prune_cache(cache_dir)
+    return path, False
+
+
+def cache_stats(cache_dir=CACHE_DIR):
+    sizes = [p.stat().st_size for p in Path(cache_dir).glob("*.wav")] if Path(cache_dir).exists() else []
+    return {"renders": len(sizes), "bytes": sum(sizes), "max_bytes": CACHE_BYTES}
+
+
+def save(p, dest, cache_dir=CACHE_DIR):
+    """Render (or fetch from the cache) and copy the result to `dest`. Returns True on a cache hit."""
+    src, hit = cached_render(p, cache_dir)
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(dest.parent), prefix=".tmp-", suffix=".wav")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return hit
+
+
+def refresh(conn, sounds_dir=SOUNDS_DIR, ids=None):
+    """Save messages whose file in sounds/ is missing or out of date. Returns the files saved."""
+    sounds_dir = Path(sounds_dir)
+    sql = "SELECT id, name, text, voice, rate, engine, output, cache_key FROM tts_messages"
+    args = []
+    if ids is not None:
+        sql += f" WHERE id IN ({','.join('?' * len(ids))})"
+        args = list(ids)
+    saved = []
+    for row in conn.execute(sql, args).fetchall():
+        p = TtsParams(row["text"], row["voice"], row["rate"], row["engine"])
+        key = cache_key(p)
+        if key == row["cache_key"] and (sounds_dir / row["output"]).exists():
+            continue
+        try:
+            hit = save(p, sounds_dir / row["output"])
+        except (OSError, subprocess.SubprocessError, pcm.WavError, TtsError) as e:
+            print(f"[WARN] Message '{row['name']}' not rendered: {e}", flush=True)
+            continue
+        duration = pcm.wav_info(sounds_dir / row["output"]).frames / SINK_FORMAT.rate
+        conn.execute("UPDATE tts_messages SET cache_key = ?, duration = ? WHERE id = ?",
+                     (key, duration, row["id"]))
+        conn.commit()
+        saved.append(row["output"])
+        print(f"[INFO] {'Copied cached' if hit else 'Rendered'} message '{row['name']}' -> "
+              f"{row['output']} ({duration:.1f}s)", flush=True)
+    return saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a text-to-speech message to a WAV file")
+    parser.add_argument("output")
+    parser.add_argument("text")
+    parser.add_argument("--voice", default=DEFAULT_VOICE)
+    parser.add_argument("--rate", type=int, default=DEFAULT_RATE, help="words per minute")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, choices=sorted(ENGINES))
+    args = parser.parse_args(argv)
+    try:
+        p = params(args.text, args.voice, args.rate, args.engine)
+        hit = save(p, args.output)
+    except TtsError as e:
+        parser.error(str(e))
+    print(f"✓ Message {'copied from cache' if hit else 'rendered'}: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
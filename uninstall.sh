@@ -16,12 +16,14 @@ else
 fi
 SERVICE_NAME="churchbell.service"
 HOME_SERVICE_NAME="churchbell-home.service"
+SCHEDULER_SERVICE_NAME="churchbell-scheduler.service"
+AUDIO_SERVICE_NAME="churchbell-audio.service"
 
 echo "=== ChurchBell Uninstaller ==="
 echo "This will remove:"
 echo "  - Virtual environment (venv/)"
 echo "  - Database (bells.db)"
-echo "  - Systemd services (churchbell.service, churchbell-home.service)"
+echo "  - Systemd services (churchbell.service, churchbell-home.service, churchbell-scheduler.service, churchbell-audio.service)"
 echo ""
 echo "Your code, sound files, and backups will remain untouched."
 echo "Note: Services run as current user (no separate service user to remove)."
@@ -33,16 +35,22 @@ if [[ "$ans" != "y" && "$ans" != "Y" ]]; then
 fi
 
 echo "Stopping services..."
+sudo systemctl stop "$SCHEDULER_SERVICE_NAME" 2>/dev/null || true
+sudo systemctl stop "$AUDIO_SERVICE_NAME" 2>/dev/null || true
 sudo systemctl stop "$HOME_SERVICE_NAME" 2>/dev/null || true
 sudo systemctl stop "$SERVICE_NAME" 2>/dev/null || true
 
 echo "Disabling services..."
+sudo systemctl disable "$SCHEDULER_SERVICE_NAME" 2>/dev/null || true
+sudo systemctl disable "$AUDIO_SERVICE_NAME" 2>/dev/null || true
 sudo systemctl disable "$HOME_SERVICE_NAME" 2>/dev/null || true
 sudo systemctl disable "$SERVICE_NAME" 2>/dev/null || true
 
 echo "Removing systemd unit files..."
 sudo rm -f /etc/systemd/system/churchbell-home.service
 sudo rm -f /etc/systemd/system/churchbell.service
+sudo rm -f /etc/systemd/system/churchbell-scheduler.service
+sudo rm -f /etc/systemd/system/churchbell-audio.service
 
 # Clean up systemd state
 sudo systemctl daemon-reload
@@ -54,13 +62,14 @@ if [ -d "$APP_DIR/venv" ]; then
     echo "  ✓ Removed venv/"
 fi
 if [ -f "$APP_DIR/bells.db" ]; then
-    rm -f "$APP_DIR/bells.db"
+    rm -f "$APP_DIR/bells.db" "$APP_DIR/bells.db-wal" "$APP_DIR/bells.db-shm"
     echo "  ✓ Removed bells.db"
 fi
 
 # Clean up cron jobs (if any)
 echo "Cleaning up cron jobs..."
 crontab -l 2>/dev/null | grep -v "ChurchBell" | crontab - 2>/dev/null || true
+rm -f "$APP_DIR/cron_state.json"
 echo "  ✓ Removed cron jobs"
 
 echo ""
@@ -17,6 +17,8 @@ fi
 VENV_DIR="$APP_DIR/venv"
 SERVICE_NAME="churchbell.service"
 HOME_SERVICE_NAME="churchbell-home.service"
+SCHEDULER_SERVICE_NAME="churchbell-scheduler.service"
+AUDIO_SERVICE_NAME="churchbell-audio.service"
 SERVICE_USER="${CHURCHBELL_SERVICE_USER:-churchbells}"
 
 echo "=== ChurchBell Updater ==="
@@ -48,6 +50,8 @@ source "$VENV_DIR/bin/activate"
 echo "[3/6] Updating Python packages..."
 pip install --upgrade pip
 pip install flask
+# Optional: speeds up bell synthesis and sound conversion
+pip install numpy || echo "[WARN] numpy not installed - using the slower pure-Python code paths"
 
 # ------------------------------------------------------------
 # 4. Fix permissions (self‑healing)
@@ -83,7 +87,7 @@ chown -R "$SERVICE_USER":"$SERVICE_USER" "$APP_DIR"
 # 5. Sync cron with DB alarms
 # ------------------------------------------------------------
 echo "[5/6] Syncing cron with alarms..."
-python3 "$APP_DIR/sync_cron.py" || true
+python3 "$APP_DIR/sync_cron.py" --force || true
 
 echo "[INFO] Updating play_alarm.sh with correct project path..."
 python3 "$APP_DIR/update_play_alarm_path.py" || true
@@ -93,8 +97,10 @@ python3 "$APP_DIR/update_play_alarm_path.py" || true
 # ------------------------------------------------------------
 echo "[6/6] Restarting ChurchBell services..."
 sudo systemctl daemon-reload
+sudo systemctl restart "$AUDIO_SERVICE_NAME" 2>/dev/null || true
 sudo systemctl restart "$SERVICE_NAME"
 sudo systemctl restart "$HOME_SERVICE_NAME"
+sudo systemctl restart "$SCHEDULER_SERVICE_NAME" 2>/dev/null || true
 
 echo ""
 echo "=== Update complete ==="
@@ -0,0 +1,178 @@
+"""
+System volume control.
+The volume slider sends a request for every step of a drag. VolumeController
+keeps only the latest value, hands it to the mixer at most every
+APPLY_INTERVAL seconds through one long-lived `amixer -s` process (which
+reads commands from stdin) instead of a fork per change, and writes the
+settings row once the value has settled.
+"""
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import db
+
+APP_DIR = Path(__file__).resolve().parent
+DB_PATH = db.DB_PATH
+MIXER_CONTROL = os.getenv("CHURCHBELL_MIXER_CONTROL", "Master")
+APPLY_INTERVAL = 0.25  # seconds between mixer updates during a drag
+SETTLE = 1.0           # seconds without a change before the value is saved
+MAX_SAVE_BACKOFF = 60.0  # longest wait between retries of a failed save
+
+
+class AmixerChannel:
+    """A persistent `amixer -s` process; each line written to it is one command."""
+
+    def __init__(self, control=MIXER_CONTROL):
+        self.control = control
+        self._proc = None
+        self._missing = False
+
+    def _open(self):
+        self._proc = subprocess.Popen(
+            ["amixer", "-q", "-s"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+
+    def set(self, percent):
+        if self._missing:
+            return False
+        for _ in range(2):
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._open()
+                self._proc.stdin.write(f"sset {self.control} {percent}%\n")
+                self._proc.stdin.flush()
+                return True
+            except FileNotFoundError:
+                print("[WARN] amixer not found; volume changes are saved but not applied", flush=True)
+                self._missing = True
+                return False
+            except (BrokenPipeError, OSError):
+                self._proc = None  # amixer exited; start a new one and retry once
+        print("[ERROR] Could not send volume to amixer", flush=True)
+        return False
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self._proc.kill()
+            self._proc = None
+
+
+class VolumeController:
+    """Coalesces volume requests: the mixer sees at most one change per
+    `interval`, and the database one write per settled value."""
+
+    def __init__(self, mixer=None, db_path=DB_PATH, interval=APPLY_INTERVAL, settle=SETTLE):
+        self.mixer = mixer or AmixerChannel()
+        self.db_path = db_path
+        self.interval = interval
+        self.settle = settle
+        self._cond = threading.Condition()
+        self._thread = None
+        self._requested = None  # latest value not yet sent to the mixer
+        self._applied = None
+        self._saved = None
+        self._last_apply = 0.0
+        self._last_request = 0.0
+        self._retry_at = 0.0    # earliest time to retry a failed save
+        self._save_failures = 0
+        self._status = {"requests": 0, "applied": 0, "saved": 0, "save_errors": 0}
+
+    def set(self, percent):
+        """Request a volume (0-100); returns immediately."""
+        with self._cond:
+            self._requested = max(0, min(100, int(percent)))
+            self._last_request = time.monotonic()
+            self._status["requests"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="volume", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def current(self, default=None):
+        """The most recently requested volume, or `default` if none since startup."""
+        with self._cond:
+            for value in (self._requested, self._applied):
+                if value is not None:
+                    return value
+            return default
+
+    def _next_action(self):
+        """Wait until there is something to do; returns ("apply" | "save", value)."""
+        while True:
+            now = time.monotonic()
+            if self._requested is not None:
+                wait = self._last_apply + self.interval - now
+                if wait <= 0:
+                    value, self._requested = self._requested, None
+                    return "apply", value
+            elif self._applied is not None and self._applied != self._saved:
+                wait = max(self._last_request + self.settle, self._retry_at) - now
+                if wait <= 0:
+                    return "save", self._applied
+            else:
+                wait = None
+            self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                action, value = self._next_action()
+            if action == "apply":
+                self.mixer.set(value)
+                with self._cond:
+                    self._applied = value
+                    self._last_apply = time.monotonic()
+                    self._status["applied"] += 1
+            else:
+                self._save(value)
+
+    def _save(self, value):
+        try:
+            with db.connection(self.db_path) as conn:
+                conn.execute("UPDATE settings SET volume = ? WHERE id = 1", (value,))
+                conn.commit()
+        except Exception as e:
+            with self._cond:
+                # Back off (settle, 2 x settle, ... up to MAX_SAVE_BACKOFF) instead of retrying at once
+                self._save_failures += 1
+                delay = min(self.settle * 2 ** (self._save_failures - 1), MAX_SAVE_BACKOFF)
+                self._retry_at = time.monotonic() + delay
+                self._status["save_errors"] += 1
+            print(f"[ERROR] Saving volume failed (retrying in {delay:.1f}s): {e}", flush=True)
+            return
+        with self._cond:
+            self._saved = value
+            self._save_failures = 0
+            self._retry_at = 0.0
+            self._status["saved"] += 1
+
+    def flush(self):
+        """Apply and save any pending value now (used at shutdown)."""
+        with self._cond:
+            if self._requested is not None:
+                value, self._requested = self._requested, None
+            else:
+                value = self._applied
+        if value is None:
+            return
+        if value != self._applied:
+            self.mixer.set(value)
+            self._applied = value
+        if value != self._saved:
+            self._save(value)
+        self.mixer.close()
+
+    def status(self):
+        with self._cond:
+            return dict(self._status, volume=self._applied, saved_volume=self._saved)